@@ -1,10 +1,18 @@
 
 import datetime as dt
 import json
-from typing import List, Dict
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple, Union
 
+import numpy as np
 import requests
-from typeguard import typechecked
+from aws_lambda_powertools import Logger
+from requests.adapters import HTTPAdapter
+from screener import archive, blobstore, cache, failures, history, metrics, ratelimit, rules, symbols, timeseries, topk, yahoo
+from screener.startup import typechecked
+
+logger = Logger()
 
 URL = "https://query2.finance.yahoo.com/ws/fundamentals-timeseries/v1/finance/timeseries/{}"
 FIELDS = [
@@ -15,6 +23,76 @@ FIELDS = [
     "annualTotalRevenue",
     "annualNetIncome",
 ]
+HEADERS = {'user-agent': "Python Web Scraper"}
+TIMEOUT = 10
+MAX_WORKERS = 8
+PERIOD_START = 493590046
+RESPONSE_CACHE = cache.from_environment()
+TIMESERIES_STORE = timeseries.from_environment()
+# history store (a directory or s3:// URI) written a part per batch invocation, see screener.history
+HISTORY_PATH = os.environ.get("HISTORY_PATH")
+RESULTS_STORE = blobstore.from_environment()
+METRICS = metrics.from_environment("stock_data")
+SYMBOL_RESOLVER = symbols.from_environment()
+FAILURE_CACHE = failures.from_environment()
+RESPONSE_ARCHIVE = archive.from_environment()
+# batches fetched without RESPONSE_CACHE or TIMESERIES_STORE are parsed to typed arrays (see screener.yahoo)
+LEAN_PARSE = os.environ.get("LEAN_PARSE", "false").lower() in ("true", "1", "yes")
+# single field requested when probing whether yahoo knows a symbol
+PROBE_FIELDS = ["trailingMarketCap"]
+# shared by all requests to yahoo, so the rate learned persists across warm invocations
+RATE_LIMITER = ratelimit.from_environment(MAX_WORKERS)
+# Score expressed as declarative rules (see screener.rules), compiled once per container into SCORE_RULES
+GROWTH_PIECES = [
+    # steady growth
+    {"min": 0.1, "min_inclusive": False, "max": 0.5, "score": 5},
+    # no growth
+    {"max": 0, "max_inclusive": True, "score": 0},
+]
+SCORE_SPEC = [
+    {
+        "name": "market_cap", "field": "trailingMarketCap", "aggregate": "first",
+        "pieces": [
+            {"max": 500E6, "score": 100},
+            {"min": 50E9, "score": 0},
+            {"curve": "decay", "points": 100, "scale": 50E9, "inner": 1, "outer": 3},
+        ],
+    },
+    {
+        "name": "pe", "field": "trailingPeRatio", "aggregate": "last",
+        "pieces": [
+            {"max": 0, "max_inclusive": True, "score": 0},
+            {"min": 50, "min_inclusive": False, "score": 0},
+            {"curve": "decay", "points": 11, "scale": 50, "inner": 2, "outer": 1},
+        ],
+    },
+    {
+        "name": "pb", "field": "trailingPbRatio", "aggregate": "last",
+        "pieces": [
+            {"max": 0, "max_inclusive": True, "score": 0},
+            {"min": 10, "min_inclusive": False, "score": 0},
+            {"curve": "decay", "points": 11, "scale": 10, "inner": 2, "outer": 1},
+        ],
+    },
+    {
+        "name": "fcf_growth", "field": "annualFreeCashFlow", "aggregate": "change",
+        "pieces": [{"min": 0, "min_inclusive": False, "score": 5}],
+    },
+    {
+        "name": "fcf_positive", "field": "annualFreeCashFlow", "aggregate": "last",
+        "pieces": [{"min": 0, "min_inclusive": False, "score": 5}],
+    },
+    # slow or fast growth scores 3, and growth from zero or over a single year 0
+    {
+        "name": "profit_growth", "field": "annualNetIncome", "aggregate": "growth",
+        "missing": 0, "default": 3, "pieces": GROWTH_PIECES,
+    },
+    {
+        "name": "revenue_growth", "field": "annualTotalRevenue", "aggregate": "growth",
+        "missing": 0, "default": 3, "pieces": GROWTH_PIECES,
+    },
+]
+SCORE_RULES = rules.compile_spec(SCORE_SPEC, FIELDS)
 
 
 def calc_future_timestamp(days_from_now: int) -> int:
@@ -27,22 +105,199 @@ def calc_future_timestamp(days_from_now: int) -> int:
     return future_timestamp
 
 
+def create_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """returns session holding a keep-alive connection pool large enough for concurrent requests"""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+
+    return session
+
+
 @typechecked
-def get_yahoo_json_data(symbol: str, fields: List[str]):
-    """provided stock symbol & list of desired fields, returns full JSON response from yahoo"""
+def get_yahoo_json_data(symbol: str, fields: List[str], session: Optional[requests.Session] = None):
+    """
+    provided stock symbol & list of desired fields, returns full JSON response from yahoo.
+    Optionally reuses the connections of a provided session.
+    Fields still fresh in RESPONSE_CACHE (if configured) are not downloaded again, and
+    only points newer than those held in TIMESERIES_STORE (if configured) are downloaded.
+    """
+
+    def fetch(fields):
+        if TIMESERIES_STORE is None:
+            return download_yahoo_json_data(symbol, fields, session)
+
+        return TIMESERIES_STORE.update(
+            symbol, fields,
+            lambda since: download_yahoo_json_data(symbol, fields, session, since or PERIOD_START)
+        )
+
+    if RESPONSE_CACHE is None:
+        return fetch(fields)
+
+    return RESPONSE_CACHE.get_or_fetch(symbol, fields, PERIOD_START, fetch)
+
+
+def download_yahoo_json_data(
+    symbol: str,
+    fields: List[str],
+    session: Optional[requests.Session] = None,
+    period1: int = PERIOD_START,
+    parse: Optional[Callable[[bytes], Any]] = None,
+    archive: bool = True,
+):
+    """
+    downloads JSON response from yahoo for stock symbol & list of desired fields, from period1 onwards.
+    Requests are paced by RATE_LIMITER, which retries throttled & failed requests.
+    The raw response is archived in RESPONSE_ARCHIVE (if configured & archive), and parsed with parse if given,
+    rather than decoded.
+    """
 
     params = {
-        'period1': 493590046,
+        'period1': period1,
         'period2': calc_future_timestamp(150),
         'type': ",".join(fields),
     }
 
-    headers = {'user-agent': "Python Web Scraper"}
-
-    response = requests.get(URL.format(symbol), params=params, headers=headers)
+    with METRICS.timer("YahooFetch"):
+        response = RATE_LIMITER.request(
+            lambda: (session or requests).get(URL.format(symbol), params=params, headers=HEADERS, timeout=TIMEOUT)
+        )
     response.raise_for_status()
+    METRICS.add_bytes("YahooBytes", len(response.content))
+
+    if RESPONSE_ARCHIVE is not None and archive:
+        archive_response(symbol, response.content)
+
+    with METRICS.timer("JsonDecode"):
+        return response.json() if parse is None else parse(response.content)
+
+
+def archive_response(symbol: str, content: bytes) -> None:
+    """archives a raw response in RESPONSE_ARCHIVE, logging & counting failures rather than failing the fetch"""
+
+    try:
+        with METRICS.timer("Archive"):
+            METRICS.add_bytes("ArchiveBytes", RESPONSE_ARCHIVE.append(symbol, content))
+    except Exception:
+        logger.exception(f"Failed to archive response of {symbol}")
+        METRICS.add("ArchiveErrors")
+
+
+def fetch_batch(symbols: List[str], max_workers: int = MAX_WORKERS) -> List:
+    """
+    Concurrently downloads yahoo JSON data for a list of symbols over a single connection pool.
+    Returns list in the same order as symbols, containing either the JSON response or the exception raised,
+    with responses as yahoo.Timeseries where LEAN_PARSE applies.
+    """
+
+    def fetch(symbol):
+        try:
+            if LEAN_PARSE and RESPONSE_CACHE is None and TIMESERIES_STORE is None:
+                return download_yahoo_json_data(symbol, FIELDS, session, parse=yahoo.scan)
+            return get_yahoo_json_data(symbol, fields=FIELDS, session=session)
+        except Exception as e:
+            return e
+
+    with create_session(max_workers) as session, ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(fetch, symbols))
+
+
+def has_points(json_response: Union[Dict, yahoo.Timeseries]) -> bool:
+    """whether a yahoo json response (or its Timeseries) holds any points"""
+
+    if isinstance(json_response, yahoo.Timeseries):
+        return len(json_response) > 0
+
+    return any(
+        any(point is not None for point in result.get(result['meta']['type'][0]) or [])
+        for result in json_response['timeseries']['result']
+    )
+
+
+def is_unknown_symbol(response) -> bool:
+    """whether a response (or exception) of fetch_batch shows yahoo doesn't know the symbol: a 404 or no points"""
+
+    if isinstance(response, requests.HTTPError):
+        return response.response is not None and response.response.status_code == 404
+
+    return isinstance(response, (dict, yahoo.Timeseries)) and not has_points(response)
+
+
+def symbol_exists(symbol: str, session: Optional[requests.Session] = None) -> bool:
+    """whether yahoo holds data for symbol, requesting only PROBE_FIELDS (without archiving the response)"""
+
+    try:
+        response = download_yahoo_json_data(symbol, PROBE_FIELDS, session, archive=False)
+    except requests.HTTPError as e:
+        if is_unknown_symbol(e):
+            return False
+        raise
+
+    return has_points(response)
+
+
+def failure_class(response) -> Optional[str]:
+    """
+    class of failure (see screener.failures) of a response or exception raised fetching or scoring a stock,
+    or None if it may succeed when tried again
+    """
+
+    if isinstance(response, requests.HTTPError):
+        return failures.NOT_FOUND if is_unknown_symbol(response) else None
+
+    if isinstance(response, (dict, yahoo.Timeseries)):
+        return failures.EMPTY if not has_points(response) else None
+
+    if isinstance(response, (KeyError, IndexError, TypeError)):
+        return failures.MISSING_FIELDS
+
+    return None
+
+
+def fetch_stocks(items: List[Dict], max_workers: int = MAX_WORKERS) -> Tuple[List[str], List]:
+    """
+    Concurrently downloads yahoo JSON data for {yahoo_symbol, isin} items, returning the symbol fetched
+    for each alongside its response (or exception), as fetch_batch. With SYMBOL_RESOLVER configured,
+    the symbol confirmed for each ISIN is fetched in place of that guessed by stock_list, and
+    symbols unknown to yahoo are resolved by probing their variants (see screener.symbols),
+    with those confirmed by other invocations loaded first where shared.
+    """
+
+    if SYMBOL_RESOLVER is None:
+        tickers = [item["yahoo_symbol"] for item in items]
+        return tickers, fetch_batch(tickers, max_workers)
+
+    with METRICS.timer("StateSync"):
+        SYMBOL_RESOLVER.sync()
+
+    tickers = [SYMBOL_RESOLVER.symbol(item["isin"], item["yahoo_symbol"]) for item in items]
+    responses = fetch_batch(tickers, max_workers)
+
+    unknown = [i for i, response in enumerate(responses) if is_unknown_symbol(response)]
+    if not unknown:
+        return tickers, responses
+
+    with METRICS.timer("SymbolResolve"), create_session(max_workers) as session:
+        resolved = SYMBOL_RESOLVER.resolve(
+            [(items[i]["isin"], items[i]["yahoo_symbol"], tickers[i]) for i in unknown],
+            lambda symbol: symbol_exists(symbol, session)
+        )
+
+    refetch = []
+    for i, symbol in zip(unknown, resolved):
+        if symbol is not None:
+            tickers[i] = symbol
+            refetch.append(i)
+
+    for i, response in zip(refetch, fetch_batch([tickers[i] for i in refetch], max_workers)):
+        responses[i] = response
 
-    return response.json()
+    METRICS.add("SymbolsResolved", len(refetch))
+    METRICS.add("SymbolsUnresolved", len(unknown) - len(refetch))
+
+    return tickers, responses
 
 
 class Score:
@@ -178,8 +433,185 @@ class Score:
             cls.score_revenue_profit_growth("profit") +
             cls.score_revenue_profit_growth("revenue")
         )
+
+class BatchScore:
+    """
+    Vectorised counterpart to Score, calculating scores for many stocks in a single pass
+    with the rules of a spec (SCORE_SPEC by default, which reproduces Score).
+    Only the first & last values, sum and number of points of each field are used to score,
+    so each field is held as columnar arrays rather than a list per stock.
+    """
+
+    def __init__(self, data: List[Dict], spec: Optional[List[Dict]] = None):
+        self.size = len(data)
+        self.rules = SCORE_RULES if spec is None else rules.compile_spec(spec, FIELDS)
+        self.columns = self.to_columns(data)
+        self.first, self.last, self.count = self.columns["first"], self.columns["last"], self.columns["count"]
+        self.scores = self.rules.scores(self.columns)
+
+        # stocks missing any field would raise in Score, so are flagged & scored as zero
+        self.valid = np.logical_and.reduce([self.count[field] > 0 for field in FIELDS])
+
+
+    @classmethod
+    def from_json_responses(cls, json_responses: List[Dict], spec: Optional[List[Dict]] = None):
+        """create batch from a list of raw yahoo json responses"""
+        return cls([Score.transform_input(json_response) for json_response in json_responses], spec)
+
+
+    @staticmethod
+    def to_columns(data: List[Dict]):
+        """transform list of simplified lookup dicts to arrays of first values, last values, counts & sums"""
+        return rules.to_columns(data, FIELDS)
+
+
+    def score_market_cap(self) -> np.ndarray:
+        """Calculate scores based on market cap amount"""
+        return self.scores["market_cap"]
+
+
+    def score_pe(self) -> np.ndarray:
+        """Calculate scores based on recent P/E ratio"""
+        return self.scores["pe"]
+
+
+    def score_pb(self) -> np.ndarray:
+        """Calculate scores based on recent P/B ratio"""
+        return self.scores["pb"]
+
+
+    def score_freecashflow(self) -> np.ndarray:
+        """Calculate scores based on recent free cash flow"""
+        return self.scores["fcf_growth"] + self.scores["fcf_positive"]
+
+
+    def score_revenue_profit_growth(self, measure: str) -> np.ndarray:
+        """
+        Calculate scores based on recent revenue & profit growth.
+        measure is either 'revenue' or 'profit'.
+        """
+        return self.scores["profit_growth" if measure == "profit" else "revenue_growth"]
+
+
+    def get_total_score(self) -> np.ndarray:
+        """Calculate total scores for every stock in the batch, zero where stock is not valid"""
+        total = self.rules.total(self.columns, self.scores)
+        return np.where(self.valid, total, 0)
+
+
+def batch_handler(items: List[Dict], max_workers: int = MAX_WORKERS) -> Dict:
+    """
+    Downloads & scores a list of stocks provided as {yahoo_symbol, isin} items,
+    returning the scored records alongside an error for each stock which failed,
+    and the current rate limit & throttle counts of RATE_LIMITER.
+    Persistent failures are recorded in FAILURE_CACHE (if configured), against the symbol of the item,
+    and the scored records appended to HISTORY_PATH (if configured) as a single part.
+    """
+
+    tickers, responses = fetch_stocks(items, max_workers)
+
+    scored, errors, failed = [], [], []
+    for item, ticker, response in zip(items, tickers, responses):
+
+        if isinstance(response, Exception):
+            errors.append({"Ticker": ticker, "ISIN": item["isin"], "Error": repr(response)})
+            failed.append((item, failure_class(response)))
+            continue
+
+        try:
+            with METRICS.timer("TransformInput"):
+                data = response.data() if isinstance(response, yahoo.Timeseries) else Score.transform_input(response)
+        except (KeyError, TypeError) as e:
+            errors.append({"Ticker": ticker, "ISIN": item["isin"], "Error": repr(e)})
+            failed.append((item, failure_class(response) or failure_class(e)))
+            continue
+
+        scored.append((item, ticker, data))
+
+    with METRICS.timer("Scoring"):
+        batch = BatchScore([data for _, _, data in scored])
+        total_scores = batch.get_total_score().tolist()
+
+    results, series, succeeded = [], [], []
+    for i, (item, ticker, data) in enumerate(scored):
+
+        if not batch.valid[i]:
+            errors.append({"Ticker": ticker, "ISIN": item["isin"], "Error": "Missing fields"})
+            failed.append((item, failures.MISSING_FIELDS if any(len(values) for values in data.values()) else failures.EMPTY))
+            continue
+
+        results.append({
+            "Ticker": ticker,
+            "ISIN": item["isin"],
+            # as reported, rather than from the float64 column scored
+            "Market cap": data["trailingMarketCap"][0],
+            "Total score": total_scores[i],
+            "timestamp": dt.datetime.now().isoformat()
+        })
+        series.append(data)
+        succeeded.append(item)
+
+    if HISTORY_PATH and results:
+        with METRICS.timer("HistoryWrite"):
+            history.write_run(HISTORY_PATH, results, series)
+
+    if FAILURE_CACHE is not None:
+        FAILURE_CACHE.record(
+            [(item["isin"], item["yahoo_symbol"], failure) for item, failure in failed if failure is not None],
+            [(item["isin"], item["yahoo_symbol"]) for item in succeeded]
+        )
+
+    METRICS.add("StocksScored", len(results))
+    METRICS.add("StocksFailed", len(errors))
+
+    return {"results": results, "errors": errors, "rate_limit": RATE_LIMITER.metrics()}
      
 
+def shard_stocks(event) -> List[Dict]:
+    """stocks of a batch event: a list of stocks, or a shard holding them inline or by manifest"""
+
+    if isinstance(event, list):
+        return event
+
+    if "manifest" in event:
+        return list(blobstore.read_records(event["manifest"]))
+
+    return event["stocks"]
+
+
+def score_stock(item: Dict) -> Dict:
+    """
+    Downloads & scores a single {yahoo_symbol, isin} item, raising if it fails.
+    Not written to HISTORY_PATH, which would hold a part per stock; batches are.
+    """
+
+    yahoo_symbol = item["yahoo_symbol"]
+
+    if SYMBOL_RESOLVER is None:
+        json_response = get_yahoo_json_data(yahoo_symbol, fields=FIELDS)
+    else:
+        [yahoo_symbol], [json_response] = fetch_stocks([item], max_workers=1)
+        if isinstance(json_response, Exception):
+            raise json_response
+
+    with METRICS.timer("TransformInput"):
+        score_card = Score(json_response)
+
+    with METRICS.timer("Scoring"):
+        total_score = score_card.get_total_score()
+
+    result = {
+        "Ticker": yahoo_symbol,
+        "ISIN": item["isin"],
+        "Market cap": score_card.data["trailingMarketCap"][0],
+        "Total score": total_score,
+        "timestamp": dt.datetime.now().isoformat()
+    }
+
+    return result
+
+
+@METRICS.instrument
 def lambda_handler(event, context):
     """Lambda function which downloads Yahoo JSON data for a provided stock, and 
     calculated a simple score to prioritise. 
@@ -193,8 +625,10 @@ def lambda_handler(event, context):
   
     Parameters
     ----------
-    event: dict, required
-        Input event to the Lambda function, providing stock data
+    event: dict | list, required
+        Input event to the Lambda function, providing stock data.
+        A list of stocks, or a shard from stock_list ({shard, cost, count, stocks}
+        or {shard, cost, count, manifest}), is fetched concurrently in batch mode.
 
     context: object, required
         Lambda Context runtime methods and attributes
@@ -202,21 +636,36 @@ def lambda_handler(event, context):
     Returns
     ------
         dict: stock symbol, score & timestamp provided in form stock:dict[attribute:value]
+        or in batch mode, an aggregate of the top scoring records (see screener.topk.TopK)
+        with rate limit metrics: {"k", "top", "successes", "failures", "histogram", "reasons", "rate_limit"},
+        plus manifests of all results & errors if RESULTS_URI is set
     """
-    
-    yahoo_symbol = event["yahoo_symbol"]
 
-    json_response = get_yahoo_json_data(yahoo_symbol, fields=FIELDS)
+    if isinstance(event, list) or "stocks" in event or "manifest" in event:
+        batch = batch_handler(shard_stocks(event))
+        aggregate = topk.TopK().update(batch["results"], batch["errors"])
+        output = {**aggregate.to_dict(), "rate_limit": batch["rate_limit"]}
 
-    score_card = Score(json_response)
+        if RESULTS_STORE is not None:
+            prefix = blobstore.new_prefix("stock_data")
+            with METRICS.timer("ResultsWrite"):
+                output["results"] = blobstore.write_records(RESULTS_STORE, f"{prefix}/results", batch["results"])
+                output["errors"] = blobstore.write_records(RESULTS_STORE, f"{prefix}/errors", batch["errors"])
 
-    return {
-        "Ticker": yahoo_symbol,
-        "ISIN": event["isin"],
-        "Market cap": score_card.data["trailingMarketCap"][0],
-        "Total score": score_card.get_total_score(),
-        "timestamp": dt.datetime.now().isoformat()
-    }
+        return output
+    
+    try:
+        result = score_stock(event)
+    except Exception as e:
+        failure = failure_class(e)
+        if FAILURE_CACHE is not None and failure is not None:
+            FAILURE_CACHE.record([(event["isin"], event["yahoo_symbol"], failure)])
+        raise
+
+    if FAILURE_CACHE is not None:
+        FAILURE_CACHE.record([], [(event["isin"], event["yahoo_symbol"])])
+
+    return result
 
 
 if __name__ == "__main__":
@@ -1,10 +1,66 @@
 import os
-from typing import Dict, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
-import boto3
+from screener import metrics, topk
+from screener.startup import lazy_import
+
+boto3 = lazy_import("boto3")
 
 
 CONTACT_LIST = "email-list"
+SUBJECT = "Stock list"
+MAX_WORKERS = 4
+RECIPIENTS_TTL = 3600
+METRICS = metrics.from_environment("stock_email")
+
+# reused across warm invocations
+_client = None
+_recipients: Optional[List[str]] = None
+_recipients_fetched_at = 0.0
+
+
+def aggregate_results(data: List[Dict]) -> topk.TopK:
+    """
+    Aggregates the output of each Map item into the top scoring records & summary counts.
+    Items are either a single scored record, an aggregate of a batch (from screener.topk),
+    or a failed item with its error, as added by the Catch: the input of a failed stock,
+    or the id & count of stocks of a failed shard.
+    """
+
+    aggregate = topk.TopK()
+
+    for item in data:
+
+        if "error" in item:
+            aggregate.add_error(item, item.get("count", 1))
+
+        elif "top" in item:
+            aggregate.merge(topk.TopK.from_dict(item))
+
+        else:
+            aggregate.add(item)
+
+    return aggregate
+
+
+def create_summary(aggregate: topk.TopK) -> str:
+    """summary counts & score histogram of an aggregate, for the email body"""
+
+    lines = [f"{aggregate.successes} stocks scored"]
+    if aggregate.failures:
+        lines.append(f"{aggregate.failures} stocks could not be scored")
+        for reason, count in aggregate.reasons.most_common():
+            lines.append(f"  {reason}: {count}")
+
+    lines.append("\nScore distribution:")
+    for low, count in sorted(aggregate.histogram.items()):
+        lines.append(f"{low}-{low + aggregate.bin_width - 1}: {count}")
+
+    lines.append(f"\nTop {len(aggregate.heap)} stocks by {aggregate.key}:\n")
+
+    return "\n".join(lines)
 
 
 def create_email_body(data: List[Dict]) -> str:
@@ -27,18 +83,34 @@ def create_email_body(data: List[Dict]) -> str:
     return '\n'.join(list_of_strings)
 
 
-def lambda_handler(event, context):
-    """
-    Sends an email to a recipient (stored privately in env),
-    returning data contained within event argument
-    """
+def get_client():
+    """SES client, created once & reused across warm invocations"""
+
+    global _client
 
-    # Create an SES resource
-    ses = boto3.client('ses')
+    if _client is None:
+        _client = boto3.client('ses')
 
-    # loop through recipients from email-list
-    for recipient in ses.list_verified_email_addresses().get('VerifiedEmailAddresses'):
+    return _client
 
+
+def get_recipients(ses) -> List[str]:
+    """verified email addresses, cached across warm invocations for RECIPIENTS_TTL seconds"""
+
+    global _recipients, _recipients_fetched_at
+
+    if _recipients is None or time.monotonic() - _recipients_fetched_at > RECIPIENTS_TTL:
+        _recipients = ses.list_verified_email_addresses().get('VerifiedEmailAddresses')
+        _recipients_fetched_at = time.monotonic()
+
+    return _recipients
+
+
+def send_email(ses, recipient: str, body: str) -> Dict:
+    """sends body to recipient, from itself, returning the send latency"""
+
+    start = time.perf_counter()
+    with METRICS.timer("SesSend"):
         response = ses.send_email(
             Source=recipient,
             Destination={
@@ -48,18 +120,57 @@ def lambda_handler(event, context):
             },
             Message={
                 'Subject': {
-                    'Data': 'Stock list',
+                    'Data': SUBJECT,
                 },
                 'Body': {
                     'Text': {
-                        'Data': create_email_body(event)
+                        'Data': body
                     },
                 },
             },
         )
 
-    
-    
+    METRICS.add("EmailsSent")
+    METRICS.add_bytes("EmailBytes", len(body.encode()))
+
+    return {
+        "recipient": recipient,
+        "seconds": time.perf_counter() - start,
+        "MessageId": response.get('MessageId'),
+    }
+
+
+def send_emails(ses, recipients: List[str], body: str, max_workers: int = MAX_WORKERS) -> List[Dict]:
+    """
+    Sends body to every recipient in an email of its own (so no recipient sees, or replies to, any other),
+    sent concurrently. Returns the latency of each send.
+    """
+
+    recipients = list(dict.fromkeys(recipients))
+    if not recipients:
+        return []
+
+    with ThreadPoolExecutor(min(max_workers, len(recipients))) as executor:
+        return list(executor.map(lambda recipient: send_email(ses, recipient, body), recipients))
+
+
+@METRICS.instrument
+def lambda_handler(event, context):
+    """
+    Sends an email of the top scoring stocks to every verified recipient in SES,
+    returning the number of recipients & the latency of each send
+    """
+
+    with METRICS.timer("Aggregate"):
+        aggregate = aggregate_results(event)
 
+    # rendered once, for every recipient
+    with METRICS.timer("RenderBody"):
+        body = create_summary(aggregate) + create_email_body(aggregate.top())
 
+    ses = get_client()
+    with METRICS.timer("ListRecipients"):
+        recipients = get_recipients(ses)
+    sends = send_emails(ses, recipients, body)
 
+    return {"recipients": len(recipients), "sends": sends}
@@ -1,17 +1,42 @@
+from __future__ import annotations
+
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import math
 import os
 import random
-from typing import Dict, List, Optional, Union
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-import boto3
-import pandas as pd
 import pydantic
+import requests
 from aws_lambda_powertools import Logger
 from pydantic import BaseModel, Field
+from screener import blobstore, failures, metrics, ratelimit, shared, symbols
+from screener.startup import lazy_import
+
+# only loaded when used, keeping them out of the cold start of the streaming path
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 logger = Logger()
 
 SHEET_ID = "14Ep-CmoqWxrMU8HshxthRcdRW8IsXvh3n2-ZHVCzqzQ"
 GID = "1855920257"
+ENDPOINT = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={GID}"
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR")
+VALIDATION_MEMO_PATH = os.environ.get("VALIDATION_MEMO_PATH")
+RESULTS_STORE = blobstore.from_environment()
+METRICS = metrics.from_environment("stock_list")
+FAILURE_CACHE = failures.from_environment()
+# only compacted here, as stock_list starts every run (symbols are resolved by stock_data)
+SYMBOL_RESOLVER = symbols.from_environment()
+TIMEOUT = 30
 ISA_ELIGIBLE = True
 REMOVE_ETF = True
 MIC_REFERENCE = {
@@ -24,6 +49,28 @@ MIC_REFERENCE = {
     "XWBO": ".VI",
     "XSTO": ".ST",
 }
+SUFFIX_MIC = {suffix: mic for mic, suffix in MIC_REFERENCE.items()}
+STRING_COLUMNS = ["Title", "Long_Title", "Subtitle", "Currency", "ISIN", "MIC", "Symbol"]
+BOOL_COLUMNS = ["ISA_eligible", "Fractional_Enabled"]
+GENERIC_REASON = "Generic validation error"
+# expected seconds to fetch & score a stock, by exchange (US listings have no yahoo suffix).
+# Listings outside the US are more often missing fields, so incur more retries
+FETCH_COST = {"US": 0.5}
+DEFAULT_FETCH_COST = 0.75
+# seconds a stock_data invocation may run (its Timeout in template.yaml), and the fraction of them
+# a shard is planned to take at the expected fetch costs. The rest is left for 429 backoff
+# (Retry-After, and up to 30s per retry), the limiter halving its rate after throttles, and retries
+STOCK_DATA_TIMEOUT = float(os.environ.get("STOCK_DATA_TIMEOUT", 300))
+SHARD_SAFETY_FACTOR = 0.25
+# seconds of fetching stock_data runs at once: 8 workers, within a limiter starting at ratelimit.RATE
+# requests/second, so no more than RATE * FETCH_COST["US"] at first
+FETCH_PARALLELISM = min(8, ratelimit.RATE * FETCH_COST["US"])
+# expected seconds of fetching within a shard: 300s * 0.25 * 2.5 = 187.5, or 375 US stocks in ~75s
+SHARD_COST = STOCK_DATA_TIMEOUT * SHARD_SAFETY_FACTOR * FETCH_PARALLELISM
+# bump when validation changes in a way not captured by memo_version, to discard memoised outcomes
+MEMO_VERSION = 1
+# days after which a memoised outcome is validated again, even if the row is unchanged
+MEMO_MAX_AGE = 90
 
 
 class ISINFormatError(Exception):
@@ -163,9 +210,678 @@ class FreetradeModel(BaseModel):
 def get_stock_list() -> List[Dict]:
     """Downloads stock list from Freetrade Google Sheet, and returns as dict"""
 
-    endpoint = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={GID}"
+    return get_stock_frame().to_dict(orient='records')
+
+
+def get_stock_frame() -> pd.DataFrame:
+    """
+    Downloads stock list from Freetrade Google Sheet, and returns as DataFrame.
+    If SNAPSHOT_DIR is set, the sheet is only downloaded & parsed when it has changed.
+    """
+
+    if SNAPSHOT_DIR:
+        return SheetSnapshot(SNAPSHOT_DIR).download(ENDPOINT)[0]
+
+    # pandas downloads & parses the sheet together
+    with METRICS.timer("SheetDownload"):
+        return pd.read_csv(ENDPOINT)
+
+
+class SheetSnapshot:
+    """
+    Local snapshot of the Freetrade sheet, holding the current & previous parsed sheet
+    alongside the ETag, Last-Modified & content hash used to detect changes.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.current_path = os.path.join(directory, "current.pkl")
+        self.previous_path = os.path.join(directory, "previous.pkl")
+
+
+    def load_meta(self) -> Dict:
+        """returns validators of the current snapshot, empty if there is no snapshot"""
+
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.current_path):
+            return {}
+
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+
+    def download(self, url: str) -> Tuple[pd.DataFrame, bool]:
+        """
+        Conditionally downloads sheet from url, returning DataFrame & whether it changed.
+        Unchanged sheets are loaded from the snapshot, without being parsed again.
+        """
+
+        meta = self.load_meta()
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        with METRICS.timer("SheetDownload"):
+            response = requests.get(url, headers=headers, timeout=TIMEOUT)
+
+        if response.status_code == 304:
+            return pd.read_pickle(self.current_path), False
+
+        response.raise_for_status()
+        METRICS.add_bytes("SheetBytes", len(response.content))
+
+        # fallback for servers without conditional request support
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        if sha256 == meta.get("sha256"):
+            return pd.read_pickle(self.current_path), False
+
+        with METRICS.timer("CsvParse"):
+            df = pd.read_csv(io.BytesIO(response.content))
+
+        if os.path.exists(self.current_path):
+            os.replace(self.current_path, self.previous_path)
+        df.to_pickle(self.current_path)
+
+        with open(self.meta_path, "w") as f:
+            json.dump({
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": sha256,
+            }, f)
+
+        return df, True
+
+
+    def diff(self, key: str = "ISIN") -> Dict[str, pd.DataFrame]:
+        """instruments added, removed or changed between the previous & current snapshot"""
+
+        current = pd.read_pickle(self.current_path)
+
+        if not os.path.exists(self.previous_path):
+            return diff_stock_frames(current.iloc[:0], current, key)
+
+        return diff_stock_frames(pd.read_pickle(self.previous_path), current, key)
+
+
+def diff_stock_frames(old: pd.DataFrame, new: pd.DataFrame, key: str = "ISIN") -> Dict[str, pd.DataFrame]:
+    """
+    Compares two versions of the stock list by key, returning DataFrames of rows:
+    - added: in new only
+    - removed: in old only
+    - changed: in both, with any other value changed (new values returned)
+    """
+
+    old = old.drop_duplicates(key).set_index(key)
+    new = new.drop_duplicates(key).set_index(key)
+
+    added = new.index.difference(old.index)
+    removed = old.index.difference(new.index)
+    common = new.index.intersection(old.index)
+
+    columns = new.columns.intersection(old.columns)
+    old_common = old.loc[common, columns].astype(object)
+    new_common = new.loc[common, columns].astype(object)
+    differs = (old_common != new_common) & ~(old_common.isna() & new_common.isna())
+    changed = common[differs.any(axis=1).to_numpy()]
+
+    return {
+        "added": new.loc[added].reset_index(),
+        "removed": old.loc[removed].reset_index(),
+        "changed": new.loc[changed].reset_index(),
+    }
+
+
+def memo_version() -> str:
+    """version of the validation rules, changing whenever the outcome of validating a row could change"""
+
+    rules = [MEMO_VERSION, ISA_ELIGIBLE, REMOVE_ETF, MIC_REFERENCE, pydantic.VERSION]
+    return hashlib.sha256(json.dumps(rules, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ValidationMemo:
+    """
+    Persistent memo of the outcome of validating each row of the sheet, keyed by a hash of the row,
+    so only new or changed rows are validated again. Outcomes are (yahoo_symbol, isin, reason),
+    with reason None for valid stocks. Held in a local SQLite database, loaded into memory on first use,
+    and discarded whenever memo_version changes. Outcomes older than max_age days are validated again.
+    With shared state (see screener.shared), the database is restored from its snapshot when first loaded
+    & the snapshot replaced on every save, as a Lambda's local files don't outlive its container.
+    """
+
+    def __init__(self, path: str, max_age: float = MEMO_MAX_AGE, state: Optional[shared.SharedState] = None):
+        self.path = path
+        self.max_age = max_age
+        self.state = state
+        self.outcomes: Optional[Dict[str, Tuple]] = None
+        self.pending: Dict[str, Tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (version TEXT)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS outcomes ("
+                "key TEXT PRIMARY KEY, yahoo_symbol TEXT, isin TEXT, reason TEXT, validated_at REAL)"
+            )
+        return connection
+
+
+    def load(self) -> Dict[str, Tuple]:
+        """outcomes by key, loaded once (discarding all if the version has changed)"""
+
+        if self.outcomes is not None:
+            return self.outcomes
+
+        version = memo_version()
+        with contextlib.closing(self.connect()) as connection, connection:
+            if self.state is not None:
+                self.restore(connection, self.state.load()[0])
+
+            stored = connection.execute("SELECT version FROM meta").fetchone()
+
+            if stored is None or stored[0] != version:
+                connection.execute("DELETE FROM outcomes")
+                connection.execute("DELETE FROM meta")
+                connection.execute("INSERT INTO meta VALUES (?)", (version,))
+
+            rows = connection.execute(
+                "SELECT key, yahoo_symbol, isin, reason FROM outcomes WHERE validated_at >= ?",
+                (time.time() - self.max_age * 86400,)
+            ).fetchall()
+
+        self.outcomes = {key: tuple(outcome) for key, *outcome in rows}
+
+        return self.outcomes
+
+
+    def get(self, key: str) -> Optional[Tuple]:
+        outcome = self.load().get(key)
+
+        if outcome is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return outcome
+
+
+    def put(self, key: str, outcome: Tuple) -> None:
+        self.load()[key] = outcome
+        self.pending[key] = outcome
+
+
+    def save(self) -> None:
+        """writes outcomes added since the last save, removing those expired"""
+
+        self.load()
+        now = time.time()
+        with contextlib.closing(self.connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?)",
+                [(key, *outcome, now) for key, outcome in self.pending.items()]
+            )
+            connection.execute("DELETE FROM outcomes WHERE validated_at < ?", (now - self.max_age * 86400,))
+
+            if self.state is not None:
+                self.state.compact(self.rows(connection), [])
+
+        self.pending = {}
+
+
+    @staticmethod
+    def restore(connection: sqlite3.Connection, rows: List[Dict]) -> None:
+        """replaces the outcomes in the database with rows of a snapshot, each holding the version of its outcome"""
+
+        connection.execute("DELETE FROM outcomes")
+        connection.execute("DELETE FROM meta")
+        connection.executemany(
+            "INSERT INTO outcomes VALUES (:key, :yahoo_symbol, :isin, :reason, :validated_at)", rows
+        )
+        if rows:
+            connection.execute("INSERT INTO meta VALUES (?)", (rows[0]["version"],))
+
+
+    @staticmethod
+    def rows(connection: sqlite3.Connection) -> List[Dict]:
+        """outcomes in the database as rows of a snapshot"""
+
+        version = connection.execute("SELECT version FROM meta").fetchone()
+        rows = connection.execute("SELECT key, yahoo_symbol, isin, reason, validated_at FROM outcomes").fetchall()
+
+        return [
+            {"key": key, "yahoo_symbol": yahoo_symbol, "isin": isin, "reason": reason,
+             "validated_at": validated_at, "version": version[0]}
+            for key, yahoo_symbol, isin, reason, validated_at in rows
+        ]
+
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def memo_from_environment() -> Optional[ValidationMemo]:
+    """
+    memo at VALIDATION_MEMO_PATH, or shared through STATE_URI if set (in a temporary file
+    unless VALIDATION_MEMO_PATH is also set), otherwise None
+    """
+
+    state = shared.from_environment("validation_memo")
+
+    if not VALIDATION_MEMO_PATH and state is None:
+        return None
+
+    return ValidationMemo(VALIDATION_MEMO_PATH or shared.local_path("validation_memo"), state=state)
+
+
+# reused across warm invocations, so the memo is only loaded once per container
+VALIDATION_MEMO = memo_from_environment()
+
+
+def record_key(record: Dict) -> str:
+    """hash of the fields of a record validated by FreetradeModel, including their types"""
+
+    values = [[type(record.get(column)).__name__, record.get(column)] for column in STRING_COLUMNS + BOOL_COLUMNS]
+    return hashlib.sha256(json.dumps(values, default=str).encode()).hexdigest()
+
+
+def validate_record(record: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validates a single record with FreetradeModel, returning the
+    {yahoo_symbol, isin} of a valid stock, or the reason for exclusion
+    """
+
+    try:
+        model = FreetradeModel(**record)
+
+    except (ISINFormatError, ISAEligibilityError, ETFFilterError) as e:
+        return None, e.message
+
+    except Exception:
+        return None, GENERIC_REASON
+
+    return {"yahoo_symbol": model.yahoo_symbol, "isin": model.isin}, None
+
+
+def exclusion_reason(record: Dict) -> Optional[str]:
+    """Validates a single record with FreetradeModel, returning reason for exclusion or None if valid"""
+
+    return validate_record(record)[1]
+
+
+def _is_instance(column: pd.Series, kind: type) -> np.ndarray:
+    """boolean mask of values in column which are instances of kind"""
+
+    if kind is bool and pd.api.types.is_bool_dtype(column):
+        return np.ones(len(column), dtype=bool)
+
+    if kind is str and pd.api.types.is_string_dtype(column) and column.dtype != object:
+        return column.notna().to_numpy()
+
+    return column.map(lambda v: isinstance(v, kind)).to_numpy(dtype=bool)
+
+
+def _isin_checks(isin: pd.Series):
+    """
+    Vectorised equivalent of FreetradeModel.isin_valid for ASCII values.
+    Returns boolean arrays of: ends in a check digit, convertible to digits & passes checksum.
+    """
+
+    if isin.empty:
+        return (np.zeros(0, dtype=bool),) * 3
+
+    codes = np.array(isin.tolist(), dtype=bytes)
+    codes = codes.view(np.uint8).reshape(len(codes), -1).astype(np.int16)
+    length = isin.str.len().to_numpy(dtype=np.int64)
+
+    check_code = codes[np.arange(len(codes)), np.maximum(length - 1, 0)]
+    has_check_digit = (length > 0) & (check_code >= 48) & (check_code <= 57)
+
+    # characters before check digit: digits kept, others converted to (ord - 55), two digits from "A"
+    body = np.arange(codes.shape[1]) < (length - 1)[:, None]
+    convertible = ~(body & (codes < 48)).any(axis=1)
+    value = np.where(codes <= 57, codes - 48, codes - 55)
+    width = np.where(body, np.where(value >= 10, 2, 1), 0)
 
-    return pd.read_csv(endpoint).to_dict(orient='records')
+    # doubling applies to every other digit counting from the right of the converted string
+    offset = np.cumsum(width[:, ::-1], axis=1)[:, ::-1] - width
+
+    def contribution(digit, position):
+        doubled = 2 * digit
+        return np.where(position % 2 == 0, doubled - 9 * (doubled >= 10), digit)
+
+    checksum = np.where(body, contribution(value % 10, offset), 0).sum(axis=1)
+    checksum += np.where(width == 2, contribution(value // 10, offset + 1), 0).sum(axis=1)
+
+    checksum_valid = (checksum + check_code - 48) % 10 == 0
+
+    return has_check_digit, convertible, checksum_valid
+
+
+def validate_stock_frame(df: pd.DataFrame, memo: Optional[ValidationMemo] = None) -> pd.DataFrame:
+    """
+    Vectorised equivalent of validating each row with FreetradeModel.
+    Returns DataFrame (same index as df) of yahoo_symbol & isin, plus the reason
+    for exclusion (None where valid), matching the errors FreetradeModel would raise.
+    Rows with unexpected types or non-ASCII text (such as a Symbol read as NaN) are validated
+    individually with FreetradeModel, taking their yahoo_symbol & isin from it,
+    unless an identical row has its outcome in memo (if given).
+    """
+
+    result = pd.DataFrame(index=df.index, columns=["yahoo_symbol", "isin", "reason"], dtype=object)
+
+    def validate_rows(rows):
+        records = df.loc[rows].to_dict(orient="records")
+        if memo is None:
+            outcomes = [validate_record(record) for record in records]
+        else:
+            outcomes = [validate_record_cached(record, memo) for record in records]
+
+        stocks = [stock or {} for stock, _ in outcomes]
+        result.loc[rows, "yahoo_symbol"] = [stock.get("yahoo_symbol") for stock in stocks]
+        result.loc[rows, "isin"] = [stock.get("isin") for stock in stocks]
+        result.loc[rows, "reason"] = [reason for _, reason in outcomes]
+
+    required = STRING_COLUMNS + BOOL_COLUMNS
+    if any(column not in df.columns for column in required):
+        validate_rows(np.ones(len(df), dtype=bool))
+        return result.where(result.notna(), None)
+
+    clean = np.logical_and.reduce(
+        [_is_instance(df[column], str) for column in STRING_COLUMNS] +
+        [_is_instance(df[column], bool) for column in BOOL_COLUMNS]
+    )
+    clean[clean] = (
+        df.loc[clean, "ISIN"].str.isascii() & df.loc[clean, "Symbol"].str.isascii()
+    ).to_numpy(dtype=bool)
+
+    frame = df.loc[clean]
+    reason = pd.Series(None, index=frame.index, dtype=object)
+
+    # reasons are assigned in reverse order of validation, so the first failure takes precedence
+    isin = frame["ISIN"]
+    has_check_digit, convertible, checksum_valid = _isin_checks(isin)
+    checked = has_check_digit & convertible
+
+    reason[checked & ~checksum_valid] = "ISIN checksum failure."
+    reason[has_check_digit & ~convertible] = GENERIC_REASON
+    reason[~has_check_digit] = "ISIN checksum digit incorrect."
+    reason[(isin == "").to_numpy()] = "ISIN is missing."
+
+    if ISA_ELIGIBLE:
+        reason[~frame["ISA_eligible"].to_numpy(dtype=bool)] = "Requires ISA eligibility."
+
+    if REMOVE_ETF:
+        for column in ["Subtitle", "Long_Title"]:
+            reason[frame[column].str.contains("ETC", regex=False).to_numpy(dtype=bool)] = "ETC stock excluded."
+            reason[frame[column].str.contains("ETF", regex=False).to_numpy(dtype=bool)] = "ETF stock excluded."
+
+    result.loc[clean, "reason"] = reason
+    validate_rows(~clean)
+
+    return _add_symbols(df, result, clean)
+
+
+def _add_symbols(df: pd.DataFrame, result: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+    """adds isin & yahoo symbol (as per FreetradeModel.create_yahoo_symbol) for valid rows of result among rows"""
+
+    valid = rows & result["reason"].isna().to_numpy()
+    frame = df.loc[valid]
+
+    # Retain only uppercase letters, removing lowercase suffix and "."
+    yahoo_symbol = frame["Symbol"].str.replace(r"[a-z.]", "", regex=True)
+
+    # special case for XSTO
+    share_class = (frame["MIC"] == "XSTO") & yahoo_symbol.str.contains(r"[AB]$", regex=True)
+    yahoo_symbol = yahoo_symbol.where(
+        ~share_class, yahoo_symbol.str[:-1] + "-" + yahoo_symbol.str[-1:]
+    )
+
+    # Append suffix to symbol
+    yahoo_symbol += frame["MIC"].map(MIC_REFERENCE).fillna("")
+
+    result.loc[valid, "yahoo_symbol"] = yahoo_symbol.astype(object)
+    result.loc[valid, "isin"] = frame["ISIN"].astype(object)
+
+    return result.where(result.notna(), None)
+
+
+def shuffle_and_filter_stock_frame(df: pd.DataFrame, sample: int=-1) -> List[Dict]:
+    """Return a random sample of eligible stocks, validating the whole DataFrame at once"""
+
+    memo = VALIDATION_MEMO
+    hits, misses = (memo.hits, memo.misses) if memo else (0, 0)
+
+    with METRICS.timer("Validation"):
+        validated = validate_stock_frame(df.sample(frac=1), memo)
+
+    if memo is not None:
+        memo.save()
+        report_memo(memo.hits - hits, memo.misses - misses)
+
+    for reason, count in validated["reason"].value_counts().items():
+        logger.info(f"{count} stocks excluded. Reason: {reason}")
+        METRICS.add("StocksExcluded", count)
+
+    filtered = validated.loc[validated["reason"].isna(), ["yahoo_symbol", "isin"]]
+
+    if FAILURE_CACHE is not None:
+        stocks = list(skip_failing(filtered.to_dict(orient="records"), FAILURE_CACHE))
+        return stocks[:sample] if sample > 0 else stocks
+
+    if sample > 0:
+        filtered = filtered.head(sample)
+
+    return filtered.to_dict(orient="records")
+
+
+def iter_stock_records(url: str = ENDPOINT) -> Iterator[Dict]:
+    """Streams stock list from the Freetrade Google Sheet, yielding one CSV row at a time as a dict"""
+
+    with requests.get(url, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+
+        # download & parse are interleaved, so are timed together by the consumer
+        for record in csv.DictReader(io.TextIOWrapper(response.raw, encoding="utf-8", newline="")):
+            METRICS.add("SheetRows")
+            yield record
+
+
+def iter_valid_stocks(records: Iterable[Dict], memo: Optional[ValidationMemo] = None) -> Iterator[Dict]:
+    """
+    Lazily validates records, yielding {yahoo_symbol, isin} of valid stocks.
+    Records with an outcome in memo (if given) are not validated again.
+    """
+
+    excluded = Counter()
+    hits, misses = (memo.hits, memo.misses) if memo else (0, 0)
+
+    for record in records:
+        with METRICS.timer("Validation"):
+            stock, reason = validate_record(record) if memo is None else validate_record_cached(record, memo)
+
+        if stock is None:
+            excluded[reason] += 1
+            continue
+
+        yield stock
+
+    for reason, count in excluded.items():
+        logger.info(f"{count} stocks excluded. Reason: {reason}")
+        METRICS.add("StocksExcluded", count)
+
+    if memo is not None:
+        memo.save()
+        report_memo(memo.hits - hits, memo.misses - misses)
+
+
+def report_memo(hits: int, misses: int) -> None:
+    """logs & records the hits & misses of the validation memo within a run"""
+
+    METRICS.add("MemoHits", hits)
+    METRICS.add("MemoMisses", misses)
+    logger.info(f"Validation memo hit ratio: {hits / (hits + misses) if hits + misses else 0:.1%} of {hits + misses} rows")
+
+
+def validate_record_cached(record: Dict, memo: ValidationMemo) -> Tuple[Optional[Dict], Optional[str]]:
+    """validate_record, returning the outcome memoised for an identical record if there is one"""
+
+    key = record_key(record)
+    outcome = memo.get(key)
+
+    if outcome is None:
+        stock, reason = validate_record(record)
+        outcome = (stock["yahoo_symbol"], stock["isin"], None) if stock else (None, None, reason)
+        memo.put(key, outcome)
+
+    yahoo_symbol, isin, reason = outcome
+    if reason is not None:
+        return None, reason
+
+    return {"yahoo_symbol": yahoo_symbol, "isin": isin}, None
+
+
+def skip_failing(stocks: Iterable[Dict], cache: Optional[failures.FailureCache]) -> Iterator[Dict]:
+    """
+    Lazily yields stocks, skipping those recorded in cache as failing in stock_data
+    until they are due to be probed again, then reports how many were skipped by class of failure.
+    The cache is first synced with the failures stock_data has shared since the last run.
+    """
+
+    if cache is not None:
+        with METRICS.timer("StateSync"):
+            cache.sync()
+
+    failing = cache.failing() if cache is not None else {}
+    skipped = Counter()
+
+    for stock in stocks:
+        failure = failing.get((stock["isin"], stock["yahoo_symbol"]))
+        if failure is None:
+            yield stock
+        else:
+            skipped[failure] += 1
+
+    for failure, count in skipped.items():
+        logger.info(f"{count} stocks skipped. Failing in stock_data: {failure}")
+
+    if cache is not None:
+        METRICS.add("StocksSkipped", sum(skipped.values()))
+
+
+def reservoir_sample(items: Iterable, sample: int=-1, rng: random.Random = random) -> List:
+    """
+    Uniform random sample of items in a single pass, holding at most sample items in memory.
+    Returns all items, shuffled, when sample is not positive.
+    """
+
+    reservoir = []
+
+    for i, item in enumerate(items):
+
+        if sample <= 0 or i < sample:
+            reservoir.append(item)
+            continue
+
+        j = rng.randint(0, i)
+        if j < sample:
+            reservoir[j] = item
+
+    rng.shuffle(reservoir)
+
+    return reservoir
+
+
+def with_symbol(records: List[Dict]) -> List[Dict]:
+    """
+    records with a yahoo symbol to fetch, logging & counting those without one
+    (rows whose Symbol is missing, or read as NaN from "NA", leaving at most an exchange suffix)
+    """
+
+    def has_symbol(record):
+        symbol = record.get("yahoo_symbol")
+        return isinstance(symbol, str) and symbol != "" and not symbol.startswith(".")
+
+    kept = [record for record in records if has_symbol(record)]
+
+    if len(kept) < len(records):
+        logger.warning(f"{len(records) - len(kept)} stocks excluded. Reason: Symbol is missing.")
+        METRICS.add("StocksExcluded", len(records) - len(kept))
+
+    return kept
+
+
+def exchange_of(yahoo_symbol: str) -> str:
+    """MIC of the exchange a yahoo symbol is listed on, or US for symbols without an exchange suffix"""
+
+    suffix = "." + yahoo_symbol.rsplit(".", 1)[-1] if "." in yahoo_symbol else ""
+    return SUFFIX_MIC.get(suffix, "US")
+
+
+def plan_shards(
+    records: List[Dict],
+    max_cost: float = SHARD_COST,
+    costs: Dict[str, float] = FETCH_COST,
+) -> List[Dict]:
+    """
+    Splits stocks into shards, each with an expected fetch cost of at most max_cost seconds
+    (or a single stock), as evenly sized as possible, with SHARD_COST in place of a max_cost
+    that isn't a positive number. Stocks keep their order (shuffled by the caller), so exchanges
+    are mixed within shards: every stock is fetched from the same yahoo host, within the single
+    rate limiter of the stock_data invocation fetching its shard.
+    Returns list of {shard (its index), cost, count (of stocks), stocks}.
+    """
+
+    try:
+        max_cost = float(max_cost)
+    except (TypeError, ValueError):
+        max_cost = math.nan
+
+    # also false for NaN
+    if not max_cost > 0:
+        logger.warning(f"Invalid shard cost {max_cost}, using {SHARD_COST}")
+        max_cost = SHARD_COST
+
+    stock_costs = [costs.get(exchange_of(record["yahoo_symbol"]), DEFAULT_FETCH_COST) for record in records]
+    if not records:
+        return []
+
+    # the fewest shards within max_cost, each filled up to an even share of the total
+    target = sum(stock_costs) / min(len(records), math.ceil(sum(stock_costs) / max_cost))
+
+    shards, stocks, cost = [], [], 0.0
+    for record, stock_cost in zip(records, stock_costs):
+        if stocks and (cost + stock_cost > max_cost or cost + stock_cost / 2 > target):
+            shards.append({"shard": len(shards), "cost": cost, "count": len(stocks), "stocks": stocks})
+            stocks, cost = [], 0.0
+
+        stocks.append(record)
+        cost += stock_cost
+
+    shards.append({"shard": len(shards), "cost": cost, "count": len(stocks), "stocks": stocks})
+    return shards
+
+
+def offload_shards(shards: List[Dict], store: blobstore.BlobStore) -> List[Dict]:
+    """replaces the stocks of each shard with a manifest of them, written to store"""
+
+    prefix = blobstore.new_prefix("stock_list")
+    offloaded = []
+
+    for i, shard in enumerate(shards):
+        shard = dict(shard)
+        shard["manifest"] = blobstore.write_records(store, f"{prefix}/shard-{i:05d}", shard.pop("stocks"))
+        offloaded.append(shard)
+
+    return offloaded
 
 
 def shuffle_and_filter_stock_list(records: List[Dict], sample: int=-1) -> List[Dict]:
@@ -208,6 +924,7 @@ def shuffle_and_filter_stock_list(records: List[Dict], sample: int=-1) -> List[D
     return filtered_records
 
 
+@METRICS.instrument
 def lambda_handler(event, context):
     """Lambda function which downloads and checks stocks from Freetrade stock list,
     returning list of eligible stocks. 
@@ -217,6 +934,7 @@ def lambda_handler(event, context):
     - companies only (excluding ETFs and ETCs)
     - validated ISIN
     - expected data types
+    - not failing in stock_data, if FAILURE_CACHE is set (until due to be probed again)
 
     Additionally, creates new data:
     - Yahoo symbol, based on symbol & MIC
@@ -228,19 +946,61 @@ def lambda_handler(event, context):
     event: dict, required
         Input event to the Lambda function, which includes:
             - sample: number of valid stocks to output (default: all [-1])
+            - delta: only output stocks added or changed since the last snapshot,
+              requires SNAPSHOT_DIR (default: False)
+            - stream: parse & validate the sheet row by row, holding only the sample
+              in memory (default: False)
+            - shard: output shards of stocks, sized by expected fetch cost,
+              rather than individual stocks (default: False)
+            - shard_cost: maximum expected fetch cost (seconds) of a shard (default: SHARD_COST)
 
     context: object, required
         Lambda Context runtime methods and attributes
 
     Returns
     ------
-        list[dict]: List of eligible stocks including basic information
+        list[dict]: List of eligible stocks including basic information,
+        or list of shards: [{shard, cost, count, stocks: list[dict]}].
+        If RESULTS_URI is set, the stocks of each shard are written to the blob store,
+        with shards holding a manifest of them instead: [{shard, cost, count, manifest: dict}]
     """
 
-    records = get_stock_list()
+    sample = event.get("sample", -1)
+
+    if SYMBOL_RESOLVER is not None:
+        with METRICS.timer("StateSync"):
+            SYMBOL_RESOLVER.sync(compact=True)
+
+    if event.get("stream"):
+        stocks = skip_failing(iter_valid_stocks(iter_stock_records(), VALIDATION_MEMO), FAILURE_CACHE)
+        filtered_records = reservoir_sample(stocks, sample)
+
+    elif event.get("delta") and SNAPSHOT_DIR:
+        snapshot = SheetSnapshot(SNAPSHOT_DIR)
+        df, changed = snapshot.download(ENDPOINT)
+        changes = snapshot.diff() if changed else diff_stock_frames(df, df)
+        logger.info(f"Stock list changes: { {name: len(rows) for name, rows in changes.items()} }")
+
+        df = pd.concat([changes["added"], changes["changed"]], ignore_index=True)
+        filtered_records = shuffle_and_filter_stock_frame(df, sample)
+
+    else:
+        filtered_records = shuffle_and_filter_stock_frame(get_stock_frame(), sample)
+
+    filtered_records = with_symbol(filtered_records)
+    logger.info(f"Selected {len(filtered_records)} stocks")
+    METRICS.add("StocksSelected", len(filtered_records))
+
+    if event.get("shard"):
+        shards = plan_shards(filtered_records, event.get("shard_cost", SHARD_COST))
+        logger.info(f"Planned {len(shards)} shards of {sum(shard['cost'] for shard in shards):.0f}s of fetching")
+
+        METRICS.add("Shards", len(shards))
 
-    filtered_records = shuffle_and_filter_stock_list(records, event.get("sample", -1))
+        if RESULTS_STORE is not None:
+            with METRICS.timer("ResultsWrite"):
+                return offload_shards(shards, RESULTS_STORE)
 
-    logger.info(f"Selected stocks: {filtered_records}")
+        return shards
 
     return filtered_records
\ No newline at end of file
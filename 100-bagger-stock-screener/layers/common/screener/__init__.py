@@ -0,0 +1 @@
+"""Shared modules for the stock screener Lambda functions, deployed as a Lambda layer"""
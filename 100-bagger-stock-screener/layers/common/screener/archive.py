@@ -0,0 +1,252 @@
+"""
+Append-only archive of every raw yahoo response, for auditing & re-parsing.
+
+Each response is compressed as its own zstd frame, with a dictionary trained on responses already
+archived (their keys & layout repeat in every response, so each frame holds little beyond its values),
+and appended to a segment file. A SQLite index holds the segment, offset & length of every response
+by symbol & date, so any response is read back with a single seek.
+"""
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+# responses compressed without a dictionary before one is trained
+TRAIN_SAMPLES = 100
+DICTIONARY_SIZE = 32 * 2**10
+LEVEL = 12
+INDEX = "index.db"
+SEGMENT = "{month}-{writer}.zst"
+
+
+class ResponseArchive:
+    """
+    Directory of zstd segment files & their index. Each archive instance appends to segments of its own
+    (one per month), so concurrent writers never share a file. The first dictionary is trained once
+    train_samples responses have been archived without one (by a single thread, trying again after as many
+    more if training fails); responses keep the dictionary they were compressed with, so a dictionary
+    trained later (see train) applies only to responses archived after it.
+    Counts responses archived, with their raw & stored bytes.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        level: int = LEVEL,
+        train_samples: int = TRAIN_SAMPLES,
+        dictionary_size: int = DICTIONARY_SIZE,
+    ):
+        self.root = os.path.abspath(root)
+        self.level = level
+        self.train_samples = train_samples
+        self.dictionary_size = dictionary_size
+        self.writer = uuid.uuid4().hex[:12]
+        self.training = False
+        self.train_after = train_samples
+        self.stats = {"responses": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+        os.makedirs(self.root, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.root, INDEX), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT, date TEXT, fetched_at REAL, "
+                "segment TEXT, offset INTEGER, length INTEGER, size INTEGER, dictionary INTEGER)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS by_symbol ON responses (symbol, date)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS dictionaries (id INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB)"
+            )
+            row = self.connection.execute("SELECT MAX(id) FROM dictionaries").fetchone()
+
+        # compressors of the latest dictionary (0 for none), and decompressors of every dictionary read with
+        self.dictionary = row[0] or 0
+        self.compressor = None
+        self.decompressors = {}
+
+
+    def zstd_dictionary(self, dictionary: int):
+        import zstandard
+
+        if not dictionary:
+            return None
+
+        row = self.connection.execute("SELECT data FROM dictionaries WHERE id = ?", (dictionary,)).fetchone()
+        return zstandard.ZstdCompressionDict(row[0])
+
+
+    def compress(self, content: bytes) -> bytes:
+        import zstandard
+
+        if self.compressor is None:
+            self.compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self.zstd_dictionary(self.dictionary), write_content_size=True
+            )
+
+        return self.compressor.compress(content)
+
+
+    def decompress(self, frame: bytes, dictionary: int) -> bytes:
+        import zstandard
+
+        if dictionary not in self.decompressors:
+            self.decompressors[dictionary] = zstandard.ZstdDecompressor(dict_data=self.zstd_dictionary(dictionary))
+
+        return self.decompressors[dictionary].decompress(frame)
+
+
+    def append(self, symbol: str, content: bytes, date: Optional[str] = None) -> int:
+        """
+        archives the raw response of symbol fetched on date (YYYY-MM-DD, today in UTC by default),
+        alongside any archived before. Returns the bytes stored. Raises if training the first dictionary
+        fails, though the response is archived by then.
+        """
+
+        date = date or dt.datetime.now(dt.timezone.utc).date().isoformat()
+        segment = SEGMENT.format(month=date[:7], writer=self.writer)
+
+        with self.lock:
+            frame = self.compress(content)
+
+            # written before being indexed, so the index never points beyond the end of a segment
+            with open(os.path.join(self.root, segment), "ab") as f:
+                offset = f.tell()
+                f.write(frame)
+
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO responses (symbol, date, fetched_at, segment, offset, length, size, dictionary) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (symbol, date, time.time(), segment, offset, len(frame), len(content), self.dictionary)
+                )
+                untrained = 0 if self.dictionary or self.training else self.connection.execute(
+                    "SELECT COUNT(*) FROM responses WHERE dictionary = 0"
+                ).fetchone()[0]
+
+            self.stats["responses"] += 1
+            self.stats["raw_bytes"] += len(content)
+            self.stats["stored_bytes"] += len(frame)
+
+            # only a single thread trains, while others carry on without a dictionary
+            train = untrained >= self.train_after
+            if train:
+                self.training = True
+
+        if train:
+            try:
+                self.train()
+            except Exception:
+                self.train_after = untrained + self.train_samples
+                raise
+            finally:
+                self.training = False
+
+        return len(frame)
+
+
+    def locate(self, symbol: str, date: Optional[str] = None) -> Optional[Tuple[str, int, int, int]]:
+        """segment, offset, length & dictionary of the latest response of symbol on date (or at all if None)"""
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT segment, offset, length, dictionary FROM responses "
+                "WHERE symbol = ? AND date = COALESCE(?, date) ORDER BY date DESC, id DESC LIMIT 1",
+                (symbol, date)
+            ).fetchone()
+
+
+    def read(self, symbol: str, date: Optional[str] = None) -> Optional[bytes]:
+        """latest raw response of symbol archived on date (or at all if None), or None if not archived"""
+        return self.read_frame(self.locate(symbol, date))
+
+
+    def read_entry(self, entry: int) -> Optional[bytes]:
+        """raw response archived as entry (an id of entries), or None if not archived"""
+
+        with self.lock:
+            location = self.connection.execute(
+                "SELECT segment, offset, length, dictionary FROM responses WHERE id = ?", (entry,)
+            ).fetchone()
+
+        return self.read_frame(location)
+
+
+    def read_frame(self, location: Optional[Tuple[str, int, int, int]]) -> Optional[bytes]:
+        if location is None:
+            return None
+
+        segment, offset, length, dictionary = location
+        with open(os.path.join(self.root, segment), "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+
+        with self.lock:
+            return self.decompress(frame, dictionary)
+
+
+    def entries(self, symbol: str) -> List[Tuple[int, str, float]]:
+        """id, date & fetch time of every response of symbol archived, oldest first"""
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, date, fetched_at FROM responses WHERE symbol = ? ORDER BY id", (symbol,)
+            ).fetchall()
+
+
+    def dates(self, symbol: str) -> List[str]:
+        """dates a response of symbol is archived for, oldest first"""
+        return sorted({date for _, date, _ in self.entries(symbol)})
+
+
+    def train(self, samples: Optional[List[bytes]] = None) -> int:
+        """
+        trains a dictionary on samples (by default, the train_samples latest responses archived),
+        which compresses every response archived after it. Returns the id of the dictionary.
+        """
+
+        import zstandard
+
+        if samples is None:
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT id FROM responses ORDER BY id DESC LIMIT ?", (self.train_samples,)
+                ).fetchall()
+            samples = [self.read_entry(entry) for entry, in rows]
+
+        data = zstandard.train_dictionary(self.dictionary_size, samples, level=self.level).as_bytes()
+
+        with self.lock:
+            with self.connection:
+                dictionary = self.connection.execute(
+                    "INSERT INTO dictionaries (data) VALUES (?)", (data,)
+                ).lastrowid
+            self.dictionary = dictionary
+            self.compressor = None
+
+        return dictionary
+
+
+    def totals(self) -> Dict[str, int]:
+        """responses archived, with their raw & stored bytes"""
+
+        with self.lock:
+            responses, raw_bytes, stored_bytes = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM responses"
+            ).fetchone()
+
+        return {"responses": responses, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes}
+
+
+def from_environment() -> Optional[ResponseArchive]:
+    """creates archive if RESPONSE_ARCHIVE_PATH is set, otherwise returns None"""
+
+    path = os.environ.get("RESPONSE_ARCHIVE_PATH")
+
+    if not path:
+        return None
+
+    return ResponseArchive(path)
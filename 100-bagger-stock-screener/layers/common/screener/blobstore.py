@@ -0,0 +1,194 @@
+import abc
+import gzip
+import io
+import json
+import os
+import uuid
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+# records per chunk of a manifest
+CHUNK_SIZE = 5_000
+FORMAT = "ndjson.gz"
+
+
+class BlobStore(abc.ABC):
+    """Storage interface for results passed between states by reference, holding bytes by key"""
+
+    uri: str
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """stores data against key"""
+
+    @abc.abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """returns file-like object streaming the data stored against key"""
+
+    @abc.abstractmethod
+    def list(self, prefix: str) -> List[str]:
+        """keys stored under prefix, in order"""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """removes key if present"""
+
+
+class FileSystemStore(BlobStore):
+    """Stores blobs as files within a local directory, for local runs"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.uri = self.root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written then renamed, so readers never see a partial chunk
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def open(self, key):
+        return open(os.path.join(self.root, key), "rb")
+
+    def list(self, prefix):
+        directory = os.path.join(self.root, prefix)
+        keys = []
+        for root, _, files in os.walk(directory):
+            keys.extend(
+                os.path.relpath(os.path.join(root, name), self.root).replace(os.sep, "/")
+                for name in files if not name.endswith(".tmp")
+            )
+        return sorted(keys)
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store(BlobStore):
+    """Stores blobs as objects under a prefix of an S3 (or S3 compatible) bucket"""
+
+    def __init__(self, bucket: str, prefix: str = "", client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.uri = f"s3://{bucket}/{self.prefix}" if self.prefix else f"s3://{bucket}"
+
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
+        self.client = client
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+
+    def list(self, prefix):
+        keys, kwargs = [], {"Bucket": self.bucket, "Prefix": self.object_key(prefix)}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            keys.extend(item["Key"] for item in response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+        start = len(self.object_key(""))
+        return sorted(key[start:] for key in keys)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+
+def open_store(uri: str) -> BlobStore:
+    """store for a URI: s3://bucket/prefix, or a local directory"""
+
+    if uri.startswith("s3://"):
+        bucket, _, prefix = uri[len("s3://"):].partition("/")
+        return S3Store(bucket, prefix)
+
+    if uri.startswith("file://"):
+        uri = uri[len("file://"):]
+
+    return FileSystemStore(uri)
+
+
+def from_environment() -> Optional[BlobStore]:
+    """store at RESULTS_URI if set, otherwise returns None, with results passed inline"""
+
+    uri = os.environ.get("RESULTS_URI")
+
+    if not uri:
+        return None
+
+    return open_store(uri)
+
+
+def new_prefix(name: str) -> str:
+    """unique prefix for the chunks written by a single invocation"""
+    return f"{name}/{uuid.uuid4().hex}"
+
+
+def encode_chunk(records: List[Dict]) -> bytes:
+    """records as gzip compressed newline delimited JSON"""
+
+    lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    return gzip.compress(lines.encode(), compresslevel=6)
+
+
+def write_records(store: BlobStore, prefix: str, records: Iterable[Dict], chunk_size: int = CHUNK_SIZE) -> Dict:
+    """
+    Writes records to store in chunks of compressed NDJSON under prefix,
+    returning a manifest small enough to pass between states in place of the records
+    """
+
+    chunks, chunk = [], []
+
+    def flush():
+        key = f"{prefix}/part-{len(chunks):05d}.{FORMAT}"
+        store.put(key, encode_chunk(chunk))
+        chunks.append({"key": key, "records": len(chunk)})
+
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            flush()
+            chunk = []
+
+    if chunk:
+        flush()
+
+    return {
+        "manifest": FORMAT,
+        "uri": store.uri,
+        "records": sum(c["records"] for c in chunks),
+        "chunks": chunks,
+    }
+
+
+def is_manifest(data) -> bool:
+    return isinstance(data, dict) and data.get("manifest") == FORMAT
+
+
+def read_records(manifest: Dict, store: Optional[BlobStore] = None) -> Iterator[Dict]:
+    """lazily yields the records of a manifest, streaming & decompressing one chunk at a time"""
+
+    store = store or open_store(manifest["uri"])
+
+    for chunk in manifest["chunks"]:
+        yield from read_chunk(store, chunk["key"])
+
+
+def read_chunk(store: BlobStore, key: str) -> Iterator[Dict]:
+    """lazily yields the records of a single chunk (as encode_chunk)"""
+
+    with store.open(key) as f, gzip.GzipFile(fileobj=f) as lines:
+        for line in io.TextIOWrapper(lines, encoding="utf-8"):
+            yield json.loads(line)
@@ -0,0 +1,250 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# time-to-live in seconds, matched against the prefix of each yahoo field
+FIELD_TTLS = {
+    "trailing": 86400,
+    "quarterly": 7 * 86400,
+    "annual": 30 * 86400,
+}
+DEFAULT_TTL = 86400
+MAX_ENTRIES = 100_000
+MAX_BYTES = 500 * 2**20
+
+
+class CacheBackend(abc.ABC):
+    """Storage interface for the cache, holding (value, expires_at) entries by key in LRU order"""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """returns value & expiry timestamp for key, marking it as recently used"""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        """stores value against key"""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """removes key if present"""
+
+    @abc.abstractmethod
+    def evict(self, max_entries: int, max_bytes: int) -> int:
+        """removes least recently used entries until within limits, returning number evicted"""
+
+
+class MemoryBackend(CacheBackend):
+    """Non-persistent backend, holding entries in memory for the life of the process"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[0])
+            self.entries[key] = (value, expires_at)
+            self.size += len(value)
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[0])
+
+    def evict(self, max_entries, max_bytes):
+        evicted = 0
+        with self.lock:
+            while self.entries and (len(self.entries) > max_entries or self.size > max_bytes):
+                _, (value, _) = self.entries.popitem(last=False)
+                self.size -= len(value)
+                evicted += 1
+        return evicted
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Persistent backend, holding entries in a local SQLite database file.
+    The number & size of entries are kept as running totals (counted from the table when opened),
+    so neither checking limits nor evicting scans the table.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires_at REAL, accessed_at INTEGER)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS lru ON entries (accessed_at)")
+            self.count, self.size = self.totals()
+
+    def totals(self) -> Tuple[int, int]:
+        """number & total size of entries, counted from the table"""
+        return self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def remove_from_totals(self, key: str) -> None:
+        row = self.connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.count -= 1
+            self.size -= row[0]
+
+    def get(self, key):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time_ns(), key)
+            )
+            return row[0], row[1]
+
+    def set(self, key, value, expires_at):
+        with self.lock, self.connection:
+            self.remove_from_totals(key)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires_at, time.time_ns())
+            )
+            self.count += 1
+            self.size += len(value)
+
+    def delete(self, key):
+        with self.lock, self.connection:
+            self.remove_from_totals(key)
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self, max_entries, max_bytes):
+        with self.lock, self.connection:
+            if self.count <= max_entries and self.size <= max_bytes:
+                return 0
+
+            count, size = self.count, self.size
+            evicted = []
+            rows = self.connection.execute("SELECT key, size FROM entries ORDER BY accessed_at")
+            for key, entry_size in rows:
+                if count <= max_entries and size <= max_bytes:
+                    break
+                evicted.append((key,))
+                count -= 1
+                size -= entry_size
+
+            self.connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+            self.count, self.size = count, size
+            return len(evicted)
+
+
+class ResponseCache:
+    """
+    TTL cache for yahoo timeseries responses, storing each field separately so that
+    only expired fields need to be downloaded again. Counts hits, misses & evictions
+    (thread safe, as batches are fetched in a thread pool).
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttls: Dict[str, float] = FIELD_TTLS,
+        default_ttl: float = DEFAULT_TTL,
+        max_entries: int = MAX_ENTRIES,
+        max_bytes: int = MAX_BYTES,
+    ):
+        self.backend = backend
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+
+    def add_stat(self, stat: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[stat] += n
+
+
+    @staticmethod
+    def key(symbol: str, field: str, period: int) -> str:
+        """cache key for a single field of a symbol's timeseries"""
+        return f"{symbol}|{field}|{period}"
+
+
+    def ttl(self, field: str) -> float:
+        """time-to-live of a field, based on the longest matching prefix"""
+        matches = [prefix for prefix in self.ttls if field.startswith(prefix)]
+        if not matches:
+            return self.default_ttl
+        return self.ttls[max(matches, key=len)]
+
+
+    def get(self, symbol: str, field: str, period: int) -> Optional[Dict]:
+        """returns cached timeseries result for field, or None if missing or expired"""
+
+        entry = self.backend.get(self.key(symbol, field, period))
+
+        if entry is None or entry[1] <= time.time():
+            self.add_stat("misses")
+            return None
+
+        self.add_stat("hits")
+        return json.loads(entry[0])
+
+
+    def set(self, symbol: str, field: str, period: int, result: Dict) -> None:
+        """stores timeseries result for field, evicting least recently used entries if over limits"""
+
+        value = json.dumps(result).encode()
+        self.backend.set(self.key(symbol, field, period), value, time.time() + self.ttl(field))
+        self.add_stat("evictions", self.backend.evict(self.max_entries, self.max_bytes))
+
+
+    def get_or_fetch(
+        self, symbol: str, fields: List[str], period: int, fetch: Callable[[List[str]], Dict]
+    ) -> Dict:
+        """
+        Returns yahoo-style JSON response for fields, served from cache where possible.
+        fetch is called with only the missing fields, with its results added to the cache.
+        """
+
+        results = {field: self.get(symbol, field, period) for field in fields}
+        missing = [field for field, result in results.items() if result is None]
+
+        if missing:
+            for result in fetch(missing)['timeseries']['result']:
+                field = result['meta']['type'][0]
+                self.set(symbol, field, period, result)
+                results[field] = result
+
+        return {
+            "timeseries": {
+                "result": [result for result in results.values() if result is not None],
+                "error": None,
+            }
+        }
+
+
+def from_environment() -> Optional[ResponseCache]:
+    """creates a SQLite backed cache if YAHOO_CACHE_PATH is set, otherwise returns None"""
+
+    path = os.environ.get("YAHOO_CACHE_PATH")
+
+    if not path:
+        return None
+
+    return ResponseCache(SQLiteBackend(path))
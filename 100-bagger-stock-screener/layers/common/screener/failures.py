@@ -0,0 +1,161 @@
+"""
+Negative cache of stocks without usable fundamentals on yahoo, recorded by stock_data & consulted by stock_list,
+so stocks failing every run are skipped rather than fetched again. Each failing stock is probed again
+after an interval doubling with every consecutive failure, and forgotten as soon as it succeeds.
+
+Deployed, the cache is shared between the functions through the blob store (see screener.shared):
+stock_data appends the failures & successes of each invocation as events, which stock_list replays
+into its local copy of the cache (and compacts) before consulting it.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from screener import shared
+
+# classes of failure persisting between runs (transient errors, such as timeouts, are not cached)
+NOT_FOUND = "not_found"
+EMPTY = "empty"
+MISSING_FIELDS = "missing_fields"
+# seconds a stock is skipped after its first failure: just under two weekly runs, so the next run skips it
+BASE_INTERVAL = 13 * 86400
+MAX_INTERVAL = 180 * 86400
+
+
+class FailureCache:
+    """
+    Local SQLite store of failing stocks by ISIN & yahoo symbol (as guessed by stock_list),
+    holding the class of their last failure, the number of consecutive failures,
+    and when they are next due to be probed. Stocks not probed again within max_interval
+    of being due (such as those no longer listed) expire. With shared state, recorded failures &
+    successes are also appended to it, and sync replays those of every writer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        base_interval: float = BASE_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        state: Optional[shared.SharedState] = None,
+    ):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.state = state
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                "isin TEXT, symbol TEXT, failure TEXT, failures INTEGER, failed_at REAL, retry_at REAL, "
+                "PRIMARY KEY (isin, symbol))"
+            )
+
+
+    def interval(self, failures: int) -> float:
+        """seconds to skip a stock after its nth consecutive failure"""
+        return min(self.base_interval * 2 ** (failures - 1), self.max_interval)
+
+
+    def record(
+        self,
+        failed: Iterable[Tuple[str, str, str]],
+        succeeded: Iterable[Tuple[str, str]] = (),
+        now: Optional[float] = None,
+    ) -> None:
+        """records (isin, symbol, failure) stocks failing once more, and forgets (isin, symbol) stocks succeeding"""
+
+        now = time.time() if now is None else now
+        failed, succeeded = list(failed), list(succeeded)
+
+        self.apply(failed, succeeded, now)
+
+        if self.state is not None:
+            self.state.append(
+                [{"isin": isin, "symbol": symbol, "failure": failure, "at": now} for isin, symbol, failure in failed]
+                + [{"isin": isin, "symbol": symbol, "failure": None, "at": now} for isin, symbol in succeeded]
+            )
+
+
+    def apply(self, failed: List[Tuple[str, str, str]], succeeded: List[Tuple[str, str]], now: float) -> None:
+        """records failures & successes in the local database"""
+
+        with self.lock, self.connection:
+            counts = {}
+            for isin, symbol, _ in failed:
+                row = self.connection.execute(
+                    "SELECT failures FROM failures WHERE isin = ? AND symbol = ?", (isin, symbol)
+                ).fetchone()
+                counts[isin, symbol] = (row[0] if row else 0) + 1
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (isin, symbol, failure, counts[isin, symbol], now, now + self.interval(counts[isin, symbol]))
+                    for isin, symbol, failure in failed
+                ]
+            )
+            self.connection.executemany(
+                "DELETE FROM failures WHERE isin = ? AND symbol = ?", succeeded
+            )
+            self.connection.execute("DELETE FROM failures WHERE retry_at < ?", (now - self.max_interval,))
+
+
+    def failing(self, now: Optional[float] = None) -> Dict[Tuple[str, str], str]:
+        """class of failure of every stock not yet due to be probed again, by (isin, symbol)"""
+
+        now = time.time() if now is None else now
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT isin, symbol, failure FROM failures WHERE retry_at > ?", (now,)
+            ).fetchall()
+
+        return {(isin, symbol): failure for isin, symbol, failure in rows}
+
+
+    def sync(self) -> None:
+        """
+        replaces the local database with the shared state, replaying the failures & successes
+        appended by every writer since it was last compacted, then compacts it
+        """
+
+        if self.state is None:
+            return
+
+        rows, events, chunks = self.state.load()
+
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM failures")
+            self.connection.executemany(
+                "INSERT INTO failures VALUES (:isin, :symbol, :failure, :failures, :failed_at, :retry_at)", rows
+            )
+
+        for event in events:
+            if event["failure"] is None:
+                self.apply([], [(event["isin"], event["symbol"])], event["at"])
+            else:
+                self.apply([(event["isin"], event["symbol"], event["failure"])], [], event["at"])
+
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM failures")
+            columns = [column for column, *_ in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        self.state.compact(rows, chunks)
+
+
+def from_environment() -> Optional[FailureCache]:
+    """
+    creates cache if FAILURE_CACHE_PATH or STATE_URI is set (shared through STATE_URI if set,
+    in a temporary file unless FAILURE_CACHE_PATH is also set), otherwise returns None
+    """
+
+    path = os.environ.get("FAILURE_CACHE_PATH")
+    state = shared.from_environment("failures")
+
+    if not path and state is None:
+        return None
+
+    return FailureCache(path or shared.local_path("failures"), state=state)
@@ -0,0 +1,103 @@
+import datetime as dt
+import os
+import uuid
+from typing import Dict, List, Optional
+
+from screener import blobstore
+
+# output record keys, mapped to their column names in the store
+RECORD_COLUMNS = {
+    "Ticker": "ticker",
+    "ISIN": "isin",
+    "Market cap": "market_cap",
+    "Total score": "total_score",
+    "timestamp": "timestamp",
+}
+
+
+def write_run(root: str, records: List[Dict], data: List[Dict], run_date: Optional[dt.date] = None) -> str:
+    """
+    Append scored records & their transformed yahoo series (Score.data) to the
+    history store at root (a local directory, or s3://bucket/prefix), as a parquet file
+    within the run_date partition. Returns path of the file written.
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    run_date = run_date or dt.date.today()
+
+    columns = {
+        column: [record.get(key) for record in records]
+        for key, column in RECORD_COLUMNS.items()
+    }
+
+    fields = sorted({field for series in data for field in series})
+    for field in fields:
+        columns[field] = pa.array([series.get(field) for series in data], type=pa.list_(pa.float64()))
+
+    buffer = pa.BufferOutputStream()
+    pq.write_table(pa.table(columns), buffer)
+
+    # written whole through the blob store, so readers never see a partial file
+    store = blobstore.open_store(root)
+    key = f"run_date={run_date.isoformat()}/part-{uuid.uuid4().hex}.parquet"
+    store.put(key, buffer.getvalue().to_pybytes())
+
+    return f"{store.uri}/{key}"
+
+
+def read_history(
+    root: str,
+    columns: Optional[List[str]] = None,
+    start: Optional[dt.date] = None,
+    end: Optional[dt.date] = None,
+):
+    """
+    Read local history store as a pyarrow Table, memory mapping the files & loading only
+    the requested columns (leaving out any no file holds). Optionally restricted to runs
+    between start & end dates (inclusive), whose partitions alone are read.
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as fs
+
+    options = dict(
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("run_date", pa.string())]), flavor="hive"),
+        partition_base_dir=root,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+    # the files of the runs selected, listed from their partitions so no others are opened
+    source = root
+    if start is not None or end is not None:
+        source = []
+        for run_date in run_dates(root):
+            if (start is None or run_date >= start) and (end is None or run_date <= end):
+                partition = os.path.join(root, f"run_date={run_date.isoformat()}")
+                source += [os.path.join(partition, name) for name in sorted(os.listdir(partition))]
+
+    dataset = ds.dataset(source, **options)
+
+    # files may hold different fields, so read with the union of their schemas
+    schema = pa.unify_schemas([dataset.schema] + [f.physical_schema for f in dataset.get_fragments()])
+    dataset = ds.dataset(source, schema=schema, **options)
+
+    if columns is not None:
+        columns = [column for column in columns if column in schema.names]
+
+    return dataset.to_table(columns=columns)
+
+
+def run_dates(root: str) -> List[dt.date]:
+    """dates of the runs in the history store, oldest first, from its partitions alone"""
+
+    if not os.path.isdir(root):
+        return []
+
+    prefix = "run_date="
+    return sorted(
+        dt.date.fromisoformat(name[len(prefix):]) for name in os.listdir(root) if name.startswith(prefix)
+    )
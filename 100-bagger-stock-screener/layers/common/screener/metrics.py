@@ -0,0 +1,163 @@
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, Optional
+
+from aws_lambda_powertools.metrics.provider.cloudwatch_emf.cloudwatch import AmazonCloudWatchEMFProvider
+from aws_lambda_powertools.metrics.provider.cloudwatch_emf.constants import MAX_METRICS
+
+NAMESPACE = "StockScreener"
+
+
+class Metrics:
+    """
+    Timers & counters of the phases of a handler, accumulated over an invocation and emitted
+    as a single CloudWatch Embedded Metric Format (EMF) document when it ends, serialized by powertools.
+    Documents are appended to the file at path if given (for offline runs), otherwise printed
+    to stdout within Lambda (where CloudWatch extracts the metrics from the log), or dropped.
+    Thread safe, so phases run in a thread pool accumulate into the same metrics.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        namespace: str = NAMESPACE,
+        path: Optional[str] = None,
+        profile_dir: Optional[str] = None,
+    ):
+        self.service = service
+        self.namespace = namespace
+        self.path = path
+        self.profile_dir = profile_dir
+        self.cold_start = True
+        self.lock = threading.Lock()
+        self.values: Dict[str, float] = defaultdict(float)
+        self.units: Dict[str, str] = {}
+
+
+    def add(self, name: str, value: float = 1, unit: str = "Count") -> None:
+        """adds value to the metric name"""
+
+        with self.lock:
+            self.values[name] += value
+            self.units[name] = unit
+
+
+    def add_bytes(self, name: str, size: int) -> None:
+        self.add(name, size, "Bytes")
+
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """times the block, adding its milliseconds to name & counting it in <name>Count"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self.lock:
+                self.values[name] += elapsed
+                self.units[name] = "Milliseconds"
+                self.values[f"{name}Count"] += 1
+                self.units[f"{name}Count"] = "Count"
+
+
+    def document(self, values: Dict[str, float], units: Dict[str, str]) -> Dict:
+        """EMF document of values, with the service as its dimension"""
+
+        provider = AmazonCloudWatchEMFProvider(namespace=self.namespace, service=self.service)
+
+        # powertools prints the set itself once it holds MAX_METRICS, so one fewer are kept
+        for name in sorted(values)[:MAX_METRICS - 1]:
+            provider.add_metric(name=name, unit=units[name], value=values[name])
+
+        return provider.serialize_metric_set()
+
+
+    def flush(self) -> Optional[Dict]:
+        """emits the metrics accumulated since the last flush, returning the EMF document (None if empty)"""
+
+        with self.lock:
+            values, units = dict(self.values), dict(self.units)
+            self.values.clear()
+            self.units.clear()
+
+        if not values:
+            return None
+
+        document = self.document(values, units)
+        line = json.dumps(document, separators=(",", ":"))
+
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+        elif os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+            print(line, file=sys.stdout, flush=True)
+
+        return document
+
+
+    @contextlib.contextmanager
+    def profile(self) -> Iterator[Optional[cProfile.Profile]]:
+        """
+        profiles the block with cProfile if profile_dir is set, dumping stats to a file per invocation
+        (read with python -m pstats). Only the calling thread is profiled, not those of thread pools.
+        """
+
+        if not self.profile_dir:
+            yield None
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{self.service}-{time.time_ns()}.prof"))
+
+
+    def instrument(self, handler: Callable) -> Callable:
+        """
+        decorator for a Lambda handler, timing each invocation (with any profile),
+        counting cold starts & errors, and flushing the metrics when it ends
+        """
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if self.cold_start:
+                self.add("ColdStart")
+                self.cold_start = False
+
+            try:
+                with self.profile(), self.timer("Invocation"):
+                    return handler(event, context)
+            except Exception:
+                self.add("Errors")
+                raise
+            finally:
+                self.flush()
+
+        return wrapper
+
+
+def from_environment(service: str) -> Metrics:
+    """
+    metrics of service (or POWERTOOLS_SERVICE_NAME if set) in POWERTOOLS_METRICS_NAMESPACE,
+    written to METRICS_PATH if set, and profiled into PROFILE_DIR if set
+    """
+
+    return Metrics(
+        os.environ.get("POWERTOOLS_SERVICE_NAME", service),
+        namespace=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", NAMESPACE),
+        path=os.environ.get("METRICS_PATH"),
+        profile_dir=os.environ.get("PROFILE_DIR"),
+    )
@@ -0,0 +1,196 @@
+import datetime as dt
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# statuses signalling the server is overloaded, which are retried after backing off
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+RATE = 5.0
+MIN_RATE = 0.2
+MAX_RATE = 20.0
+MAX_ATTEMPTS = 4
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """seconds to wait from a Retry-After header, given as seconds or a HTTP date"""
+
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max((retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds(), 0.0)
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate & concurrency of requests to a host, adjusted by AIMD:
+    each success adds about `increase` requests/second per second (and grows the concurrency
+    limit by one per window of successes), while a throttled or failed request multiplies
+    both by `decrease`, at most once per `cooldown` seconds. A Retry-After pauses all requests.
+    Thread safe, so a single limiter is shared by all threads requesting the host.
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE,
+        min_rate: float = MIN_RATE,
+        max_rate: float = MAX_RATE,
+        max_concurrency: int = 8,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+        burst: Optional[float] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.burst = burst
+        self.sleep = sleep
+
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.decreased_at = float("-inf")
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.stats = {"requests": 0, "throttles": 0, "errors": 0, "retries": 0}
+
+
+    def _refill(self, now: float) -> None:
+        burst = self.burst or max(self.rate, 1.0)
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+    def acquire(self) -> None:
+        """blocks until a request may be sent, within both the rate & concurrency limits"""
+
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now < self.blocked_until:
+                    timeout = self.blocked_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    timeout = None
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    self.stats["requests"] += 1
+                    return
+                else:
+                    timeout = (1 - self.tokens) / self.rate
+
+                self.condition.wait(timeout)
+
+
+    def release(self) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+    def on_success(self) -> None:
+        with self.condition:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.condition.notify_all()
+
+
+    def on_throttle(self, retry_after: Optional[float] = None, throttled: bool = True, retry: bool = False) -> None:
+        """reduce rate & concurrency following a throttled (or otherwise failed) request, to be retried if retry"""
+
+        with self.condition:
+            now = time.monotonic()
+            self.stats["throttles" if throttled else "errors"] += 1
+            self.stats["retries"] += retry
+
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+            # concurrent requests are throttled together, so only back off once for them
+            if now - self.decreased_at >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.concurrency = max(1.0, self.concurrency * self.decrease)
+                self.tokens = min(self.tokens, 0.0)
+                self.decreased_at = now
+
+
+    def backoff(self, attempt: int) -> float:
+        """seconds to wait before retrying: full jitter exponential backoff"""
+        return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+    def request(self, send: Callable, max_attempts: int = MAX_ATTEMPTS):
+        """
+        Sends a request with send() within the limits, retrying throttled, 5xx & connection
+        failures with jittered backoff. Returns the last response, leaving its status to the caller.
+        """
+
+        for attempt in range(max_attempts):
+            last_attempt = attempt == max_attempts - 1
+
+            self.acquire()
+            try:
+                response = send()
+            except OSError:
+                self.on_throttle(throttled=False, retry=not last_attempt)
+                if last_attempt:
+                    raise
+                self.sleep(self.backoff(attempt))
+                continue
+            finally:
+                self.release()
+
+            if response.status_code not in RETRY_STATUSES:
+                self.on_success()
+                return response
+
+            # any Retry-After delays every request, within acquire
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            throttled = response.status_code in THROTTLE_STATUSES
+            self.on_throttle(retry_after, throttled=throttled, retry=not last_attempt)
+
+            if last_attempt:
+                return response
+
+            self.sleep(self.backoff(attempt))
+
+
+    def metrics(self) -> Dict:
+        """current rate (requests/second) & concurrency limit, with counts of requests, throttles, errors & retries"""
+
+        with self.condition:
+            return {"rate": self.rate, "concurrency": int(self.concurrency), **self.stats}
+
+
+def from_environment(max_concurrency: int = 8) -> RateLimiter:
+    """creates rate limiter starting at YAHOO_RATE requests/second, up to YAHOO_MAX_RATE"""
+
+    return RateLimiter(
+        rate=float(os.environ.get("YAHOO_RATE", RATE)),
+        max_rate=float(os.environ.get("YAHOO_MAX_RATE", MAX_RATE)),
+        max_concurrency=max_concurrency,
+    )
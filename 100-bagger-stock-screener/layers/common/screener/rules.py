@@ -0,0 +1,231 @@
+"""
+Declarative scoring rules, compiled once into NumPy kernels scoring a whole batch of stocks at a time.
+
+A spec is a JSON serialisable list of rules, each scoring a single aggregate of a field:
+
+    {
+        "name": "pe",                   # name of the rule's scores
+        "field": "trailingPeRatio",     # yahoo field
+        "aggregate": "last",            # first, last, mean, count, change or growth
+        "weight": 1,                    # multiplies the score within the total
+        "missing": 0,                   # score where the aggregate is undefined (e.g. growth from zero)
+        "default": 0,                   # score where no piece matches
+        "pieces": [                     # first matching piece scores the stock
+            {"max": 0, "max_inclusive": true, "score": 0},
+            {"min": 50, "min_inclusive": false, "score": 0},
+            {"curve": "decay", "points": 11, "scale": 50, "inner": 2, "outer": 1},
+        ],
+    }
+
+Bounds are inclusive of min & exclusive of max unless stated otherwise. A curve scores
+trunc(points * (1 - (x/scale)**inner)**outer) ("decay") or trunc(points * x/scale) ("linear").
+"""
+import hashlib
+import itertools
+import json
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+AGGREGATES = {"first", "last", "mean", "count", "change", "growth"}
+CURVES = {"decay", "linear"}
+# compiled specs by hash of their JSON, so each spec is only compiled once per container
+_COMPILED: Dict[str, "CompiledSpec"] = {}
+
+
+def spec_hash(spec: List[Dict]) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def to_columns(data: List[Dict], fields: List[str]) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    transform list of simplified lookup dicts to arrays of the first & last values, count & sum
+    of each field. Missing fields have a count of zero (and zero values).
+    The values of every field of every stock are concatenated into a single array,
+    so each aggregate is taken for every series at once.
+    """
+
+    series = [record.get(field) or () for record in data for field in fields]
+    counts = np.fromiter(map(len, series), dtype=np.int64, count=len(series))
+    ends = np.cumsum(counts)
+    starts = ends - counts
+
+    # padded so the start of empty series (possibly the end of the array) can be indexed
+    values = np.zeros(ends[-1] + 1 if len(ends) else 1, dtype=np.float64)
+    values[:-1] = np.fromiter(itertools.chain.from_iterable(series), dtype=np.float64, count=len(values) - 1)
+
+    present = counts > 0
+    aggregates = {
+        "first": np.where(present, values[starts], 0),
+        "last": np.where(present, values[ends - 1], 0),
+        "count": counts,
+        "sum": np.where(present, np.add.reduceat(values, starts) if len(starts) else starts, 0),
+    }
+
+    # stocks x fields, as a contiguous array per field
+    return {
+        name: dict(zip(fields, np.ascontiguousarray(column.reshape(len(data), len(fields)).T)))
+        for name, column in aggregates.items()
+    }
+
+
+def aggregate(columns: Dict[str, Dict[str, np.ndarray]], field: str, name: str) -> np.ndarray:
+    """aggregate of a field for every stock, NaN where undefined"""
+
+    first = columns["first"][field]
+    last = columns["last"][field]
+    count = columns["count"][field]
+
+    if name == "first":
+        return first
+    if name == "last":
+        return last
+    if name == "count":
+        return count.astype(np.float64)
+
+    # undefined aggregates are masked out, and extreme values may overflow to inf
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if name == "change":
+            return last - first
+        if name == "mean":
+            return np.where(count > 0, columns["sum"][field] / count, np.nan)
+
+        # average growth per period, undefined from zero or over a single point
+        return np.where((first != 0) & (count > 1), ((last - first) / first) / (count - 1), np.nan)
+
+
+def compile_piece(piece: Dict) -> Callable[[np.ndarray], np.ndarray]:
+    """scores of a piece for an array of values, before checking the bounds"""
+
+    if "score" in piece:
+        score = piece["score"]
+        return lambda x: np.full(x.shape, score, dtype=np.float64)
+
+    points, scale = piece["points"], piece["scale"]
+
+    if piece["curve"] == "linear":
+        return lambda x: np.trunc(points * (x / scale))
+
+    inner, outer = piece.get("inner", 1), piece.get("outer", 1)
+    return lambda x: np.trunc(points * (1 - (x / scale) ** inner) ** outer)
+
+
+def compile_bounds(piece: Dict) -> Callable[[np.ndarray], np.ndarray]:
+    """mask of the values within the bounds of a piece"""
+
+    low, high = piece.get("min"), piece.get("max")
+    low_inclusive, high_inclusive = piece.get("min_inclusive", True), piece.get("max_inclusive", False)
+
+    def bounds(x):
+        mask = np.ones(x.shape, dtype=bool)
+        if low is not None:
+            mask &= (x >= low) if low_inclusive else (x > low)
+        if high is not None:
+            mask &= (x <= high) if high_inclusive else (x < high)
+        return mask
+
+    return bounds
+
+
+def validate_rule(rule: Dict, fields: Optional[List[str]] = None) -> None:
+    """raises ValueError describing the first problem with a rule"""
+
+    name = rule.get("name")
+    if not name:
+        raise ValueError(f"rule without a name: {rule}")
+    if fields is not None and rule.get("field") not in fields:
+        raise ValueError(f"rule {name}: unknown field {rule.get('field')!r}")
+    if rule.get("aggregate") not in AGGREGATES:
+        raise ValueError(f"rule {name}: aggregate must be one of {sorted(AGGREGATES)}")
+
+    for piece in rule.get("pieces", []):
+        if ("score" in piece) == ("curve" in piece):
+            raise ValueError(f"rule {name}: each piece needs either a score or a curve")
+        if "curve" in piece:
+            if piece["curve"] not in CURVES:
+                raise ValueError(f"rule {name}: curve must be one of {sorted(CURVES)}")
+            if not piece.get("scale") or "points" not in piece:
+                raise ValueError(f"rule {name}: curves need points & a non-zero scale")
+
+
+class CompiledRule:
+    """Kernel scoring a single rule over columns of a batch of stocks"""
+
+    def __init__(self, rule: Dict):
+        self.name = rule["name"]
+        self.field = rule["field"]
+        self.aggregate = rule["aggregate"]
+        self.weight = rule.get("weight", 1)
+        self.missing = rule.get("missing", 0)
+        self.default = rule.get("default", 0)
+        self.pieces = [(compile_bounds(piece), compile_piece(piece)) for piece in rule.get("pieces", [])]
+
+
+    def __call__(self, columns: Dict[str, Dict[str, np.ndarray]]) -> np.ndarray:
+        x = aggregate(columns, self.field, self.aggregate)
+        defined = ~np.isnan(x)
+
+        # curves are evaluated for every stock, so overflow outside their bounds is discarded
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            conditions = [~defined] + [defined & bounds(x) for bounds, _ in self.pieces]
+            choices = [self.missing] + [curve(x) for _, curve in self.pieces]
+            return np.select(conditions, choices, default=self.default)
+
+
+class CompiledSpec:
+    """
+    Spec compiled to a kernel per rule. Scores are integers (as curves are truncated)
+    unless a weight or fixed score of the spec is fractional.
+    """
+
+    def __init__(self, spec: List[Dict], fields: Optional[List[str]] = None):
+        for rule in spec:
+            validate_rule(rule, fields)
+
+        names = [rule["name"] for rule in spec]
+        if len(set(names)) != len(names):
+            raise ValueError(f"rule names must be unique: {names}")
+
+        self.spec = spec
+        self.hash = spec_hash(spec)
+        self.rules = [CompiledRule(rule) for rule in spec]
+        self.fields = sorted({rule.field for rule in self.rules})
+
+        constants = [
+            value for rule in spec
+            for value in [rule.get("weight", 1), rule.get("missing", 0), rule.get("default", 0)]
+            + [piece["score"] for piece in rule.get("pieces", []) if "score" in piece]
+        ]
+        self.dtype = np.int64 if all(float(value).is_integer() for value in constants) else np.float64
+
+
+    def scores(self, columns: Dict[str, Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """unweighted scores of every rule, by rule name"""
+        return {rule.name: rule(columns).astype(self.dtype) for rule in self.rules}
+
+
+    def total(self, columns: Dict[str, Dict[str, np.ndarray]], scores: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """weighted sum of the scores of every rule"""
+
+        scores = scores or self.scores(columns)
+        # columns may be of any shape, such as stocks x dates in a backtest
+        shape = next(iter(columns["count"].values())).shape
+        total = np.zeros(shape, dtype=self.dtype)
+
+        for rule in self.rules:
+            total += (rule.weight * scores[rule.name]).astype(self.dtype)
+
+        return total
+
+
+def compile_spec(spec: List[Dict], fields: Optional[List[str]] = None) -> CompiledSpec:
+    """
+    compiled kernels for a spec, reused for any spec with the same hash.
+    Raises ValueError if the spec is invalid, or uses fields other than those given.
+    """
+
+    key = spec_hash([spec, fields])
+    if key not in _COMPILED:
+        _COMPILED[key] = CompiledSpec(spec, fields)
+
+    return _COMPILED[key]
@@ -0,0 +1,73 @@
+"""
+State shared between functions through the blob store, for stores otherwise held in a local SQLite file,
+which separate Lambda functions (and concurrent invocations of one) can't share.
+
+The state of each store is a snapshot of its rows, plus chunks of events appended by any number of writers
+(each invocation writing chunks of its own, so writers never conflict). Readers load the snapshot and replay
+the events on top. A single writer per run (stock_list, which starts every run) compacts the events into
+a new snapshot, deleting them.
+"""
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from screener import blobstore
+
+SNAPSHOT = "snapshot.ndjson.gz"
+EVENTS = "events"
+
+
+class SharedState:
+    """snapshot & event chunks of a store, under prefix of a blob store"""
+
+    def __init__(self, store: blobstore.BlobStore, prefix: str):
+        self.store = store
+        self.prefix = prefix.strip("/")
+
+
+    def load(self) -> Tuple[List[Dict], List[Dict], List[str]]:
+        """rows of the snapshot (empty if none), events in the order they happened & the keys of their chunks"""
+
+        keys = self.store.list(self.prefix)
+        snapshot = f"{self.prefix}/{SNAPSHOT}"
+        rows = list(blobstore.read_chunk(self.store, snapshot)) if snapshot in keys else []
+
+        chunks = [key for key in keys if key.startswith(f"{self.prefix}/{EVENTS}/")]
+        events = [event for key in chunks for event in blobstore.read_chunk(self.store, key)]
+
+        return rows, sorted(events, key=lambda event: event["at"]), chunks
+
+
+    def append(self, events: List[Dict]) -> None:
+        """writes events (each with the time it happened, "at") as a new chunk"""
+
+        if events:
+            key = f"{self.prefix}/{EVENTS}/{time.time_ns()}-{uuid.uuid4().hex}.ndjson.gz"
+            self.store.put(key, blobstore.encode_chunk(events))
+
+
+    def compact(self, rows: Iterable[Dict], chunks: List[str]) -> None:
+        """replaces the snapshot with rows, then deletes the event chunks replayed into them"""
+
+        self.store.put(f"{self.prefix}/{SNAPSHOT}", blobstore.encode_chunk(list(rows)))
+
+        for key in chunks:
+            self.store.delete(key)
+
+
+def from_environment(name: str) -> Optional[SharedState]:
+    """shared state of the store name under STATE_URI if set, otherwise returns None"""
+
+    uri = os.environ.get("STATE_URI")
+
+    if not uri:
+        return None
+
+    return SharedState(blobstore.open_store(uri), name)
+
+
+def local_path(name: str) -> str:
+    """path of the local SQLite file of a store held in shared state, where none is configured"""
+    return os.path.join(tempfile.gettempdir(), f"{name}.db")
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import module without executing it until an attribute is first accessed,
+    moving the cost of heavy imports out of the cold start of handlers which may not use them
+    """
+
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return module
+
+
+def typechecking_enabled() -> bool:
+    """runtime type checks are on unless TYPECHECKS is set to false, as it should be in production"""
+    return os.environ.get("TYPECHECKS", "true").lower() not in ("false", "0", "no")
+
+
+def typechecked(func):
+    """applies typeguard runtime type checks to func, unless disabled by the TYPECHECKS environment variable"""
+
+    if not typechecking_enabled():
+        return func
+
+    from typeguard import typechecked as typeguard_typechecked
+
+    return typeguard_typechecked(func)
@@ -0,0 +1,230 @@
+"""
+Resolution of the yahoo symbol of each stock, where that guessed from its Freetrade symbol is unknown to yahoo.
+
+Plausible variants of the guess (share classes, dot vs dash, alternative exchange suffixes) are probed
+concurrently, and the most plausible holding data is confirmed against the stock's ISIN, so later runs
+fetch it directly without probing again.
+
+Deployed, confirmed symbols are shared between invocations of stock_data through the blob store
+(see screener.shared): each invocation loads those confirmed by every other & appends its own,
+with stock_list compacting them at the start of each run.
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from screener import shared
+
+# exchange suffixes of stock_list.MIC_REFERENCE, with other yahoo suffixes listing the same stocks
+ALTERNATIVE_SUFFIXES = {
+    ".L": [".IL"],
+    ".DE": [".F"],
+    ".HE": [],
+    ".LS": [],
+    ".AS": [],
+    ".BR": [],
+    ".VI": [],
+    ".ST": [],
+}
+SHARE_CLASSES = "AB"
+SEPARATORS = "-."
+MAX_VARIANTS = 8
+MAX_WORKERS = 8
+
+
+def split_suffix(symbol: str) -> Tuple[str, str]:
+    """symbol without its exchange suffix, and the suffix ("" for US listings)"""
+
+    for suffix in ALTERNATIVE_SUFFIXES:
+        if symbol.endswith(suffix) and len(symbol) > len(suffix):
+            return symbol[:-len(suffix)], suffix
+
+    return symbol, ""
+
+
+def share_class_variants(base: str) -> List[str]:
+    """base with its share class written each way yahoo may list it, or with a class added if it has none"""
+
+    if len(base) > 2 and base[-2] in SEPARATORS:
+        stem, share_class = base[:-2], base[-1]
+    elif len(base) > 1 and base[-1] in SHARE_CLASSES:
+        stem, share_class = base[:-1], base[-1]
+    else:
+        return [base] + [base + "-" + share_class for share_class in SHARE_CLASSES]
+
+    return [base] + [stem + separator + share_class for separator in SEPARATORS] + [stem + share_class, stem]
+
+
+def variants(symbol: str, max_variants: int = MAX_VARIANTS) -> List[str]:
+    """plausible alternatives to a yahoo symbol, most plausible first (those on the same exchange)"""
+
+    base, suffix = split_suffix(symbol)
+    suffixes = [suffix] + ALTERNATIVE_SUFFIXES.get(suffix, [])
+
+    candidates = []
+    for alternative in suffixes:
+        for variant in share_class_variants(base):
+            candidate = variant + alternative
+            if candidate != symbol and candidate not in candidates:
+                candidates.append(candidate)
+
+    return candidates[:max_variants]
+
+
+class SymbolResolver:
+    """
+    Local SQLite store of the yahoo symbol confirmed for each ISIN, against the symbol guessed for it
+    when confirmed, so a changed guess (such as a new Freetrade symbol) is tried again first.
+    Counts probes, and stocks resolved & left unresolved. With shared state, symbols confirmed &
+    forgotten are also appended to it as events when resolved, and sync loads those of every writer.
+    """
+
+    def __init__(self, path: str, max_workers: int = MAX_WORKERS, state: Optional[shared.SharedState] = None):
+        self.max_workers = max_workers
+        self.state = state
+        self.pending: List[Dict] = []
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.stats = {"probes": 0, "resolved": 0, "unresolved": 0}
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS symbols ("
+                "isin TEXT PRIMARY KEY, guess TEXT, symbol TEXT, confirmed_at REAL)"
+            )
+
+
+    def get(self, isin: str, guess: str) -> Optional[str]:
+        """symbol confirmed for isin while guess was unchanged, or None"""
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT symbol FROM symbols WHERE isin = ? AND guess = ?", (isin, guess)
+            ).fetchone()
+
+        return row[0] if row else None
+
+
+    def put(self, isin: str, guess: str, symbol: str) -> None:
+        self.apply({"isin": isin, "guess": guess, "symbol": symbol, "at": time.time()})
+
+
+    def forget(self, isin: str) -> None:
+        self.apply({"isin": isin, "guess": None, "symbol": None, "at": time.time()})
+
+
+    def apply(self, event: Dict, share: bool = True) -> None:
+        """confirms the symbol of an event, or forgets the ISIN if it has none, queueing it to share"""
+
+        with self.lock, self.connection:
+            if event["symbol"] is None:
+                self.connection.execute("DELETE FROM symbols WHERE isin = ?", (event["isin"],))
+            else:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO symbols VALUES (:isin, :guess, :symbol, :at)", event
+                )
+
+            if share and self.state is not None:
+                self.pending.append(event)
+
+
+    def flush(self) -> None:
+        """appends the events queued since the last flush to the shared state"""
+
+        if self.state is not None:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            self.state.append(pending)
+
+
+    def sync(self, compact: bool = False) -> None:
+        """
+        replaces the local database with the shared state, applying the events appended by every writer
+        since it was last compacted, then compacts it if compact (as only a single writer should)
+        """
+
+        if self.state is None:
+            return
+
+        rows, events, chunks = self.state.load()
+
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM symbols")
+            self.connection.executemany(
+                "INSERT INTO symbols VALUES (:isin, :guess, :symbol, :confirmed_at)", rows
+            )
+
+        for event in events:
+            self.apply(event, share=False)
+
+        if compact:
+            with self.lock:
+                rows = self.connection.execute("SELECT isin, guess, symbol, confirmed_at FROM symbols").fetchall()
+
+            self.state.compact(
+                [dict(zip(["isin", "guess", "symbol", "confirmed_at"], row)) for row in rows], chunks
+            )
+
+
+    def symbol(self, isin: str, guess: str) -> str:
+        """symbol to fetch for a stock: that confirmed for it if any, otherwise the guess"""
+        return self.get(isin, guess) or guess
+
+
+    def resolve(self, stocks: List[Tuple[str, str, str]], probe: Callable[[str], bool]) -> List[Optional[str]]:
+        """
+        Resolves (isin, guess, failed) stocks, where failed is the symbol yahoo did not know
+        (the guess, or a symbol confirmed previously), returning the symbol confirmed for each
+        or None if no variant exists. Every variant of every stock is probed at once, with probe
+        returning whether yahoo holds data for a symbol (probes raising count as not).
+        """
+
+        candidates = [
+            [symbol for symbol in [guess] + variants(guess) if symbol != failed]
+            for _, guess, failed in stocks
+        ]
+        unique = list(dict.fromkeys(symbol for symbols in candidates for symbol in symbols))
+
+        def exists(symbol):
+            try:
+                return probe(symbol)
+            except Exception:
+                return False
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            found: Dict[str, bool] = dict(zip(unique, executor.map(exists, unique)))
+
+        self.stats["probes"] += len(unique)
+
+        resolved = []
+        for (isin, guess, _), symbols in zip(stocks, candidates):
+            symbol = next((symbol for symbol in symbols if found[symbol]), None)
+
+            if symbol is None:
+                self.forget(isin)
+                self.stats["unresolved"] += 1
+            else:
+                self.put(isin, guess, symbol)
+                self.stats["resolved"] += 1
+
+            resolved.append(symbol)
+
+        self.flush()
+        return resolved
+
+
+def from_environment() -> Optional[SymbolResolver]:
+    """
+    creates resolver if SYMBOL_MAP_PATH or STATE_URI is set (shared through STATE_URI if set,
+    in a temporary file unless SYMBOL_MAP_PATH is also set), otherwise returns None
+    """
+
+    path = os.environ.get("SYMBOL_MAP_PATH")
+    state = shared.from_environment("symbols")
+
+    if not path and state is None:
+        return None
+
+    return SymbolResolver(path or shared.local_path("symbols"), state=state)
@@ -0,0 +1,154 @@
+import calendar
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# point-in-time fields, where only the latest point stored is current (earlier points are kept as history)
+SNAPSHOT_PREFIXES = ("trailing",)
+# annual points a fresh yahoo fetch returns (the last 4 fiscal years), which responses are trimmed to
+# so they score as a fresh fetch would (older points are kept as history)
+ANNUAL_POINTS = 4
+ANNUAL_PREFIX = "annual"
+
+
+def date_to_timestamp(as_of_date: str) -> int:
+    """convert yahoo asOfDate (YYYY-MM-DD) to integer UTC timestamp"""
+    return calendar.timegm(dt.date.fromisoformat(as_of_date).timetuple())
+
+
+class TimeseriesStore:
+    """
+    Local SQLite store of yahoo timeseries points, keyed by symbol, field & asOfDate,
+    allowing repeat runs to download only points newer than those already stored.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS points ("
+                "symbol TEXT, field TEXT, as_of_date TEXT, timestamp INTEGER, point TEXT, "
+                "PRIMARY KEY (symbol, field, as_of_date))"
+            )
+
+
+    def latest(self, symbol: str, fields: List[str]) -> Optional[int]:
+        """
+        timestamp of the most recent point held for every field,
+        or None if any field has no stored points (requiring a full download)
+        """
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT field, MAX(timestamp) FROM points WHERE symbol = ? "
+                f"AND field IN ({','.join('?' * len(fields))}) GROUP BY field",
+                (symbol, *fields)
+            ).fetchall()
+
+        if len(rows) < len(set(fields)):
+            return None
+
+        return min(timestamp for _, timestamp in rows)
+
+
+    def symbols(self) -> List[str]:
+        """every symbol with stored points"""
+
+        with self.lock:
+            rows = self.connection.execute("SELECT DISTINCT symbol FROM points ORDER BY symbol").fetchall()
+
+        return [symbol for symbol, in rows]
+
+
+    def points(self, fields: List[str]) -> Iterator[Tuple[str, str, int, float]]:
+        """(symbol, field, timestamp, value) of every stored point of fields (including past snapshots), in a single scan"""
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT symbol, field, timestamp, point FROM points "
+                f"WHERE field IN ({','.join('?' * len(fields))}) ORDER BY symbol, field, as_of_date",
+                fields
+            ).fetchall()
+
+        for symbol, field, timestamp, point in rows:
+            yield symbol, field, timestamp, json.loads(point)['reportedValue']['raw']
+
+
+    def merge(self, symbol: str, json_response: Dict) -> None:
+        """add points from yahoo json response, replacing any stored with the same asOfDate"""
+
+        with self.lock, self.connection:
+            for result in json_response['timeseries']['result']:
+                field = result['meta']['type'][0]
+                points = [point for point in result.get(field, []) if point is not None]
+
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (symbol, field, point['asOfDate'],
+                         date_to_timestamp(point['asOfDate']), json.dumps(point))
+                        for point in points
+                    ]
+                )
+
+
+    def response(self, symbol: str, fields: List[str]) -> Dict:
+        """
+        rebuild yahoo-style json response from stored points, ordered by asOfDate, holding only
+        the points a fresh fetch would return: the latest of snapshot fields (see SNAPSHOT_PREFIXES)
+        & the latest ANNUAL_POINTS of annual fields
+        """
+
+        results = []
+        for field in fields:
+
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT timestamp, point FROM points WHERE symbol = ? AND field = ? ORDER BY as_of_date",
+                    (symbol, field)
+                ).fetchall()
+
+            if not rows:
+                continue
+
+            if field.startswith(SNAPSHOT_PREFIXES):
+                rows = rows[-1:]
+            elif field.startswith(ANNUAL_PREFIX):
+                rows = rows[-ANNUAL_POINTS:]
+
+            results.append({
+                "meta": {"symbol": [symbol], "type": [field]},
+                "timestamp": [timestamp for timestamp, _ in rows],
+                field: [json.loads(point) for _, point in rows],
+            })
+
+        return {"timeseries": {"result": results, "error": None}}
+
+
+    def update(self, symbol: str, fields: List[str], download: Callable[[Optional[int]], Dict]) -> Dict:
+        """
+        Calls download with the start timestamp of points not yet stored (None for full history),
+        merges in the downloaded points and returns the complete response.
+        """
+
+        latest = self.latest(symbol, fields)
+        since = None if latest is None else latest + 1
+
+        self.merge(symbol, download(since))
+
+        return self.response(symbol, fields)
+
+
+def from_environment() -> Optional[TimeseriesStore]:
+    """creates store if TIMESERIES_STORE_PATH is set, otherwise returns None"""
+
+    path = os.environ.get("TIMESERIES_STORE_PATH")
+
+    if not path:
+        return None
+
+    return TimeseriesStore(path)
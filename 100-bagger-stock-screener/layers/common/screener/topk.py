@@ -0,0 +1,149 @@
+"""
+Streaming aggregate of the scored records of a run, passed between states in place of the records themselves.
+
+Each batch (or shard) of stock_data aggregates its own records, and stock_email merges the aggregates of every
+shard with the stocks & failed shards caught by the state machine:
+
+    {
+        "k": 25,                            # records kept
+        "top": [...],                       # the k highest scoring records, highest first
+        "successes": 480,                   # stocks scored
+        "failures": 20,                     # stocks which could not be scored
+        "histogram": {"0": 130, ...},       # stocks scored by bin of scores, labelled by its lower bound
+        "reasons": {"HTTPError": 12, ...},  # failures by reason, for the first few reasons seen
+    }
+
+Only the top k and the counts are held, so an aggregate is the same size however many stocks it covers.
+"""
+import heapq
+import itertools
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+TOP_K = 25
+SCORE_KEY = "Total score"
+# width of the score histogram bins, labelled by their lower bound
+BIN_WIDTH = 10
+# distinct reasons of failure counted, with failures of any other reason counted as OTHER_REASON
+MAX_REASONS = 10
+OTHER_REASON = "other"
+UNKNOWN_REASON = "unknown"
+
+
+def error_reason(error: Optional[Dict]) -> str:
+    """
+    reason of a failure, from the error of a batch ({Ticker, ISIN, Error}: the repr of the exception raised),
+    or the error caught by the state machine ({..., error: {Error, Cause}}): the exception's name
+    """
+
+    if error and isinstance(error.get("error"), dict):
+        error = error["error"]
+
+    if not error or not error.get("Error"):
+        return UNKNOWN_REASON
+
+    return str(error["Error"]).split("(")[0]
+
+
+class TopK:
+    """
+    Streaming aggregate of scored records, holding only the k highest scoring records (in a min heap),
+    alongside counts of successes & failures (by reason, see error_reason) and a histogram of all scores.
+    Aggregates of separate shards can be merged, as the top k overall are within the union of each top k.
+    """
+
+    def __init__(self, k: int = TOP_K, key: str = SCORE_KEY, bin_width: int = BIN_WIDTH):
+        self.k = k
+        self.key = key
+        self.bin_width = bin_width
+        self.heap: List = []
+        self.successes = 0
+        self.failures = 0
+        self.histogram = Counter()
+        self.reasons = Counter()
+        # breaks ties between equal scores in order of arrival, never comparing records
+        self.counter = itertools.count()
+
+
+    def add(self, record: Dict) -> None:
+        score = record[self.key]
+        self.successes += 1
+        self.histogram[int(score // self.bin_width * self.bin_width)] += 1
+        self._push(score, record)
+
+
+    def _push(self, score, record: Dict) -> None:
+        entry = (score, -next(self.counter), record)
+
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+
+
+    def add_error(self, error: Optional[Dict] = None, count: int = 1) -> None:
+        self.failures += count
+        self._count_reason(error_reason(error), count)
+
+
+    def _count_reason(self, reason: str, count: int) -> None:
+        distinct = len(self.reasons) - (OTHER_REASON in self.reasons)
+        if reason not in self.reasons and reason != OTHER_REASON and distinct >= MAX_REASONS:
+            reason = OTHER_REASON
+        self.reasons[reason] += count
+
+
+    def update(self, records: Iterable[Dict] = (), errors: Iterable[Dict] = ()) -> "TopK":
+        for record in records:
+            self.add(record)
+        for error in errors:
+            self.add_error(error)
+        return self
+
+
+    def merge(self, other: "TopK") -> "TopK":
+        """combine aggregate of another shard into this one"""
+
+        for score, _, record in sorted(other.heap, reverse=True):
+            self._push(score, record)
+
+        self.successes += other.successes
+        self.failures += other.failures
+        self.histogram.update(other.histogram)
+        for reason, count in other.reasons.items():
+            self._count_reason(reason, count)
+
+        return self
+
+
+    def top(self) -> List[Dict]:
+        """top k records, highest scoring first"""
+        return [record for _, _, record in sorted(self.heap, reverse=True)]
+
+
+    def to_dict(self) -> Dict:
+        """JSON serialisable aggregate, to pass between states"""
+
+        return {
+            "k": self.k,
+            "top": self.top(),
+            "successes": self.successes,
+            "failures": self.failures,
+            "histogram": {str(low): count for low, count in sorted(self.histogram.items())},
+            "reasons": dict(self.reasons.most_common()),
+        }
+
+
+    @classmethod
+    def from_dict(cls, data: Dict, key: str = SCORE_KEY, bin_width: int = BIN_WIDTH) -> "TopK":
+        aggregate = cls(data["k"], key, bin_width)
+
+        for record in data["top"]:
+            aggregate._push(record[key], record)
+
+        aggregate.successes = data["successes"]
+        aggregate.failures = data["failures"]
+        aggregate.histogram = Counter({int(low): count for low, count in data["histogram"].items()})
+        aggregate.reasons = Counter(data["reasons"])
+
+        return aggregate
@@ -0,0 +1,158 @@
+"""
+Lean parsing of raw yahoo fundamentals-timeseries responses into compact typed arrays:
+a single array of float64 values & the raw dates of every point per response, dropping everything else.
+
+Rather than decoding the whole response into nested dicts & lists, the raw bytes are split at the "type"
+of each result and the asOfDate & reportedValue.raw of every point are extracted with a regex each
+(a few passes over the bytes, all in C, with nothing built but the values & dates kept). Responses laid out
+other than yahoo's (meta before points, every point with a date & value), or with null points or a field
+missing, are decoded instead. Either way, a response Score.transform_input fails on fails the same in data().
+"""
+import itertools
+import json
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+TYPE_KEY = b'"type"'
+DATE_KEY = b'"asOfDate"'
+SECONDS_PER_DAY = 86400
+FIELD = re.compile(rb'\s*:\s*\[\s*"(\w+)"')
+POINTS = re.compile(rb'\s*:\s*\[')
+# a null element of a points array (points hold no arrays, so a null within a point follows a colon)
+NULL_POINT = re.compile(rb'[\[,]\s*null\s*[,\]]')
+DATE = re.compile(rb'"asOfDate"\s*:\s*"(\d{4}-\d{2}-\d{2})"')
+RAW = re.compile(rb'"raw"\s*:\s*(-?[0-9][0-9.eE+-]*)')
+
+
+class Timeseries:
+    """
+    Points of a yahoo timeseries response in date order within each field, as float64 values
+    in a single array & their dates as concatenated YYYY-MM-DD bytes (converted only when needed),
+    with the points of fields[i] between offsets[i] & offsets[i + 1]. Null points are dropped,
+    with the error Score.transform_input raises on them (or on a field missing) kept as invalid.
+    """
+
+    def __init__(
+        self,
+        fields: List[str],
+        values: array,
+        dates: bytes,
+        offsets: List[int],
+        invalid: Optional[Exception] = None,
+    ):
+        self.fields = fields
+        self.values = values
+        self.dates = dates
+        self.offsets = offsets
+        self.invalid = invalid
+
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """UTC timestamps (int64) of every point"""
+
+        days = np.frombuffer(self.dates, dtype="S10").astype("datetime64[D]")
+        return days.astype(np.int64) * SECONDS_PER_DAY
+
+
+    def field(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """timestamps & values of a field (empty if missing)"""
+
+        values = np.frombuffer(self.values, dtype=np.float64) if self.values else np.array([], dtype=np.float64)
+
+        if name not in self.fields:
+            return self.timestamps[:0], values[:0]
+
+        i = self.fields.index(name)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.timestamps[start:end], values[start:end]
+
+
+    def data(self) -> Dict[str, array]:
+        """values of each field, as Score.transform_input (raising as it would on null points or a field missing)"""
+
+        if self.invalid is not None:
+            raise self.invalid
+
+        bounds = self.offsets
+        return {field: self.values[start:end] for field, start, end in zip(self.fields, bounds, bounds[1:])}
+
+
+    @classmethod
+    def build(
+        cls,
+        fields: List[str],
+        values: array,
+        dates: bytes,
+        counts: List[int],
+        invalid: Optional[Exception] = None,
+    ) -> "Timeseries":
+        """from the value & date of every point, with the number of points of each field"""
+        return cls(fields, values, dates, [0, *itertools.accumulate(counts)], invalid)
+
+
+    @classmethod
+    def from_json(cls, json_response: Dict) -> "Timeseries":
+        """from a decoded yahoo json response, skipping null points"""
+
+        fields, dates, values, counts, invalid = [], [], array("d"), [], None
+        for result in json_response['timeseries']['result'] or []:
+            field = result['meta']['type'][0]
+
+            # as raised by Score.transform_input, for the first result it fails on
+            if invalid is None and field not in result:
+                invalid = KeyError(field)
+            elif invalid is None and (result[field] is None or None in result[field]):
+                invalid = TypeError(f"null points of {field}")
+
+            points = [point for point in result.get(field) or [] if point is not None]
+
+            fields.append(field)
+            dates.extend(point['asOfDate'].encode() for point in points)
+            values.extend(float(point['reportedValue']['raw']) for point in points)
+            counts.append(len(points))
+
+        return cls.build(fields, values, b"".join(dates), counts, invalid)
+
+
+def scan(content: bytes) -> Timeseries:
+    """Timeseries of a raw yahoo json response, without decoding it where laid out as yahoo's"""
+
+    segments = content.split(TYPE_KEY)
+    if DATE_KEY in segments[0]:
+        return Timeseries.from_json(json.loads(content))
+
+    fields, counts = [], []
+    for segment in segments[1:]:
+        match = FIELD.match(segment)
+        if match is None:
+            return Timeseries.from_json(json.loads(content))
+
+        # points lie within the array of their field (points hold no arrays), after its type
+        field = match.group(1)
+        start = segment.find(b'"' + field + b'"', match.end())
+        points = POINTS.match(segment, start + len(field) + 2) if start >= 0 else None
+        end = segment.find(b']', points.end()) if points else -1
+        if end < 0 or NULL_POINT.search(segment, points.end() - 1, end + 1):
+            return Timeseries.from_json(json.loads(content))
+
+        start = points.end()
+
+        fields.append(field.decode())
+        counts.append(segment.count(DATE_KEY, start, end))
+
+    # with every point within the array of its field, matches are in the order of fields
+    # (a date outside of them is matched too, so any there makes the counts differ)
+    dates, values = DATE.findall(content), RAW.findall(content)
+    points = sum(counts)
+    if len(dates) != points or len(values) != points:
+        return Timeseries.from_json(json.loads(content))
+
+    return Timeseries.build(fields, array("d", map(float, values)), b"".join(dates), counts)
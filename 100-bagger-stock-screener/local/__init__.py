@@ -0,0 +1,10 @@
+"""Tooling for running and measuring the stock screener functions outside of AWS"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER = os.path.join(ROOT, "layers", "common")
+
+# the common layer is on the path of every function in Lambda, so is made importable here too
+if LAYER not in sys.path:
+    sys.path.append(LAYER)
@@ -0,0 +1,282 @@
+"""
+Backtests the scoring rules over the history of the stored fundamentals, to check whether
+high scores actually go on to be 100-baggers.
+
+Every point of the timeseries store is placed on a grid of dates (the end of every --step months),
+forming dense stocks x dates x fields arrays. The series as they stood at each date are rebuilt
+with cumulative array operations and scored with the rules of SCORE_SPEC (or --spec), so every
+stock is scored as of every date at once. Scores are then compared with the growth in market cap
+over the following --horizon years.
+
+    python -m local.backtest --timeseries <timeseries.db> [--step 3] [--horizon 10] [--top 0.1]
+"""
+import argparse
+import datetime as dt
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from functions.stock_data import app as stock_data
+from screener import rules, timeseries
+
+MARKET_CAP = "trailingMarketCap"
+STEP = 3
+HORIZON = 10
+TOP = 0.1
+BAGGER = 100
+
+
+def points_from_responses(responses: Dict[str, Dict]) -> Iterable[Tuple[str, str, int, float]]:
+    """(symbol, field, timestamp, value) of every point of raw yahoo json responses, by symbol"""
+
+    for symbol, json_response in responses.items():
+        for result in json_response['timeseries']['result']:
+            field = result['meta']['type'][0]
+            for timestamp, point in zip(result['timestamp'], result.get(field, [])):
+                if point is not None:
+                    yield symbol, field, timestamp, point['reportedValue']['raw']
+
+
+def date_grid(start: np.datetime64, end: np.datetime64, step: int = STEP) -> np.ndarray:
+    """last day of every step months, from the period holding start to that holding end"""
+
+    months = np.arange(start.astype("datetime64[M]"), end.astype("datetime64[M]") + 1, step)
+    return (months + step).astype("datetime64[D]") - 1
+
+
+class Tensor:
+    """
+    Points of every stock & field on a grid of dates: the last value reported in each period,
+    alongside the number & sum of points, as (stocks, dates, fields) arrays,
+    and the first value of each stock & field with the period it was reported in.
+    """
+
+    def __init__(self, points: Iterable[Tuple[str, str, int, float]], fields: List[str] = stock_data.FIELDS, step: int = STEP):
+        self.fields = fields
+        field_index = {field: i for i, field in enumerate(fields)}
+
+        stock_index = {}
+        stock_ids, field_ids, timestamps, values = [], [], [], []
+        for symbol, field, timestamp, value in points:
+            if field in field_index and value is not None:
+                stock_ids.append(stock_index.setdefault(symbol, len(stock_index)))
+                field_ids.append(field_index[field])
+                timestamps.append(timestamp)
+                values.append(value)
+
+        self.symbols = list(stock_index)
+        stock = np.array(stock_ids, dtype=np.int64)
+        field = np.array(field_ids, dtype=np.int64)
+        days = np.array(timestamps, dtype="datetime64[s]").astype("datetime64[D]")
+        value = np.array(values, dtype=np.float64)
+
+        self.dates = date_grid(days.min(), days.max(), step) if len(days) else np.array([], dtype="datetime64[D]")
+        shape = (len(self.symbols), len(self.dates), len(fields))
+        size = shape[0] * shape[1] * shape[2]
+
+        # points in date order within each stock & field, each in the first period ending on or after it
+        order = np.lexsort((days, field, stock))
+        stock, field, days, value = stock[order], field[order], days[order], value[order]
+        period = np.searchsorted(self.dates, days)
+        key = (stock * shape[1] + period) * shape[2] + field
+
+        self.count = np.bincount(key, minlength=size).reshape(shape)
+        self.sum = np.bincount(key, weights=value, minlength=size).reshape(shape)
+
+        # last point of each period, as the last occurrence of its key
+        _, reversed_index = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - reversed_index
+        self.last = np.full(shape, np.nan)
+        self.last[stock[last], period[last], field[last]] = value[last]
+
+        # first point of each stock & field
+        _, first = np.unique(stock * shape[2] + field, return_index=True)
+        self.first = np.full(shape[::2], np.nan)
+        self.first_period = np.full(shape[::2], shape[1], dtype=np.int64)
+        self.first[stock[first], field[first]] = value[first]
+        self.first_period[stock[first], field[first]] = period[first]
+
+
+    def as_of(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        columns (as rules.to_columns) of the series as they stood at each date, as (stocks, dates) arrays.
+        Snapshot fields (see timeseries.SNAPSHOT_PREFIXES) hold only their latest point, as responses rebuilt from the store.
+        """
+
+        periods = np.arange(len(self.dates))
+        columns = {"first": {}, "last": {}, "count": {}, "sum": {}}
+
+        for i, field in enumerate(self.fields):
+            last = forward_fill(self.last[:, :, i])
+            count = np.cumsum(self.count[:, :, i], axis=1)
+
+            if field.startswith(timeseries.SNAPSHOT_PREFIXES):
+                first, count, total = last, np.minimum(count, 1), last
+            else:
+                reported = periods >= self.first_period[:, i, None]
+                first = np.where(reported, self.first[:, i, None], np.nan)
+                total = np.cumsum(self.sum[:, :, i], axis=1)
+
+            # fields not yet reported are zero with no points, as in rules.to_columns
+            columns["first"][field] = np.nan_to_num(first)
+            columns["last"][field] = np.nan_to_num(last)
+            columns["count"][field] = count
+            columns["sum"][field] = np.nan_to_num(total)
+
+        return columns
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """carry the last non NaN value of each row forward along the columns"""
+
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return values[np.arange(values.shape[0])[:, None], index]
+
+
+def score(tensor: Tensor, spec: Optional[List[Dict]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """total scores of every stock as of every date, and whether every field had been reported by then"""
+
+    compiled = stock_data.SCORE_RULES if spec is None else rules.compile_spec(spec, stock_data.FIELDS)
+    columns = tensor.as_of()
+
+    valid = np.logical_and.reduce([columns["count"][field] > 0 for field in stock_data.FIELDS])
+    return compiled.total(columns), valid
+
+
+def rankdata(values: np.ndarray) -> np.ndarray:
+    """ranks from 1, with ties given their average rank"""
+
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    start = np.cumsum(counts) - counts
+    return (start + (counts + 1) / 2)[inverse]
+
+
+def evaluate(
+    scores: np.ndarray,
+    valid: np.ndarray,
+    market_cap: np.ndarray,
+    dates: np.ndarray,
+    horizon: int,
+    top: float = TOP,
+    bagger: float = BAGGER,
+) -> List[Dict]:
+    """
+    For each date with horizon periods following it (and at least two stocks to compare),
+    the Spearman correlation of scores with growth in market cap over the horizon,
+    the median growth of the top fraction of stocks by score & of every stock,
+    and the number of stocks growing by bagger times, in total & within the top.
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = market_cap[:, horizon:] / market_cap[:, :-horizon]
+    measurable = valid[:, :-horizon] & np.isfinite(growth) & (market_cap[:, :-horizon] > 0)
+
+    periods = []
+    for d in range(growth.shape[1]):
+        mask = measurable[:, d]
+        n = int(mask.sum())
+        if n < 2:
+            continue
+
+        s, g = scores[mask, d], growth[mask, d]
+        top_n = max(1, int(np.ceil(top * n)))
+        selected = np.argsort(-s, kind="stable")[:top_n]
+        baggers = g >= bagger
+
+        periods.append({
+            "date": str(dates[d]),
+            "stocks": n,
+            "spearman": float(np.corrcoef(rankdata(s), rankdata(g))[0, 1]) if np.ptp(s) and np.ptp(g) else None,
+            "top_growth": float(np.median(g[selected])),
+            "median_growth": float(np.median(g)),
+            "baggers": int(baggers.sum()),
+            "top_baggers": int(baggers[selected].sum()),
+            "top_stocks": top_n,
+        })
+
+    return periods
+
+
+def backtest(
+    points: Iterable[Tuple[str, str, int, float]],
+    spec: Optional[List[Dict]] = None,
+    step: int = STEP,
+    horizon: int = HORIZON,
+    top: float = TOP,
+    bagger: float = BAGGER,
+) -> Dict:
+    """scores every stock as of every date & evaluates them against growth over horizon years"""
+
+    tensor = Tensor(points, stock_data.FIELDS, step)
+    scores, valid = score(tensor, spec)
+    market_cap = forward_fill(tensor.last[:, :, stock_data.FIELDS.index(MARKET_CAP)])
+
+    periods = evaluate(scores, valid, market_cap, tensor.dates, max(1, horizon * 12 // step), top, bagger)
+    return {"stocks": len(tensor.symbols), "dates": len(tensor.dates), "periods": periods, **summarise(periods)}
+
+
+def summarise(periods: List[Dict]) -> Dict:
+    """mean correlation across dates, and the share of baggers found in the top against chance"""
+
+    correlations = [period["spearman"] for period in periods if period["spearman"] is not None]
+    baggers = sum(period["baggers"] for period in periods)
+    top_baggers = sum(period["top_baggers"] for period in periods)
+    top_stocks = sum(period["top_stocks"] for period in periods)
+    stocks = sum(period["stocks"] for period in periods)
+
+    return {
+        "mean_spearman": float(np.mean(correlations)) if correlations else None,
+        "baggers": baggers,
+        "recall": top_baggers / baggers if baggers else None,
+        # how much more likely a top stock is to be a bagger than any stock
+        "lift": (top_baggers / top_stocks) / (baggers / stocks) if baggers else None,
+    }
+
+
+def report(result: Dict) -> str:
+    lines = [f"{'date':<11} {'stocks':>7} {'spearman':>9} {'top growth':>11} {'median':>7} {'baggers':>8} {'in top':>7}"]
+    for period in result["periods"]:
+        spearman = "" if period["spearman"] is None else f"{period['spearman']:.3f}"
+        lines.append(
+            f"{period['date']:<11} {period['stocks']:>7} {spearman:>9} {period['top_growth']:>11.2f} "
+            f"{period['median_growth']:>7.2f} {period['baggers']:>8} {period['top_baggers']:>7}"
+        )
+
+    def fmt(value):
+        return "n/a" if value is None else f"{value:.3f}"
+
+    lines.append(
+        f"{result['stocks']} stocks over {result['dates']} dates: mean spearman {fmt(result['mean_spearman'])}, "
+        f"{result['baggers']} baggers, recall {fmt(result['recall'])}, lift {fmt(result['lift'])}"
+    )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeseries", required=True, help="timeseries store database (TIMESERIES_STORE_PATH)")
+    parser.add_argument("--spec", help="JSON file of scoring rules, in place of the default SCORE_SPEC")
+    parser.add_argument("--step", type=int, default=STEP, help="months between dates")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="years of growth to evaluate scores against")
+    parser.add_argument("--top", type=float, default=TOP, help="fraction of stocks by score to evaluate")
+    parser.add_argument("--bagger", type=float, default=BAGGER, help="growth in market cap counted as a bagger")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    spec = None
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+
+    store = timeseries.TimeseriesStore(args.timeseries)
+    start = dt.datetime.now()
+    result = backtest(store.points(stock_data.FIELDS), spec, args.step, args.horizon, args.top, args.bagger)
+
+    print(report(result))
+    print(f"in {(dt.datetime.now() - start).total_seconds():.1f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,93 @@
+"""
+Measures the cold start import cost of each Lambda handler.
+
+Each handler module is imported in a fresh interpreter, laid out as in Lambda
+(function code plus the common layer on the path), with python -X importtime
+providing the breakdown by top-level package.
+
+    python -m local.coldstart [--repeat 5] [--top 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER = os.path.join(ROOT, "layers", "common")
+HANDLERS = {
+    "stock_list": os.path.join(ROOT, "functions", "stock_list"),
+    "stock_data": os.path.join(ROOT, "functions", "stock_data"),
+    "stock_email": os.path.join(ROOT, "functions", "stock_email"),
+}
+ENVIRONMENT = {
+    "TYPECHECKS": "false",
+    "POWERTOOLS_SERVICE_NAME": "coldstart",
+    "AWS_DEFAULT_REGION": "eu-west-2",
+}
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+print(",".join(sorted(name for name in sys.modules if "." not in name)))
+"""
+
+
+def measure(handler: str) -> Dict:
+    """
+    Import handler in a fresh interpreter, returning the import time in seconds,
+    the top-level modules loaded and the cumulative import time (seconds) of each module app imports
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([HANDLERS[handler], LAYER]), **ENVIRONMENT)
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        cwd=HANDLERS[handler], env=env, capture_output=True, text=True, check=True,
+    )
+
+    seconds, modules = process.stdout.strip().splitlines()[-2:]
+
+    # importtime lists nested imports (indented by depth) before the module importing them
+    packages, block = {}, {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+
+        if depth == 0:
+            if name.strip() == "app":
+                packages = block
+            block = {}
+        elif depth == 1:
+            block[name.strip()] = int(cumulative) / 1E6
+
+    return {"seconds": float(seconds), "modules": modules.split(","), "packages": packages}
+
+
+def report(handlers: List[str], repeat: int = 5, top: int = 10) -> str:
+    """measure each handler repeat times, reporting median import time & slowest top-level imports"""
+
+    lines = []
+    for handler in handlers:
+        runs = [measure(handler) for _ in range(repeat)]
+        median = statistics.median(run["seconds"] for run in runs)
+        lines.append(f"{handler}: {median * 1000:.1f} ms (median of {repeat})")
+
+        slowest = sorted(runs[-1]["packages"].items(), key=lambda item: item[1], reverse=True)[:top]
+        lines.extend(f"    {name:<30} {seconds * 1000:8.1f} ms" for name, seconds in slowest)
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("handlers", nargs="*", default=list(HANDLERS), help=f"any of {list(HANDLERS)}")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print(report(args.handlers, args.repeat, args.top))
@@ -0,0 +1,182 @@
+"""
+Rescores previously fetched fundamentals without any network access, so the effect of
+changes to the scoring rules can be seen in seconds rather than after a full scrape.
+
+Fundamentals are read from the history store (its most recent run, unless --run-date is given)
+or the timeseries store, scored in a single batch, ranked, and compared with the ranking of
+the scores stored alongside them, or of a previous rescore (--previous).
+
+    python -m local.rescore --history <dir> [--output ranked.json] [--top 20]
+    python -m local.rescore --timeseries <timeseries.db> --previous ranked.json
+    python -m local.rescore --history <dir> --spec rules.json
+
+--spec scores with the rules of a JSON spec (see screener.rules) in place of the default SCORE_SPEC.
+"""
+import argparse
+import datetime as dt
+import json
+from typing import Dict, List, Optional, Tuple
+
+from functions.stock_data import app as stock_data
+from screener import history, timeseries
+
+
+def load_history(root: str, run_date: Optional[dt.date] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    records (Ticker, ISIN & Total score as stored) & transformed yahoo series of every stock
+    in the run of run_date, or the most recent run
+    """
+
+    if run_date is None:
+        runs = history.run_dates(root)
+        if not runs:
+            return [], []
+        run_date = runs[-1]
+
+    # only the partition of the run & the columns scored are read
+    columns = ["ticker", "isin", "total_score", "timestamp", *stock_data.FIELDS]
+    table = history.read_history(root, columns=columns, start=run_date, end=run_date)
+
+    # a stock scored more than once in the run is taken from its latest scoring, by the timestamp
+    # stored with it (parts are named at random, so are read in no order of time)
+    latest = sorted(table.to_pylist(), key=lambda row: row.get("timestamp") or "")
+    rows = {row["ticker"]: row for row in latest}
+
+    records = [
+        {"Ticker": row["ticker"], "ISIN": row["isin"], "Total score": row["total_score"]}
+        for row in rows.values()
+    ]
+    data = [
+        {field: row[field] for field in stock_data.FIELDS if row.get(field) is not None}
+        for row in rows.values()
+    ]
+
+    return records, data
+
+
+def load_timeseries(path: str) -> Tuple[List[Dict], List[Dict]]:
+    """records (Ticker only, as no score is stored) & transformed yahoo series of every stock in the store"""
+
+    store = timeseries.TimeseriesStore(path)
+    records, data = [], []
+
+    for symbol in store.symbols():
+        records.append({"Ticker": symbol, "ISIN": None, "Total score": None})
+        data.append(stock_data.Score.transform_input(store.response(symbol, stock_data.FIELDS)))
+
+    return records, data
+
+
+def rank(records: List[Dict]) -> List[Dict]:
+    """records with a score, highest first (ties by Ticker), numbered by Rank"""
+
+    scored = sorted(
+        (record for record in records if record["Total score"] is not None),
+        key=lambda record: (-record["Total score"], record["Ticker"]),
+    )
+
+    return [dict(record, Rank=i + 1) for i, record in enumerate(scored)]
+
+
+def rescore(records: List[Dict], data: List[Dict], spec: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    score every stock in a single batch, with the rules of spec if given,
+    returning the ranked records of those with every field
+    """
+
+    batch = stock_data.BatchScore(data, spec)
+    scores = batch.get_total_score().tolist()
+
+    return rank([
+        dict(record, **{"Total score": score})
+        for record, score, valid in zip(records, scores, batch.valid.tolist())
+        if valid
+    ])
+
+
+def rank_diff(previous: List[Dict], current: List[Dict]) -> List[Dict]:
+    """
+    Change in rank & score of each stock between two rankings, in current rank order,
+    followed by stocks only in the previous ranking. Change is positive for stocks moving up.
+    """
+
+    before = {record["Ticker"]: record for record in rank(previous)}
+    diff = []
+
+    for record in current:
+        old = before.pop(record["Ticker"], None)
+        diff.append({
+            "Ticker": record["Ticker"],
+            "Rank": record["Rank"],
+            "Previous rank": old and old["Rank"],
+            "Change": old and old["Rank"] - record["Rank"],
+            "Total score": record["Total score"],
+            "Previous score": old and old["Total score"],
+        })
+
+    for old in before.values():
+        diff.append({
+            "Ticker": old["Ticker"],
+            "Rank": None,
+            "Previous rank": old["Rank"],
+            "Change": None,
+            "Total score": None,
+            "Previous score": old["Total score"],
+        })
+
+    return diff
+
+
+def report(diff: List[Dict], top: int = 20) -> str:
+    """top of the ranking with rank changes, and a summary of the changes overall"""
+
+    lines = [f"{'rank':>5} {'ticker':<12} {'score':>6} {'was':>6} {'change':>7}"]
+    for row in diff[:top]:
+        if row["Rank"] is None:
+            break
+        was = "new" if row["Previous rank"] is None else row["Previous rank"]
+        change = "" if row["Change"] is None else f"{row['Change']:+d}"
+        lines.append(f"{row['Rank']:>5} {row['Ticker']:<12} {row['Total score']:>6} {was:>6} {change:>7}")
+
+    ranked = [row for row in diff if row["Rank"] is not None]
+    moved = [row for row in ranked if row["Change"]]
+    lines.append(
+        f"{len(ranked)} stocks ranked, {len(moved)} changed rank, "
+        f"{sum(row['Previous rank'] is None for row in ranked)} new, "
+        f"{sum(row['Rank'] is None for row in diff)} dropped"
+    )
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--history", help="history store directory (HISTORY_PATH)")
+    source.add_argument("--timeseries", help="timeseries store database (TIMESERIES_STORE_PATH)")
+    parser.add_argument("--run-date", type=dt.date.fromisoformat, help="run of the history store to rescore")
+    parser.add_argument("--previous", help="ranking output by a previous rescore, to compare with")
+    parser.add_argument("--output", help="write the ranking to this JSON file")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--spec", help="JSON file of scoring rules, in place of the default SCORE_SPEC")
+    args = parser.parse_args()
+
+    records, data = load_history(args.history, args.run_date) if args.history else load_timeseries(args.timeseries)
+
+    if args.previous:
+        with open(args.previous) as f:
+            previous = json.load(f)
+    else:
+        previous = records
+
+    spec = None
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+
+    ranked = rescore(records, data, spec)
+    print(report(rank_diff(previous, ranked), args.top))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(ranked, f, indent=2)
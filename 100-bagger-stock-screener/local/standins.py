@@ -0,0 +1,134 @@
+"""
+Stand-ins for the external services used by the Lambda handlers, so the state machine
+can be run end to end in-process: the Freetrade sheet, Yahoo & SES.
+"""
+import contextlib
+import csv
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from local import synthetic
+
+
+class StubSES:
+    """
+    In-memory SES client, recording sent emails after an optional simulated latency per call,
+    and counting calls of each method
+    """
+
+    def __init__(self, recipients: Iterable[str] = ("screener@example.com",), latency: float = 0.0):
+        self.recipients = list(recipients)
+        self.latency = latency
+        self.sent: List[Dict] = []
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def list_verified_email_addresses(self) -> Dict:
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls["list_verified_email_addresses"] += 1
+        return {"VerifiedEmailAddresses": list(self.recipients)}
+
+    def send_email(self, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls["send_email"] += 1
+            self.sent.append(kwargs)
+        return {"MessageId": uuid.uuid4().hex}
+
+    def delivered(self) -> List[str]:
+        """every address sent to, once per email received"""
+        return [
+            address
+            for email in self.sent
+            for addresses in email["Destination"].values()
+            for address in addresses
+        ]
+
+
+def handlers() -> Dict[str, Callable]:
+    """Lambda handlers by the function names used in the state machine definition"""
+
+    from functions.stock_data import app as stock_data
+    from functions.stock_email import app as stock_email
+    from functions.stock_list import app as stock_list
+
+    return {
+        "StockListFunction": stock_list.lambda_handler,
+        "StockDataFunction": stock_data.lambda_handler,
+        "StockEmailFunction": stock_email.lambda_handler,
+    }
+
+
+@contextlib.contextmanager
+def stand_ins(
+    rows: int = 1_000,
+    seed: int = 0,
+    yahoo_latency: float = 0.0,
+    yahoo_failure_rate: float = 0.0,
+    ses: StubSES = None,
+    results_dir: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+) -> Iterator[StubSES]:
+    """
+    Replaces the sheet download with a synthetic sheet of rows, yahoo downloads with synthetic
+    responses (taking yahoo_latency seconds, failing with a 404 for yahoo_failure_rate of symbols)
+    and the SES client with a StubSES, which is yielded.
+    Results are passed by reference through a local directory in place of S3, if results_dir is given,
+    and the metrics of every invocation are appended to metrics_path as EMF documents, if given
+    (concurrent invocations of a function share its metrics, so their documents overlap).
+    """
+
+    import requests
+
+    from functions.stock_data import app as stock_data
+    from functions.stock_email import app as stock_email
+    from functions.stock_list import app as stock_list
+    from screener import blobstore
+
+    ses = ses or StubSES()
+    sheet = synthetic.synthetic_freetrade_sheet(rows, seed)
+
+    def iter_stock_records(url: str = stock_list.ENDPOINT) -> Iterator[Dict]:
+        yield from csv.DictReader(io.StringIO(sheet.to_csv(index=False)))
+
+    def download_yahoo_json_data(symbol, fields, session=None, period1=stock_data.PERIOD_START, parse=None, archive=True):
+        time.sleep(yahoo_latency)
+        if random.Random(f"{seed}:{symbol}").random() < yahoo_failure_rate:
+            raise requests.HTTPError(f"404 Client Error: Not Found for symbol {symbol}")
+        response = synthetic.synthetic_yahoo_response(symbol, fields=fields)
+        return response if parse is None else parse(json.dumps(response).encode())
+
+    replacements = [
+        (stock_list, "get_stock_frame", lambda: sheet.copy()),
+        (stock_list, "iter_stock_records", iter_stock_records),
+        (stock_data, "download_yahoo_json_data", download_yahoo_json_data),
+        (stock_email, "boto3", SimpleNamespace(client=lambda *args, **kwargs: ses)),
+        (stock_email, "_client", None),
+        (stock_email, "_recipients", None),
+    ]
+    if results_dir:
+        store = blobstore.FileSystemStore(results_dir)
+        replacements += [(stock_list, "RESULTS_STORE", store), (stock_data, "RESULTS_STORE", store)]
+    if metrics_path:
+        # each function has a POWERTOOLS_SERVICE_NAME of its own in Lambda, unlike the one environment here
+        services = {stock_list: "stock_list", stock_data: "stock_data", stock_email: "stock_email"}
+        replacements += [(module.METRICS, "path", metrics_path) for module in services]
+        replacements += [(module.METRICS, "service", service) for module, service in services.items()]
+    saved = [(module, name, getattr(module, name)) for module, name, _ in replacements]
+
+    try:
+        for module, name, replacement in replacements:
+            setattr(module, name, replacement)
+        yield ses
+
+    finally:
+        for module, name, original in saved:
+            setattr(module, name, original)
@@ -0,0 +1,395 @@
+"""
+In-process interpreter for the subset of Amazon States Language used by statemachine/*.asl.json:
+Task (lambda:invoke), Map, Wait, Pass & Choice (IsPresent rules) states, with InputPath, Parameters,
+ResultPath, OutputPath, Retry & Catch. Every state execution is timed, to give a per-state & per-item breakdown.
+
+Runs the stock processor against synthetic stand-ins for the sheet, Yahoo & SES:
+
+    python -m local.statemachine [--rows 1000] [--event '{"sample": 50}'] [--yahoo-latency 0.2]
+        [--wait-scale 0] [--max-concurrency "Process stock list=10"]
+"""
+import argparse
+import copy
+import os
+import json
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+DEFINITION = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "statemachine", "stock_processor.asl.json"
+)
+LAMBDA_INVOKE = "arn:aws:states:::lambda:invoke"
+PATH_TOKEN = re.compile(r"\.([A-Za-z_][\w-]*)|\[(-?\d*):(-?\d*)\]|\[(-?\d+)\]")
+SUBSTITUTION = re.compile(r"^\$\{(\w+?)(Arn)?\}$")
+
+
+class StatesError(Exception):
+    """Error raised within a state, named as it would be in Step Functions"""
+
+    def __init__(self, error: str, cause: str = "") -> None:
+        self.error = error
+        self.cause = cause
+        super().__init__(f"{error}: {cause}")
+
+
+def evaluate_path(path: str, data: Any) -> Any:
+    """evaluate simple JSONPath ($, $.field, $[start:end], $[index]) against data"""
+
+    if path is None:
+        return data
+
+    if not path.startswith("$"):
+        raise StatesError("States.Runtime", f"Invalid path {path}")
+
+    position, value = 1, data
+    for match in PATH_TOKEN.finditer(path, 1):
+        if match.start() != position:
+            raise StatesError("States.Runtime", f"Unsupported path {path}")
+        position = match.end()
+
+        field, start, end, index = match.groups()
+        if field is not None:
+            value = value[field]
+        elif index is not None:
+            value = value[int(index)]
+        else:
+            value = value[int(start) if start else None:int(end) if end else None]
+
+    if position != len(path):
+        raise StatesError("States.Runtime", f"Unsupported path {path}")
+
+    return value
+
+
+def set_path(path: Optional[str], data: Any, result: Any) -> Any:
+    """apply ResultPath, placing result within data (or discarding it for a null path)"""
+
+    if path is None:
+        return data
+
+    if path == "$":
+        return result
+
+    fields = path[2:].split(".")
+    output = copy.deepcopy(data) if isinstance(data, dict) else {}
+    target = output
+    for field in fields[:-1]:
+        target = target.setdefault(field, {})
+    target[fields[-1]] = result
+
+    return output
+
+
+def apply_parameters(template: Any, data: Any) -> Any:
+    """resolve Parameters template, where keys ending .$ are paths into data"""
+
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith(".$"):
+                resolved[key[:-2]] = evaluate_path(value, data)
+            else:
+                resolved[key] = apply_parameters(value, data)
+        return resolved
+
+    if isinstance(template, list):
+        return [apply_parameters(value, data) for value in template]
+
+    return template
+
+
+def error_matches(names: List[str], error: str) -> bool:
+    return "States.ALL" in names or error in names
+
+
+def rule_matches(rule: Dict, data: Any) -> bool:
+    """whether a Choice rule matches data (only IsPresent rules are supported)"""
+
+    if "IsPresent" not in rule:
+        raise StatesError("States.Runtime", f"Unsupported choice rule {rule}")
+
+    try:
+        evaluate_path(rule["Variable"], data)
+        present = True
+    except (KeyError, IndexError, TypeError):
+        present = False
+
+    return present == rule["IsPresent"]
+
+
+class StateMachine:
+    """
+    Executes a state machine definition in-process, with Lambda functions provided as
+    handlers by name, e.g. {"StockListFunction": stock_list.app.lambda_handler}.
+    Wait & retry intervals are multiplied by wait_scale (0 to skip them), and Map
+    MaxConcurrency can be overridden by state name to compare settings without editing the definition.
+    """
+
+    def __init__(
+        self,
+        definition: Dict,
+        handlers: Dict[str, Callable],
+        wait_scale: float = 1.0,
+        max_concurrency: Optional[Dict[str, int]] = None,
+    ):
+        self.definition = definition
+        self.handlers = handlers
+        self.wait_scale = wait_scale
+        self.max_concurrency = max_concurrency or {}
+        self.timings: List[Dict] = []
+        self.lock = threading.Lock()
+
+
+    @classmethod
+    def from_file(cls, path: str, handlers: Dict[str, Callable], **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), handlers, **kwargs)
+
+
+    def execute(self, data: Any) -> Any:
+        """run the state machine with input data, returning its output"""
+
+        self.timings = []
+        start = time.perf_counter()
+        output = self.run_states(self.definition, data, path=())
+        self.record("Execution", (), None, start)
+
+        return output
+
+
+    def record(self, state: str, path: tuple, item: Optional[int], start: float, **extra) -> None:
+        with self.lock:
+            self.timings.append({
+                "state": state,
+                "path": "/".join(path),
+                "item": item,
+                "seconds": time.perf_counter() - start,
+                **extra,
+            })
+
+
+    def run_states(self, machine: Dict, data: Any, path: tuple, item: Optional[int] = None) -> Any:
+        """run states from StartAt until a state ends"""
+
+        name = machine["StartAt"]
+
+        while True:
+            state = machine["States"][name]
+            start = time.perf_counter()
+            data, next_state = self.run_state(name, state, data, path + (name,), item)
+            self.record(name, path, item, start, type=state["Type"])
+
+            if next_state is None:
+                return data
+            name = next_state
+
+
+    def run_state(self, name: str, state: Dict, data: Any, path: tuple, item: Optional[int]):
+        """run a single state, returning its output & the name of the next state (None at the end)"""
+
+        state_type = state["Type"]
+        effective = evaluate_path(state.get("InputPath", "$"), data)
+
+        if state_type == "Choice":
+            for rule in state["Choices"]:
+                if rule_matches(rule, effective):
+                    return evaluate_path(state.get("OutputPath", "$"), effective), rule["Next"]
+            if "Default" not in state:
+                raise StatesError("States.NoChoiceMatched", f"No choice of {name} matched")
+            return evaluate_path(state.get("OutputPath", "$"), effective), state["Default"]
+
+        try:
+            if state_type == "Pass":
+                if "Parameters" in state:
+                    effective = apply_parameters(state["Parameters"], effective)
+                result = state.get("Result", effective)
+            elif state_type == "Wait":
+                time.sleep(state.get("Seconds", 0) * self.wait_scale)
+                result = effective
+            elif state_type == "Task":
+                result = self.with_retry(state, lambda: self.run_task(state, effective))
+            elif state_type == "Map":
+                result = self.with_retry(state, lambda: self.run_map(name, state, effective, path))
+            else:
+                raise StatesError("States.Runtime", f"Unsupported state type {state_type}")
+
+        except StatesError as e:
+            for catcher in state.get("Catch", []):
+                if error_matches(catcher["ErrorEquals"], e.error):
+                    output = set_path(catcher.get("ResultPath", "$"), data, {"Error": e.error, "Cause": e.cause})
+                    return output, catcher["Next"]
+            raise
+
+        if "ResultSelector" in state:
+            result = apply_parameters(state["ResultSelector"], result)
+
+        output = set_path(state.get("ResultPath", "$"), data, result) if state_type != "Wait" else effective
+        output = evaluate_path(state.get("OutputPath", "$"), output)
+
+        return output, None if state.get("End") else state["Next"]
+
+
+    def with_retry(self, state: Dict, func: Callable) -> Any:
+        """call func, retrying as per the state's Retry policies"""
+
+        attempts = defaultdict(int)
+
+        while True:
+            try:
+                return func()
+
+            except StatesError as e:
+                for index, retrier in enumerate(state.get("Retry", [])):
+                    if error_matches(retrier["ErrorEquals"], e.error):
+                        break
+                else:
+                    raise
+
+                if attempts[index] >= retrier.get("MaxAttempts", 3):
+                    raise
+
+                interval = retrier.get("IntervalSeconds", 1) * retrier.get("BackoffRate", 2.0) ** attempts[index]
+                attempts[index] += 1
+                time.sleep(interval * self.wait_scale)
+
+
+    def run_task(self, state: Dict, data: Any) -> Any:
+        """invoke the Lambda handler named by FunctionName, as with the lambda:invoke integration"""
+
+        if state["Resource"] != LAMBDA_INVOKE:
+            raise StatesError("States.Runtime", f"Unsupported resource {state['Resource']}")
+
+        parameters = apply_parameters(state.get("Parameters", {"Payload.$": "$"}), data)
+        match = SUBSTITUTION.match(parameters["FunctionName"])
+        function_name = match.group(1) if match else parameters["FunctionName"]
+
+        # round trip through JSON, as payloads are serialised between states
+        payload = json.loads(json.dumps(parameters.get("Payload", data)))
+
+        try:
+            result = self.handlers[function_name](payload, None)
+        except Exception as e:
+            raise StatesError(type(e).__name__, str(e))
+
+        return {"Payload": json.loads(json.dumps(result)), "StatusCode": 200}
+
+
+    def run_map(self, name: str, state: Dict, data: Any, path: tuple) -> List:
+        """run the item processor for each item, limited to MaxConcurrency items at once"""
+
+        items = evaluate_path(state.get("ItemsPath", "$"), data)
+        processor = state.get("ItemProcessor", state.get("Iterator"))
+        selector = state.get("ItemSelector", state.get("Parameters"))
+
+        concurrency = self.max_concurrency.get(name, state.get("MaxConcurrency", 0)) or len(items) or 1
+
+        def process(indexed):
+            index, item = indexed
+            if selector is not None:
+                item = apply_parameters(selector, item)
+            return self.run_states(processor, item, path, index)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(process, enumerate(items)))
+
+
+    def summary(self) -> Dict[str, Dict]:
+        """latency of each state: count, total, mean, median & max in seconds"""
+
+        by_state = defaultdict(list)
+        for timing in self.timings:
+            key = "/".join(filter(None, [timing["path"], timing["state"]]))
+            by_state[key].append(timing["seconds"])
+
+        return {
+            state: {
+                "count": len(seconds),
+                "total": sum(seconds),
+                "mean": statistics.mean(seconds),
+                "median": statistics.median(seconds),
+                "max": max(seconds),
+            }
+            for state, seconds in by_state.items()
+        }
+
+
+    def item_summary(self) -> Dict[str, Dict[int, Dict[str, float]]]:
+        """latency of each Map item, by Map state & item index, broken down by state"""
+
+        items = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        for timing in self.timings:
+            if timing["item"] is not None:
+                items[timing["path"]][timing["item"]][timing["state"]] += timing["seconds"]
+
+        return {
+            path: {index: dict(states, total=sum(states.values())) for index, states in sorted(by_item.items())}
+            for path, by_item in items.items()
+        }
+
+
+    def report(self) -> str:
+        """human readable latency breakdown"""
+
+        lines = [f"{'state':<50} {'count':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9}"]
+        for state, stats in self.summary().items():
+            lines.append(
+                f"{state:<50} {stats['count']:>6} {stats['total']:>9.3f} "
+                f"{stats['mean'] * 1000:>9.1f} {stats['max'] * 1000:>9.1f}"
+            )
+
+        for path, by_item in self.item_summary().items():
+            totals = [states["total"] for states in by_item.values()]
+            slowest = max(by_item, key=lambda index: by_item[index]["total"])
+            lines.append(
+                f"{path}: {len(by_item)} items, median {statistics.median(totals) * 1000:.1f} ms, "
+                f"slowest item {slowest} {by_item[slowest]['total'] * 1000:.1f} ms"
+            )
+
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from local import standins
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--definition", default=DEFINITION)
+    parser.add_argument("--event", type=json.loads, default={}, help="state machine input, as JSON")
+    parser.add_argument("--rows", type=int, default=1_000, help="rows in the synthetic sheet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--yahoo-latency", type=float, default=0.0, help="seconds per yahoo download")
+    parser.add_argument("--yahoo-failure-rate", type=float, default=0.0)
+    parser.add_argument("--ses-latency", type=float, default=0.0, help="seconds per SES call")
+    parser.add_argument("--recipients", type=int, default=1, help="verified email addresses in the SES stub")
+    parser.add_argument("--results-dir", help="pass results by reference through this directory, in place of S3")
+    parser.add_argument("--metrics", help="append the metrics of every invocation to this file, as EMF documents")
+    parser.add_argument("--wait-scale", type=float, default=1.0, help="multiplier of Wait & retry intervals")
+    parser.add_argument(
+        "--max-concurrency", action="append", default=[], metavar="STATE=N",
+        help="override MaxConcurrency of a Map state",
+    )
+    args = parser.parse_args()
+
+    machine = StateMachine.from_file(
+        args.definition,
+        standins.handlers(),
+        wait_scale=args.wait_scale,
+        max_concurrency={
+            state: int(limit) for state, limit in (setting.rsplit("=", 1) for setting in args.max_concurrency)
+        },
+    )
+
+    with standins.stand_ins(
+        args.rows, args.seed, args.yahoo_latency, args.yahoo_failure_rate,
+        standins.StubSES([f"user{i}@example.com" for i in range(args.recipients)], args.ses_latency),
+        args.results_dir,
+        args.metrics,
+    ) as ses:
+        machine.execute(args.event)
+
+    print(machine.report())
+    print(f"emails sent: {len(ses.sent)}")
@@ -0,0 +1,150 @@
+"""Generators of synthetic Freetrade sheets & yahoo responses, for benchmarks & local runs"""
+import calendar
+import datetime as dt
+import random
+import string
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# approximate mix of exchanges in the Freetrade sheet, with the lowercase suffix Freetrade adds to symbols
+MIC_WEIGHTS = {
+    "XNAS": 0.30,
+    "XNYS": 0.30,
+    "XLON": 0.20,
+    "XETR": 0.05,
+    "XAMS": 0.03,
+    "XSTO": 0.03,
+    "XHEL": 0.02,
+    "XBRU": 0.02,
+    "XWBO": 0.02,
+    "XLIS": 0.01,
+    "PINK": 0.02,
+}
+MIC_SUFFIX = {"XETR": "d", "XHEL": "h", "XLIS": "u", "XAMS": "a", "XBRU": "b", "XWBO": "v"}
+MIC_COUNTRY = {
+    "XNAS": "US", "XNYS": "US", "PINK": "US", "XLON": "GB", "XETR": "DE", "XAMS": "NL",
+    "XSTO": "SE", "XHEL": "FI", "XBRU": "BE", "XWBO": "AT", "XLIS": "PT",
+}
+FIELDS = [
+    "trailingMarketCap",
+    "trailingPeRatio",
+    "trailingPbRatio",
+    "annualFreeCashFlow",
+    "annualTotalRevenue",
+    "annualNetIncome",
+]
+
+
+def isin_check_digit(body: str) -> str:
+    """check digit completing the 11 character ISIN body"""
+
+    digits = [int(d) for d in "".join(c if c.isdigit() else str(ord(c) - 55) for c in body)[::-1]]
+    checksum = sum(sum(divmod(2 * d, 10)) for d in digits[::2]) + sum(digits[1::2])
+
+    return str((10 - checksum % 10) % 10)
+
+
+def synthetic_isin(rng: random.Random, country: str, valid: bool = True) -> str:
+    """random ISIN for country, with an incorrect check digit if not valid"""
+
+    body = country + "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(9))
+    check = isin_check_digit(body)
+
+    if not valid:
+        check = str((int(check) + rng.randint(1, 9)) % 10)
+
+    return body + check
+
+
+def synthetic_freetrade_sheet(
+    rows: int,
+    seed: int = 0,
+    etf_ratio: float = 0.10,
+    etc_ratio: float = 0.02,
+    isa_ineligible_ratio: float = 0.15,
+    invalid_isin_ratio: float = 0.02,
+) -> pd.DataFrame:
+    """DataFrame in the format of the Freetrade sheet, with a realistic mix of MICs, ISINs & ETFs"""
+
+    rng = random.Random(seed)
+    mics = rng.choices(list(MIC_WEIGHTS), weights=list(MIC_WEIGHTS.values()), k=rows)
+
+    records = []
+    for mic in mics:
+        ticker = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 4)))
+        if mic == "XSTO" and rng.random() < 0.3:
+            ticker += rng.choice("AB")
+
+        kind = rng.random()
+        if kind < etf_ratio:
+            long_title = f"{ticker} UCITS ETF"
+        elif kind < etf_ratio + etc_ratio:
+            long_title = f"{ticker} Physical Gold ETC"
+        else:
+            long_title = f"{ticker} Holdings plc"
+
+        records.append({
+            "Title": ticker.title(),
+            "Long_Title": long_title,
+            "Subtitle": rng.choice(["Technology", "Financials", "Consumer", "Industrials", "Energy"]),
+            "Currency": "USD" if MIC_COUNTRY[mic] == "US" else "GBP" if mic == "XLON" else "EUR",
+            "ISA_eligible": rng.random() >= isa_ineligible_ratio,
+            "ISIN": synthetic_isin(rng, MIC_COUNTRY[mic], valid=rng.random() >= invalid_isin_ratio),
+            "MIC": mic,
+            "Symbol": ticker + MIC_SUFFIX.get(mic, ""),
+            "Fractional_Enabled": rng.random() < 0.5,
+        })
+
+    return pd.DataFrame(records)
+
+
+def synthetic_yahoo_response(
+    symbol: str = "XXXX",
+    years: int = 4,
+    seed: Optional[int] = None,
+    fields: List[str] = FIELDS,
+    end: dt.date = dt.date(2022, 12, 31),
+    trailing_points: int = 1,
+) -> Dict:
+    """
+    Yahoo fundamentals-timeseries style response, with years of annual points
+    and the most recent trailing_points quarterly points for trailing fields,
+    market cap following a random walk
+    """
+
+    rng = random.Random(seed if seed is not None else symbol)
+
+    results = []
+    for field in fields:
+
+        if field.startswith("trailing"):
+            dates = [end - dt.timedelta(days=120 + 91 * i) for i in reversed(range(trailing_points))]
+        else:
+            dates = [dt.date(end.year - i, 12, 31) for i in reversed(range(years))]
+
+        if field == "trailingMarketCap":
+            values = [rng.lognormvariate(21, 2)]
+            for _ in dates[1:]:
+                values.append(values[-1] * rng.lognormvariate(0.02, 0.25))
+        elif field in ("trailingPeRatio", "trailingPbRatio"):
+            values = [rng.uniform(-5, 60) for _ in dates]
+        else:
+            level = rng.lognormvariate(18, 2)
+            values = [level * rng.uniform(-0.2, 1.5) * (1 + i / 10) for i in range(len(dates))]
+
+        results.append({
+            "meta": {"symbol": [symbol], "type": [field]},
+            "timestamp": [calendar.timegm(d.timetuple()) for d in dates],
+            field: [
+                {
+                    "asOfDate": d.isoformat(),
+                    "periodType": "TTM" if field.startswith("trailing") else "12M",
+                    "currencyCode": "USD",
+                    "reportedValue": {"raw": value},
+                }
+                for d, value in zip(dates, values)
+            ],
+        })
+
+    return {"timeseries": {"result": results, "error": None}}
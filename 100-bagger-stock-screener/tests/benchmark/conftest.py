@@ -0,0 +1,96 @@
+"""
+Benchmark harness. Benchmarks are skipped unless BENCHMARK=1.
+
+Each benchmark's median time is compared with the result stored in BENCHMARK_RESULTS
+(default: tests/benchmark/results.json), failing if slower by more than BENCHMARK_THRESHOLD
+(default: 0.25, i.e. 25%). New benchmarks, or all with BENCHMARK_SAVE=1, are stored as the baseline.
+"""
+import json
+import os
+import statistics
+import time
+
+import pytest
+
+RESULTS_PATH = os.environ.get(
+    "BENCHMARK_RESULTS", os.path.join(os.path.dirname(__file__), "results.json")
+)
+THRESHOLD = float(os.environ.get("BENCHMARK_THRESHOLD", 0.25))
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("BENCHMARK") == "1":
+        return
+
+    skip = pytest.mark.skip(reason="benchmarks only run with BENCHMARK=1")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+
+def load_results():
+    if not os.path.exists(RESULTS_PATH):
+        return {}
+    with open(RESULTS_PATH) as f:
+        return json.load(f)
+
+
+class Benchmark:
+    """times a function, comparing the median against the stored baseline"""
+
+    def __init__(self, name, baseline):
+        self.name = name
+        self.baseline = baseline
+        self.result = None
+
+    def __call__(self, func, *args, rounds=5, **kwargs):
+        func(*args, **kwargs)  # warm up
+
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            output = func(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+
+        self.result = {"median": statistics.median(timings), "min": min(timings), "rounds": rounds}
+        return output
+
+    def regression(self):
+        """relative slowdown against the baseline, or None if there is no baseline"""
+        if self.baseline is None or self.result is None:
+            return None
+        return self.result["median"] / self.baseline["median"] - 1
+
+
+@pytest.fixture(scope="session")
+def benchmark_results():
+    results = load_results()
+    stored = dict(results)
+    yield results
+
+    if results == stored:
+        return
+
+    os.makedirs(os.path.dirname(RESULTS_PATH) or ".", exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+@pytest.fixture
+def benchmark(request, benchmark_results):
+    name = request.node.name
+    bench = Benchmark(name, benchmark_results.get(name))
+    yield bench
+
+    if bench.result is None:
+        return
+
+    regression = bench.regression()
+    if regression is None or os.environ.get("BENCHMARK_SAVE") == "1":
+        benchmark_results[name] = bench.result
+        return
+
+    assert regression <= THRESHOLD, (
+        f"{name} regressed by {regression:.0%}: "
+        f"{bench.result['median'] * 1000:.2f} ms vs baseline {bench.baseline['median'] * 1000:.2f} ms"
+    )
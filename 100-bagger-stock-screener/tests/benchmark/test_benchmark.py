@@ -0,0 +1,91 @@
+import statistics
+import time
+
+import pytest
+
+from functions.stock_data import app as stock_data
+from functions.stock_email import app as stock_email
+from functions.stock_list import app as stock_list
+from local import backtest, synthetic
+
+
+@pytest.fixture(scope="module", params=[1_000, 10_000, 100_000], ids=lambda rows: f"{rows}rows")
+def sheet(request):
+    return synthetic.synthetic_freetrade_sheet(request.param)
+
+
+@pytest.fixture(scope="module", params=[4, 10, 40], ids=lambda years: f"{years}years")
+def yahoo_response(request):
+    return synthetic.synthetic_yahoo_response(years=request.param)
+
+
+@pytest.fixture(scope="module")
+def universe():
+    return [
+        stock_data.Score.transform_input(synthetic.synthetic_yahoo_response(f"S{i}", years=1 + i % 10))
+        for i in range(10_000)
+    ]
+
+
+def test_validate_stock_frame(benchmark, sheet):
+    benchmark(stock_list.validate_stock_frame, sheet)
+
+
+def test_shuffle_and_filter_stock_list(benchmark, sheet):
+    if len(sheet) > 10_000:
+        pytest.skip("row by row validation of the largest sheet is too slow to repeat")
+    records = sheet.to_dict(orient="records")
+    benchmark(stock_list.shuffle_and_filter_stock_list, records, rounds=3)
+
+
+def test_freetrade_model(benchmark):
+    records = synthetic.synthetic_freetrade_sheet(1_000).to_dict(orient="records")
+    benchmark(lambda: [stock_list.validate_record(record) for record in records])
+
+
+def test_transform_input(benchmark, yahoo_response):
+    benchmark(stock_data.Score.transform_input, yahoo_response, rounds=100)
+
+
+def score_each(universe):
+    for data in universe:
+        stock_data.Score.data = data
+        stock_data.Score.get_total_score()
+
+
+def median_time(func, rounds=5):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def test_get_total_score(benchmark, universe):
+    benchmark(score_each, universe)
+
+
+def test_batch_score(benchmark, universe):
+    benchmark(lambda: stock_data.BatchScore(universe).get_total_score())
+
+    # scoring a batch at once is no slower than scoring each stock, building its columns included
+    assert benchmark.result["median"] <= median_time(lambda: score_each(universe))
+
+
+def test_backtest(benchmark):
+    # 10k stocks with 30 years of annual & quarterly trailing points
+    points = list(backtest.points_from_responses({
+        f"S{i}": synthetic.synthetic_yahoo_response(f"S{i}", years=30, trailing_points=120)
+        for i in range(10_000)
+    }))
+    benchmark(backtest.backtest, points, rounds=3)
+
+
+@pytest.mark.parametrize("records", [100, 10_000])
+def test_create_email_body(benchmark, records):
+    data = [
+        {"Ticker": f"S{i}", "ISIN": "US0378331005", "Market cap": 1E9, "Total score": i % 150, "timestamp": "2022-12-14T16:51:23"}
+        for i in range(records)
+    ]
+    benchmark(stock_email.create_email_body, data)
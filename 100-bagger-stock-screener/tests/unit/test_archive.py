@@ -0,0 +1,111 @@
+import json
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import zstandard
+
+from local import synthetic
+from screener import archive
+
+
+def response(symbol, years=4):
+    return json.dumps(synthetic.synthetic_yahoo_response(symbol, years=years)).encode()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return archive.ResponseArchive(str(tmp_path / "archive"), train_samples=20, dictionary_size=4096)
+
+
+def test_append_read(store):
+    first, second = response("AAPL", years=3), response("AAPL", years=4)
+    store.append("AAPL", first, "2026-09-30")
+    store.append("AAPL", second, "2026-10-07")
+
+    assert store.read("AAPL", "2026-09-30") == first
+    assert store.read("AAPL") == second
+    assert store.read("AAPL", "2026-10-01") is None and store.read("MSFT") is None
+    assert store.dates("AAPL") == ["2026-09-30", "2026-10-07"]
+
+
+def test_append_keeps_same_date(store):
+    store.append("AAPL", b'{"first":1}', "2026-10-07")
+    store.append("AAPL", b'{"second":2}', "2026-10-07")
+
+    # the latest is read by date, with every response archived kept
+    assert store.read("AAPL", "2026-10-07") == b'{"second":2}'
+    assert store.totals()["responses"] == 2
+    assert [store.read_entry(entry) for entry, *_ in store.entries("AAPL")] == [b'{"first":1}', b'{"second":2}']
+    assert store.dates("AAPL") == ["2026-10-07"]
+    assert store.read_entry(100) is None
+
+
+def test_trains_once_concurrently(store, monkeypatch):
+    trained = []
+    train = store.train
+    monkeypatch.setattr(store, "train", lambda: trained.append(train()))
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: store.append(f"S{i}", response(f"S{i}"), "2026-10-07"), range(80)))
+
+    assert len(trained) == 1
+    assert store.connection.execute("SELECT COUNT(*) FROM dictionaries").fetchone() == (1,)
+
+
+def test_training_fails(tmp_path):
+    store = archive.ResponseArchive(str(tmp_path), train_samples=5)
+
+    # too few samples to train a dictionary, so responses are archived without one until more are
+    with pytest.raises(zstandard.ZstdError):
+        for i in range(5):
+            store.append(f"S{i}", b"{}", "2026-10-07")
+    assert store.totals()["responses"] == 5 and store.dictionary == 0
+
+    for i in range(5, 9):
+        store.append(f"S{i}", b"{}", "2026-10-07")
+    assert store.read("S8") == b"{}"
+
+
+def test_segments_by_month(store):
+    store.append("AAPL", response("AAPL"), "2026-09-30")
+    store.append("AAPL", response("AAPL"), "2026-10-07")
+
+    segments = sorted(path.name for path in pathlib.Path(store.root).glob("*.zst"))
+    assert [segment[:7] for segment in segments] == ["2026-09", "2026-10"]
+
+
+def test_trains_dictionary(store):
+    responses = {f"S{i}": response(f"S{i}", years=2 + i % 4) for i in range(60)}
+    for symbol, content in responses.items():
+        store.append(symbol, content, "2026-10-07")
+
+    assert store.dictionary == 1
+    assert all(store.read(symbol) == content for symbol, content in responses.items())
+
+    # responses compressed with the dictionary are far smaller than those compressed before it
+    rows = store.connection.execute("SELECT dictionary, SUM(length) * 1.0 / SUM(size) FROM responses GROUP BY 1")
+    ratios = dict(rows.fetchall())
+    assert ratios[1] < ratios[0] * 0.75
+    assert store.stats["responses"] == 60
+    assert store.stats["stored_bytes"] < store.stats["raw_bytes"] / 4
+
+
+def test_reopened(store):
+    for i in range(25):
+        store.append(f"S{i}", response(f"S{i}"), "2026-10-07")
+
+    reopened = archive.ResponseArchive(store.root)
+    assert reopened.dictionary == store.dictionary == 1
+    assert reopened.read("S0") == response("S0") and reopened.read("S24") == response("S24")
+
+    reopened.append("S25", response("S25"), "2026-10-14")
+    assert store.read("S25") == response("S25")
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("RESPONSE_ARCHIVE_PATH", raising=False)
+    assert archive.from_environment() is None
+
+    monkeypatch.setenv("RESPONSE_ARCHIVE_PATH", str(tmp_path / "archive"))
+    assert isinstance(archive.from_environment(), archive.ResponseArchive)
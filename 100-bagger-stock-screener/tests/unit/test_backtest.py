@@ -0,0 +1,126 @@
+import calendar
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from functions.stock_data import app as stock_data
+from local import backtest, synthetic
+from screener import timeseries
+
+
+@pytest.fixture
+def responses():
+    return {
+        f"S{i}": synthetic.synthetic_yahoo_response(f"S{i}", years=2 + i % 5, trailing_points=1 + i % 12)
+        for i in range(40)
+    }
+
+
+def as_of(json_response, date):
+    """response as it stood at date, with only the latest point of trailing fields"""
+
+    timestamp = calendar.timegm(date.timetuple())
+    data = {}
+    for field, values in stock_data.Score.transform_input(json_response).items():
+        result = next(r for r in json_response["timeseries"]["result"] if r["meta"]["type"][0] == field)
+        values = [v for t, v in zip(result["timestamp"], values) if t <= timestamp]
+        if values:
+            data[field] = values[-1:] if field.startswith("trailing") else values
+    return data
+
+
+def test_date_grid():
+    grid = backtest.date_grid(np.datetime64("2020-02-15"), np.datetime64("2021-01-01"), step=3)
+    assert grid.astype(str).tolist() == ["2020-04-30", "2020-07-31", "2020-10-31", "2021-01-31"]
+
+
+def test_forward_fill():
+    values = np.array([[np.nan, 1, np.nan, 3, np.nan], [2, np.nan, np.nan, np.nan, 5]])
+    np.testing.assert_array_equal(backtest.forward_fill(values), [[np.nan, 1, 1, 3, 3], [2, 2, 2, 2, 5]])
+
+
+def test_rankdata():
+    assert backtest.rankdata(np.array([10, 30, 20, 20])).tolist() == [1, 4, 2.5, 2.5]
+
+
+def test_scores_as_of_every_date(responses):
+    tensor = backtest.Tensor(backtest.points_from_responses(responses))
+    scores, valid = backtest.score(tensor)
+
+    assert scores.shape == valid.shape == (40, len(tensor.dates))
+
+    for d, date in enumerate(tensor.dates.astype(dt.date)):
+        for i, symbol in enumerate(tensor.symbols):
+            data = as_of(responses[symbol], date)
+
+            if set(data) != set(stock_data.FIELDS):
+                assert not valid[i, d]
+                continue
+
+            stock_data.Score.data = data
+            assert valid[i, d]
+            assert scores[i, d] == stock_data.Score.get_total_score(), (symbol, date)
+
+    # every stock is scored as of the end of its history
+    assert valid[:, -1].all()
+
+
+def test_evaluate():
+    dates = np.array(["2020-03-31", "2020-06-30", "2020-09-30"], dtype="datetime64[D]")
+    scores = np.array([[30, 30, 30], [20, 20, 20], [10, 10, 10], [0, 0, 0]])
+    valid = np.ones(scores.shape, dtype=bool)
+    valid[3, 0] = False
+    market_cap = np.array([[1, 50, 200], [1, 10, 20], [1, 2, 3], [1, 1, np.nan]], dtype=float)
+
+    periods = backtest.evaluate(scores, valid, market_cap, dates, horizon=1, top=0.34)
+
+    assert [period["date"] for period in periods] == ["2020-03-31", "2020-06-30"]
+    first, second = periods
+    assert first["stocks"] == 3
+    assert first["spearman"] == pytest.approx(1)
+    assert (first["top_stocks"], first["top_growth"], first["median_growth"]) == (2, 30, 10)
+    assert (first["baggers"], first["top_baggers"]) == (0, 0)
+    # growth of the last stock is unknown
+    assert second["stocks"] == 3
+
+    summary = backtest.summarise(backtest.evaluate(scores, valid, market_cap, dates, horizon=2, top=0.25, bagger=100))
+    assert summary["baggers"] == 1
+    assert summary["recall"] == 1
+    assert summary["lift"] == 3
+
+
+def test_backtest(responses):
+    result = backtest.backtest(backtest.points_from_responses(responses), horizon=1)
+
+    assert result["stocks"] == 40
+    assert result["periods"]
+    assert all(period["stocks"] <= 40 for period in result["periods"])
+    assert "mean_spearman" in result
+    assert "40 stocks over" in backtest.report(result)
+
+
+def test_backtest_spec(responses):
+    spec = [dict(stock_data.SCORE_SPEC[0], weight=0)]
+    tensor = backtest.Tensor(backtest.points_from_responses(responses))
+    scores, _ = backtest.score(tensor, spec)
+    assert not scores.any()
+
+
+def test_backtest_from_store(tmp_path):
+    # a store built up by yearly runs, each downloading the latest annual & trailing points
+    store = timeseries.TimeseriesStore(str(tmp_path / "timeseries.db"))
+    for year in range(2005, 2023):
+        for i in range(50):
+            symbol = f"S{i}"
+            response = synthetic.synthetic_yahoo_response(
+                symbol, years=1, seed=f"{symbol}-{year}", end=dt.date(year, 12, 31)
+            )
+            store.merge(symbol, response)
+
+    result = backtest.backtest(store.points(stock_data.FIELDS), step=12, horizon=5)
+
+    assert result["stocks"] == 50
+    assert len(result["periods"]) > 5
+    assert all(period["stocks"] == 50 for period in result["periods"])
+    assert result["mean_spearman"] is not None
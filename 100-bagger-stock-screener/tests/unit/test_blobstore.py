@@ -0,0 +1,100 @@
+import io
+import types
+
+import pytest
+
+from screener import blobstore
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=0):
+        # a page of two keys at a time
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        page = keys[ContinuationToken:ContinuationToken + 2]
+        truncated = ContinuationToken + 2 < len(keys)
+        return {
+            "Contents": [{"Key": key} for key in page],
+            "IsTruncated": truncated,
+            **({"NextContinuationToken": ContinuationToken + 2} if truncated else {}),
+        }
+
+
+@pytest.fixture(params=["filesystem", "s3"])
+def store(request, tmp_path):
+    if request.param == "filesystem":
+        return blobstore.FileSystemStore(str(tmp_path))
+    return blobstore.S3Store("bucket", "results/", client=FakeS3Client())
+
+
+def test_write_read_records(store):
+    records = [{"yahoo_symbol": f"S{i}", "isin": str(i), "score": i / 3} for i in range(25)]
+    manifest = blobstore.write_records(store, "run/shard", records, chunk_size=10)
+
+    assert blobstore.is_manifest(manifest)
+    assert manifest["uri"] == store.uri
+    assert manifest["records"] == 25
+    assert [chunk["records"] for chunk in manifest["chunks"]] == [10, 10, 5]
+    assert manifest["chunks"][0]["key"] == "run/shard/part-00000.ndjson.gz"
+
+    read = blobstore.read_records(manifest, store)
+    assert isinstance(read, types.GeneratorType)
+    assert list(read) == records
+
+
+def test_write_no_records(store):
+    manifest = blobstore.write_records(store, "empty", [])
+    assert manifest["records"] == 0
+    assert list(blobstore.read_records(manifest, store)) == []
+
+
+def test_list_delete(store):
+    for key in ["state/b", "state/events/2", "state/events/1", "other/a", "stateful/c"]:
+        store.put(key, b"data")
+
+    assert store.list("state/") == ["state/b", "state/events/1", "state/events/2"]
+    assert store.list("missing/") == []
+
+    store.delete("state/b")
+    store.delete("state/missing")
+    assert store.list("state/") == ["state/events/1", "state/events/2"]
+
+
+def test_s3_keys():
+    client = FakeS3Client()
+    blobstore.S3Store("bucket", "/results/", client=client).put("a/b", b"data")
+    blobstore.S3Store("bucket", client=client).put("a/b", b"data")
+    assert set(client.objects) == {("bucket", "results/a/b"), ("bucket", "a/b")}
+
+
+def test_read_records_from_uri(tmp_path):
+    manifest = blobstore.write_records(blobstore.FileSystemStore(str(tmp_path)), "run", [{"a": 1}])
+    assert list(blobstore.read_records(manifest)) == [{"a": 1}]
+
+
+def test_open_store(tmp_path):
+    store = blobstore.open_store(f"file://{tmp_path}")
+    assert isinstance(store, blobstore.FileSystemStore)
+    assert store.root == str(tmp_path)
+
+    assert not blobstore.is_manifest({"records": 1})
+    assert not blobstore.is_manifest([])
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("RESULTS_URI", raising=False)
+    assert blobstore.from_environment() is None
+
+    monkeypatch.setenv("RESULTS_URI", str(tmp_path))
+    assert isinstance(blobstore.from_environment(), blobstore.FileSystemStore)
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from freezegun import freeze_time
+
+from screener import cache
+
+
+def yahoo_result(field, value):
+    return {
+        "meta": {"symbol": ["XXXX"], "type": [field]},
+        "timestamp": [1662076800],
+        field: [{"asOfDate": "2022-09-02", "reportedValue": {"raw": value}}],
+    }
+
+
+class Fetcher:
+    """records the fields requested, returning a yahoo-style response"""
+
+    def __init__(self):
+        self.requested = []
+
+    def __call__(self, fields):
+        self.requested.append(fields)
+        return {"timeseries": {"result": [yahoo_result(field, 1) for field in fields]}}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return cache.MemoryBackend()
+    return cache.SQLiteBackend(str(tmp_path / "cache.db"))
+
+
+@pytest.mark.parametrize("field, ttl", [
+    ("trailingMarketCap", 86400),
+    ("annualFreeCashFlow", 30 * 86400),
+    ("quarterlyNetIncome", 7 * 86400),
+    ("somethingElse", 86400),
+])
+def test_ttl(field, ttl):
+    response_cache = cache.ResponseCache(cache.MemoryBackend())
+    assert response_cache.ttl(field) == ttl
+
+
+def test_get_or_fetch(backend):
+    response_cache = cache.ResponseCache(backend)
+    fetch = Fetcher()
+    fields = ["trailingMarketCap", "annualFreeCashFlow"]
+
+    with freeze_time("2022-01-01"):
+        response = response_cache.get_or_fetch("AAPL", fields, 0, fetch)
+        assert [r["meta"]["type"][0] for r in response["timeseries"]["result"]] == fields
+
+        response_cache.get_or_fetch("AAPL", fields, 0, fetch)
+        assert fetch.requested == [fields]
+        assert response_cache.stats == {"hits": 2, "misses": 2, "evictions": 0}
+
+    # trailing field expires first, so only it is downloaded again
+    with freeze_time("2022-01-10"):
+        response_cache.get_or_fetch("AAPL", fields, 0, fetch)
+        assert fetch.requested[-1] == ["trailingMarketCap"]
+
+    # different symbol or period is a separate entry
+    response_cache.get_or_fetch("MSFT", fields, 0, fetch)
+    response_cache.get_or_fetch("AAPL", fields, 1, fetch)
+    assert fetch.requested[-2:] == [fields, fields]
+
+
+def test_eviction(backend):
+    response_cache = cache.ResponseCache(backend, max_entries=2)
+
+    response_cache.set("A", "trailingMarketCap", 0, yahoo_result("trailingMarketCap", 1))
+    response_cache.set("B", "trailingMarketCap", 0, yahoo_result("trailingMarketCap", 2))
+    assert response_cache.get("A", "trailingMarketCap", 0) is not None
+
+    # B is least recently used
+    response_cache.set("C", "trailingMarketCap", 0, yahoo_result("trailingMarketCap", 3))
+    assert response_cache.get("B", "trailingMarketCap", 0) is None
+    assert response_cache.get("A", "trailingMarketCap", 0) is not None
+    assert response_cache.get("C", "trailingMarketCap", 0) is not None
+    assert response_cache.stats["evictions"] == 1
+
+
+def test_eviction_by_size(backend):
+    response_cache = cache.ResponseCache(backend, max_bytes=300)
+
+    for symbol in "ABC":
+        response_cache.set(symbol, "trailingMarketCap", 0, yahoo_result("trailingMarketCap", 1))
+
+    assert response_cache.get("A", "trailingMarketCap", 0) is None
+    assert response_cache.get("C", "trailingMarketCap", 0) is not None
+
+
+def test_sqlite_totals(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = cache.SQLiteBackend(path)
+
+    backend.set("A", b"x" * 10, 0)
+    backend.set("B", b"x" * 20, 0)
+    backend.set("A", b"x" * 5, 0)
+    backend.delete("B")
+    backend.delete("missing")
+
+    assert (backend.count, backend.size) == tuple(backend.totals()) == (1, 5)
+    assert (cache.SQLiteBackend(path).count, cache.SQLiteBackend(path).size) == (1, 5)
+
+
+def test_stats_thread_safe(backend):
+    response_cache = cache.ResponseCache(backend)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: response_cache.get(str(i % 10), "annualNetIncome", 0), range(2000)))
+
+    assert response_cache.stats["misses"] == 2000
+
+
+def test_sqlite_persists(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache.ResponseCache(cache.SQLiteBackend(path)).set(
+        "A", "annualNetIncome", 0, yahoo_result("annualNetIncome", 5)
+    )
+
+    result = cache.ResponseCache(cache.SQLiteBackend(path)).get("A", "annualNetIncome", 0)
+    assert result == yahoo_result("annualNetIncome", 5)
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("YAHOO_CACHE_PATH", raising=False)
+    assert cache.from_environment() is None
+
+    monkeypatch.setenv("YAHOO_CACHE_PATH", str(tmp_path / "cache.db"))
+    assert isinstance(cache.from_environment().backend, cache.SQLiteBackend)
@@ -1,6 +1,11 @@
+import threading
+from types import SimpleNamespace
+
 import pytest
 
 from functions.stock_email import app
+from local.standins import StubSES
+from screener import topk
 
 
 @pytest.fixture
@@ -24,4 +29,94 @@ def test_create_email_body(event_data):
     assert "US0378331005" in output
     assert "2022-12-14T17:01:23.123456" in output
     assert "6" in output
-    assert "15" in output
\ No newline at end of file
+    assert "15" in output
+
+def test_aggregate_results(event_data):
+    results = [dict(record, **{"Total score": record["total_score"]}) for record in event_data]
+    shard = topk.TopK().update([results[1]], [{"Ticker": "FAIL", "ISIN": "X", "Error": "HTTPError()"}])
+
+    event = [
+        results[0],
+        shard.to_dict(),
+        {"yahoo_symbol": "AAPL", "isin": "US0378331005", "error": {"Error": "Timeout", "Cause": ""}},
+        {"shard": 0, "count": 2, "error": {"Error": "States.Timeout", "Cause": ""}},
+        {"shard": 1, "count": 3, "error": {"Error": "States.Timeout", "Cause": ""}},
+    ]
+    aggregate = app.aggregate_results(event)
+
+    assert aggregate.top() == results
+    assert (aggregate.successes, aggregate.failures) == (2, 7)
+    assert aggregate.histogram == {0: 1, 10: 1}
+    assert aggregate.reasons == {"HTTPError": 1, "Timeout": 1, "States.Timeout": 5}
+
+
+def test_create_summary():
+    aggregate = topk.TopK().update([{"Total score": 15}, {"Total score": 104}], [{}])
+    summary = app.create_summary(aggregate)
+
+    assert "2 stocks scored" in summary
+    assert "1 stocks could not be scored\n  unknown: 1" in summary
+    assert "10-19: 1" in summary
+    assert "100-109: 1" in summary
+    assert "Top 2 stocks by Total score" in summary
+
+
+@pytest.fixture
+def ses(monkeypatch):
+    ses = StubSES([f"user{i}@example.com" for i in range(20)], latency=0.05)
+    monkeypatch.setattr(app, "boto3", SimpleNamespace(client=lambda service: ses))
+    monkeypatch.setattr(app, "_client", None)
+    monkeypatch.setattr(app, "_recipients", None)
+    return ses
+
+
+class ConcurrentSES(StubSES):
+    """StubSES whose sends wait on each other in groups of parties, tracking the most in flight at once"""
+
+    def __init__(self, recipients, parties):
+        super().__init__(recipients)
+        self.barrier = threading.Barrier(parties, timeout=10)
+        self.active = self.peak = 0
+
+    def send_email(self, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+        # breaks (failing the send) unless parties sends are in flight together
+        self.barrier.wait()
+
+        with self.lock:
+            self.active -= 1
+        return super().send_email(**kwargs)
+
+
+def test_send_emails(ses):
+    ses = ConcurrentSES(ses.recipients, parties=app.MAX_WORKERS)
+    sends = app.send_emails(ses, ses.recipients + ["user0@example.com"], "body")
+
+    # an email per recipient, sent concurrently
+    assert [send["recipient"] for send in sends] == ses.recipients
+    assert ses.calls["send_email"] == len(ses.recipients)
+    assert ses.peak == app.MAX_WORKERS
+
+    # each to & from its recipient alone
+    assert sorted(ses.delivered()) == sorted(ses.recipients)
+    assert all(email["Destination"] == {"ToAddresses": [email["Source"]]} for email in ses.sent)
+    assert all(email["Message"]["Body"]["Text"]["Data"] == "body" for email in ses.sent)
+
+    assert app.send_emails(ses, [], "body") == []
+
+
+def test_lambda_handler(ses, event_data):
+    event = [dict(record, **{"Total score": record["total_score"]}) for record in event_data]
+
+    first = app.lambda_handler(event, None)
+    second = app.lambda_handler(event, None)
+
+    assert first["recipients"] == second["recipients"] == 20
+    assert len(first["sends"]) == 20
+
+    # client & recipients are reused by warm invocations
+    assert ses.calls["list_verified_email_addresses"] == 1
+    assert app.get_client() is ses
@@ -0,0 +1,77 @@
+import pytest
+
+from screener import blobstore, failures, shared
+
+DAY = 86400
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return failures.FailureCache(str(tmp_path / "failures.db"), base_interval=DAY, max_interval=4 * DAY)
+
+
+def test_interval(cache):
+    assert [cache.interval(n) / DAY for n in range(1, 6)] == [1, 2, 4, 4, 4]
+
+
+def test_record_backoff(cache):
+    stock = ("US0378331005", "AAPL")
+
+    # each consecutive failure doubles the time until the stock is probed again
+    for failure, now, due in [(1, 0, 1), (2, 1, 3), (3, 3, 7)]:
+        cache.record([(*stock, failures.NOT_FOUND)], now=now * DAY)
+        assert cache.failing(now=(due - 0.5) * DAY) == {stock: failures.NOT_FOUND}
+        assert cache.failing(now=due * DAY) == {}
+
+    # and succeeding forgets it
+    cache.record([(*stock, failures.EMPTY)], now=7 * DAY)
+    cache.record([], [stock], now=8 * DAY)
+    assert cache.failing(now=8 * DAY) == {}
+
+    cache.record([(*stock, failures.EMPTY)], now=9 * DAY)
+    assert cache.failing(now=9.5 * DAY) == {stock: failures.EMPTY}
+    assert cache.failing(now=10 * DAY) == {}
+
+
+def test_record_expires(cache):
+    cache.record([("A", "A", failures.MISSING_FIELDS)], now=0)
+    cache.record([("B", "B", failures.MISSING_FIELDS)], now=10 * DAY)
+
+    rows = cache.connection.execute("SELECT isin, failures FROM failures").fetchall()
+    assert rows == [("B", 1)]
+
+
+def test_shared(tmp_path):
+    state = shared.SharedState(blobstore.FileSystemStore(str(tmp_path / "state")), "failures")
+
+    def open_cache(name):
+        return failures.FailureCache(str(tmp_path / f"{name}.db"), base_interval=DAY, max_interval=4 * DAY, state=state)
+
+    # separate invocations of stock_data, each with a local database of its own
+    first, second, reader = open_cache("first"), open_cache("second"), open_cache("reader")
+    first.record([("A", "A", failures.NOT_FOUND), ("B", "B", failures.EMPTY)], now=0)
+    second.record([("A", "A", failures.NOT_FOUND)], [("B", "B")], now=1 * DAY)
+
+    reader.sync()
+    assert reader.failing(now=2 * DAY) == {("A", "A"): failures.NOT_FOUND}
+    assert reader.failing(now=3 * DAY) == {}
+
+    # events are compacted into the snapshot, so are replayed only once
+    assert state.load()[1:] == ([], [])
+    first.record([("A", "A", failures.NOT_FOUND)], now=3 * DAY)
+
+    reopened = open_cache("reopened")
+    reopened.sync()
+    assert reopened.failing(now=6.5 * DAY) == {("A", "A"): failures.NOT_FOUND}
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("FAILURE_CACHE_PATH", raising=False)
+    monkeypatch.delenv("STATE_URI", raising=False)
+    assert failures.from_environment() is None
+
+    monkeypatch.setenv("FAILURE_CACHE_PATH", str(tmp_path / "failures.db"))
+    assert failures.from_environment().state is None
+
+    monkeypatch.setenv("STATE_URI", str(tmp_path / "state"))
+    assert isinstance(failures.from_environment().state, shared.SharedState)
@@ -0,0 +1,94 @@
+import datetime as dt
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from screener import blobstore, history
+
+
+@pytest.fixture
+def records():
+    return [
+        {"Ticker": "AAPL", "ISIN": "US0378331005", "Market cap": 5E11, "Total score": 13, "timestamp": "2022-12-14T16:51:23"},
+        {"Ticker": "MSFT", "ISIN": "US5949181045", "Market cap": 2E9, "Total score": 90, "timestamp": "2022-12-14T16:52:23"},
+    ]
+
+
+@pytest.fixture
+def data():
+    return [
+        {"trailingMarketCap": [5E11], "annualNetIncome": [-8.2E7, 5.9E7]},
+        {"trailingMarketCap": [2E9], "annualNetIncome": [1.0, 2.0, 3.0]},
+    ]
+
+
+def test_write_and_read_run(tmp_path, records, data):
+    root = str(tmp_path)
+    path = history.write_run(root, records, data, run_date=dt.date(2022, 12, 14))
+    assert "run_date=2022-12-14" in path
+
+    table = history.read_history(root)
+    assert table.column("ticker").to_pylist() == ["AAPL", "MSFT"]
+    assert table.column("total_score").to_pylist() == [13, 90]
+    assert table.column("annualNetIncome").to_pylist() == [[-8.2E7, 5.9E7], [1.0, 2.0, 3.0]]
+    assert table.column("run_date").to_pylist() == ["2022-12-14", "2022-12-14"]
+
+
+def test_read_history_columns_and_dates(tmp_path, records, data):
+    root = str(tmp_path)
+    history.write_run(root, records, data, run_date=dt.date(2022, 12, 7))
+    history.write_run(root, records[:1], data[:1], run_date=dt.date(2022, 12, 14))
+    history.write_run(root, records[1:], data[1:], run_date=dt.date(2022, 12, 21))
+
+    table = history.read_history(root, columns=["ticker", "total_score"])
+    assert table.column_names == ["ticker", "total_score"]
+    assert table.num_rows == 4
+
+    table = history.read_history(root, columns=["ticker"], start=dt.date(2022, 12, 10))
+    assert sorted(table.column("ticker").to_pylist()) == ["AAPL", "MSFT"]
+
+    table = history.read_history(
+        root, columns=["ticker"], start=dt.date(2022, 12, 10), end=dt.date(2022, 12, 14)
+    )
+    assert table.column("ticker").to_pylist() == ["AAPL"]
+
+
+def test_read_history_different_fields(tmp_path, records, data):
+    root = str(tmp_path)
+    history.write_run(root, records[:1], [{}], run_date=dt.date(2022, 12, 7))
+    history.write_run(root, records[1:], data[1:], run_date=dt.date(2022, 12, 14))
+
+    table = history.read_history(root)
+    assert table.column("annualNetIncome").to_pylist() in ([None, [1.0, 2.0, 3.0]], [[1.0, 2.0, 3.0], None])
+
+    # fields no file of the runs read holds are left out
+    table = history.read_history(root, columns=["ticker", "annualNetIncome"], end=dt.date(2022, 12, 7))
+    assert table.column_names == ["ticker"]
+
+
+def test_run_dates(tmp_path, records, data):
+    root = str(tmp_path / "history")
+    assert history.run_dates(root) == []
+
+    history.write_run(root, records, data, run_date=dt.date(2022, 12, 14))
+    history.write_run(root, records, data, run_date=dt.date(2022, 12, 7))
+    history.write_run(root, records, data, run_date=dt.date(2022, 12, 14))
+    assert history.run_dates(root) == [dt.date(2022, 12, 7), dt.date(2022, 12, 14)]
+
+
+def test_write_run_s3(monkeypatch, records, data):
+    objects = {}
+
+    class Client:
+        def put_object(self, Bucket, Key, Body):
+            objects[Bucket, Key] = Body
+
+    store = blobstore.S3Store
+    monkeypatch.setattr(blobstore, "S3Store", lambda bucket, prefix: store(bucket, prefix, client=Client()))
+
+    path = history.write_run("s3://bucket/history", records, data, run_date=dt.date(2022, 12, 14))
+
+    [(bucket, key)] = objects
+    assert path == f"s3://{bucket}/{key}" and key.startswith("history/run_date=2022-12-14/part-")
+    assert pq.read_table(pa.BufferReader(objects[bucket, key])).column("ticker").to_pylist() == ["AAPL", "MSFT"]
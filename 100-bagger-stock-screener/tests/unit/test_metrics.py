@@ -0,0 +1,139 @@
+import json
+import pstats
+import threading
+
+import pytest
+
+from screener import metrics
+
+
+@pytest.fixture
+def metrics_path(tmp_path):
+    return str(tmp_path / "metrics.ndjson")
+
+
+def test_timer_and_counters(metrics_path):
+    m = metrics.Metrics("test", path=metrics_path)
+
+    with m.timer("Phase"):
+        pass
+    with m.timer("Phase"):
+        pass
+    m.add("Stocks", 3)
+    m.add("Stocks")
+    m.add_bytes("Downloaded", 1024)
+
+    document = m.flush()
+
+    assert document["Stocks"] == [4]
+    assert document["Downloaded"] == [1024]
+    assert document["PhaseCount"] == [2]
+    assert document["Phase"][0] >= 0
+
+    units = {metric["Name"]: metric["Unit"] for metric in document["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert units == {"Stocks": "Count", "Downloaded": "Bytes", "Phase": "Milliseconds", "PhaseCount": "Count"}
+
+    with open(metrics_path) as f:
+        assert [json.loads(line) for line in f] == [document]
+
+    # reset once flushed
+    assert m.flush() is None
+
+
+def test_emf_document():
+    m = metrics.Metrics("stock_data", namespace="Testing")
+    m.add("Stocks")
+    document = m.flush()
+
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "Testing"
+    assert directive["Dimensions"] == [["service"]]
+    assert document["service"] == "stock_data"
+    assert isinstance(document["_aws"]["Timestamp"], int)
+
+
+def test_flush_to_stdout_in_lambda(monkeypatch, capsys):
+    m = metrics.Metrics("test")
+    m.add("Stocks")
+    m.flush()
+    assert capsys.readouterr().out == ""
+
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "StockDataFunction")
+    m.add("Stocks")
+    m.flush()
+    assert json.loads(capsys.readouterr().out)["Stocks"] == [1]
+
+
+def test_timer_threads():
+    m = metrics.Metrics("test")
+
+    def work():
+        for _ in range(100):
+            with m.timer("Work"):
+                m.add("Items")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    document = m.flush()
+    assert document["WorkCount"] == document["Items"] == [800]
+
+
+def test_metrics_limit():
+    m = metrics.Metrics("test")
+    for i in range(150):
+        m.add(f"Metric{i:03}")
+
+    names = [metric["Name"] for metric in m.flush()["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+    assert names == [f"Metric{i:03}" for i in range(metrics.MAX_METRICS - 1)]
+
+
+def test_instrument(metrics_path):
+    m = metrics.Metrics("test", path=metrics_path)
+
+    @m.instrument
+    def handler(event, context):
+        m.add("Events")
+        if event.get("fail"):
+            raise ValueError("failed")
+        return "done"
+
+    assert handler({}, None) == "done"
+    with pytest.raises(ValueError):
+        handler({"fail": True}, None)
+
+    with open(metrics_path) as f:
+        first, second = [json.loads(line) for line in f]
+
+    assert first["ColdStart"] == [1]
+    assert first["InvocationCount"] == first["Events"] == [1]
+    assert "ColdStart" not in second
+    assert second["Errors"] == [1]
+
+
+def test_profile(tmp_path):
+    m = metrics.Metrics("test", profile_dir=str(tmp_path / "profiles"))
+
+    handler = m.instrument(lambda event, context: sum(range(1000)))
+    handler({}, None)
+
+    profiles = list((tmp_path / "profiles").glob("test-*.prof"))
+    assert len(profiles) == 1
+    assert pstats.Stats(str(profiles[0])).total_calls > 0
+
+
+def test_from_environment(monkeypatch, metrics_path):
+    monkeypatch.setenv("POWERTOOLS_SERVICE_NAME", "screener")
+    monkeypatch.setenv("POWERTOOLS_METRICS_NAMESPACE", "Testing")
+    monkeypatch.setenv("METRICS_PATH", metrics_path)
+    m = metrics.from_environment("stock_list")
+
+    assert (m.service, m.namespace, m.path, m.profile_dir) == ("screener", "Testing", metrics_path, None)
+
+    monkeypatch.delenv("POWERTOOLS_SERVICE_NAME")
+    monkeypatch.delenv("POWERTOOLS_METRICS_NAMESPACE")
+    m = metrics.from_environment("stock_list")
+    assert (m.service, m.namespace) == ("stock_list", metrics.NAMESPACE)
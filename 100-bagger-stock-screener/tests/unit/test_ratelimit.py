@@ -0,0 +1,155 @@
+import datetime as dt
+import email.utils
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from screener import ratelimit
+
+
+def response(status_code, retry_after=None):
+    return SimpleNamespace(status_code=status_code, headers={"Retry-After": retry_after} if retry_after else {})
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+@pytest.fixture
+def limiter(sleeps):
+    return ratelimit.RateLimiter(rate=100, max_rate=200, sleep=sleeps.append)
+
+
+def test_parse_retry_after():
+    assert ratelimit.parse_retry_after(None) is None
+    assert ratelimit.parse_retry_after("") is None
+    assert ratelimit.parse_retry_after("nonsense") is None
+    assert ratelimit.parse_retry_after("120") == 120
+    assert ratelimit.parse_retry_after("-1") == 0
+
+    retry_at = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=60)
+    assert 55 < ratelimit.parse_retry_after(email.utils.format_datetime(retry_at, usegmt=True)) <= 60
+
+
+def test_request_retries_throttled(limiter, sleeps):
+    responses = iter([response(429, "0.1"), response(503), response(200)])
+
+    start = time.monotonic()
+    assert limiter.request(lambda: next(responses)).status_code == 200
+    assert time.monotonic() - start >= 0.1
+    assert len(sleeps) == 2
+
+    metrics = limiter.metrics()
+    assert metrics["requests"] == 3
+    assert metrics["throttles"] == 2
+    assert metrics["retries"] == 2
+
+    # throttles within the cooldown only back off once
+    assert 50 <= metrics["rate"] < 51
+    assert metrics["concurrency"] == 4
+
+
+def test_request_exhausted(limiter, sleeps):
+    assert limiter.request(lambda: response(500), max_attempts=3).status_code == 500
+    assert len(sleeps) == 2
+    assert limiter.metrics()["errors"] == 3
+
+    # client errors are not retried
+    assert limiter.request(lambda: response(404)).status_code == 404
+    assert len(sleeps) == 2
+
+
+def test_request_connection_error(limiter, sleeps):
+    def send():
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        limiter.request(send, max_attempts=2)
+
+    assert len(sleeps) == 1
+    assert limiter.in_flight == 0
+
+
+def test_additive_increase(limiter):
+    limiter.on_throttle()
+    rate = limiter.rate
+
+    for _ in range(100):
+        limiter.on_success()
+
+    assert limiter.rate == pytest.approx(rate + 100 * limiter.increase / limiter.rate, rel=0.01)
+    assert limiter.metrics()["concurrency"] == limiter.max_concurrency
+
+    for _ in range(100_000):
+        limiter.on_success()
+    assert limiter.rate == limiter.max_rate
+
+
+def test_backoff(limiter):
+    delays = [limiter.backoff(attempt) for attempt in range(20) for _ in range(10)]
+    assert all(0 <= delay <= ratelimit.MAX_DELAY for delay in delays)
+
+
+def test_rate_limited():
+    limiter = ratelimit.RateLimiter(rate=50, max_rate=50, burst=1)
+
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.request(lambda: response(200))
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_concurrency_limited():
+    limiter = ratelimit.RateLimiter(rate=1000, max_concurrency=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def send():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return response(200)
+
+    threads = [threading.Thread(target=limiter.request, args=(send,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert limiter.metrics()["requests"] == 8
+
+
+
+def test_stats_concurrent():
+    limiter = ratelimit.RateLimiter(rate=10000, max_rate=10000, max_concurrency=8, burst=10000, sleep=lambda _: None)
+
+    def requests():
+        for i in range(200):
+            attempts = iter([response(500), response(200)] if i % 2 else [response(200)])
+            limiter.request(lambda: next(attempts))
+
+    threads = [threading.Thread(target=requests) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metrics = limiter.metrics()
+    assert metrics["requests"] == 8 * 300
+    assert metrics["retries"] == metrics["errors"] == 8 * 100
+
+
+def test_from_environment(monkeypatch):
+    monkeypatch.setenv("YAHOO_RATE", "2")
+    monkeypatch.setenv("YAHOO_MAX_RATE", "4")
+    limiter = ratelimit.from_environment(max_concurrency=3)
+
+    assert (limiter.rate, limiter.max_rate, limiter.max_concurrency) == (2, 4, 3)
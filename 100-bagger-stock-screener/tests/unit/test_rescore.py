@@ -0,0 +1,132 @@
+import datetime as dt
+import types
+
+import pytest
+
+from functions.stock_data import app as stock_data
+from local import rescore, synthetic
+from screener import history, timeseries
+
+
+@pytest.fixture
+def universe():
+    responses = {f"S{i}": synthetic.synthetic_yahoo_response(f"S{i}", years=1 + i % 4) for i in range(50)}
+    data = {symbol: stock_data.Score.transform_input(response) for symbol, response in responses.items()}
+    return responses, data
+
+
+def scores(responses):
+    return {symbol: stock_data.Score(response).get_total_score() for symbol, response in responses.items()}
+
+
+def test_rescore_history(tmp_path, universe):
+    responses, data = universe
+    expected = scores(responses)
+    root = str(tmp_path)
+
+    # previous run, with the scores as they were then
+    stored = {symbol: (score + 7 * (i % 3)) for i, (symbol, score) in enumerate(expected.items())}
+    records = [{"Ticker": symbol, "ISIN": symbol, "Total score": score} for symbol, score in stored.items()]
+    history.write_run(root, records[:1], [{}], run_date=dt.date(2022, 12, 7))
+    history.write_run(root, records, list(data.values()), run_date=dt.date(2022, 12, 14))
+
+    loaded_records, loaded_data = rescore.load_history(root)
+    assert len(loaded_records) == 50
+
+    ranked = rescore.rescore(loaded_records, loaded_data)
+    assert {record["Ticker"]: record["Total score"] for record in ranked} == expected
+    assert [record["Rank"] for record in ranked] == list(range(1, 51))
+    assert [record["Total score"] for record in ranked] == sorted(expected.values(), reverse=True)
+
+    diff = rescore.rank_diff(loaded_records, ranked)
+    assert len(diff) == 50
+    assert any(row["Change"] for row in diff)
+    for row in diff:
+        assert row["Previous score"] == stored[row["Ticker"]]
+
+    assert "50 stocks ranked" in rescore.report(diff)
+
+    # an earlier run
+    assert len(rescore.load_history(root, dt.date(2022, 12, 7))[0]) == 1
+
+
+def test_load_history_reads_run_only(tmp_path, universe):
+    _, data = universe
+    root = str(tmp_path)
+    records = [{"Ticker": symbol, "ISIN": symbol, "Total score": 1} for symbol in data]
+    history.write_run(root, records, list(data.values()), run_date=dt.date(2022, 12, 14))
+
+    # files of other runs aren't opened
+    (tmp_path / "run_date=2022-12-07").mkdir()
+    (tmp_path / "run_date=2022-12-07" / "part-corrupt.parquet").write_bytes(b"not parquet")
+
+    loaded_records, loaded_data = rescore.load_history(root)
+    assert len(loaded_records) == 50
+    assert loaded_data == [{field: list(series) for field, series in d.items()} for d in data.values()]
+    assert rescore.load_history(str(tmp_path / "missing")) == ([], [])
+
+
+def test_load_history_latest_scoring(monkeypatch, tmp_path):
+    root = str(tmp_path)
+    parts = iter(["b", "a"])
+    monkeypatch.setattr(history.uuid, "uuid4", lambda: types.SimpleNamespace(hex=next(parts)))
+
+    # the later scoring is written to the part read first
+    for score, timestamp in [(1, "2022-12-14T09:00:00"), (2, "2022-12-14T17:00:00")]:
+        record = {"Ticker": "S0", "ISIN": "S0", "Total score": score, "timestamp": timestamp}
+        history.write_run(root, [record], [{}], run_date=dt.date(2022, 12, 14))
+
+    records, _ = rescore.load_history(root)
+    assert records == [{"Ticker": "S0", "ISIN": "S0", "Total score": 2}]
+
+
+def test_rescore_timeseries(tmp_path, universe):
+    responses, data = universe
+    store = timeseries.TimeseriesStore(str(tmp_path / "timeseries.db"))
+    for symbol, response in responses.items():
+        store.merge(symbol, response)
+
+    records, loaded = rescore.load_timeseries(str(tmp_path / "timeseries.db"))
+    ranked = rescore.rescore(records, loaded)
+
+    assert {record["Ticker"]: record["Total score"] for record in ranked} == scores(responses)
+
+    # without stored scores, every stock is new
+    diff = rescore.rank_diff(records, ranked)
+    assert all(row["Previous rank"] is None for row in diff)
+
+
+def test_rescore_excludes_missing_fields():
+    data = [{"trailingMarketCap": [1E9]}]
+    assert rescore.rescore([{"Ticker": "X", "ISIN": None, "Total score": None}], data) == []
+
+
+def test_rescore_spec(universe):
+    responses, data = universe
+    records = [{"Ticker": symbol, "ISIN": None, "Total score": None} for symbol in data]
+
+    # market cap alone, weighted double
+    spec = [dict(stock_data.SCORE_SPEC[0], weight=2)]
+    ranked = rescore.rescore(records, list(data.values()), spec)
+
+    expected = {symbol: 2 * stock_data.Score(response).score_market_cap() for symbol, response in responses.items()}
+    assert {record["Ticker"]: record["Total score"] for record in ranked} == expected
+
+
+def test_rank_diff():
+    previous = [
+        {"Ticker": "A", "Total score": 30},
+        {"Ticker": "B", "Total score": 20},
+        {"Ticker": "C", "Total score": 10},
+    ]
+    current = rescore.rank([
+        {"Ticker": "B", "Total score": 40},
+        {"Ticker": "A", "Total score": 30},
+        {"Ticker": "D", "Total score": 5},
+    ])
+
+    diff = rescore.rank_diff(previous, current)
+    assert [(row["Ticker"], row["Rank"], row["Previous rank"], row["Change"]) for row in diff] == [
+        ("B", 1, 2, 1), ("A", 2, 1, -1), ("D", 3, None, None), ("C", None, 3, None)
+    ]
+    assert "3 stocks ranked, 2 changed rank, 1 new, 1 dropped" in rescore.report(diff)
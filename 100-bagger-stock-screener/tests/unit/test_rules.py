@@ -0,0 +1,135 @@
+import math
+import warnings
+from array import array
+
+import numpy as np
+import pytest
+
+from screener import rules
+
+FIELDS = ["price", "revenue"]
+
+
+@pytest.fixture
+def columns():
+    return rules.to_columns([
+        {"price": [1, 2, 6], "revenue": [10, 11]},
+        {"price": [4], "revenue": [0, 5]},
+        {"price": [-3, 3]},
+    ], FIELDS)
+
+
+def rule(**kwargs):
+    return {"name": "rule", "field": "price", "aggregate": "last", **kwargs}
+
+
+def test_to_columns(columns):
+    assert columns["first"]["price"].tolist() == [1, 4, -3]
+    assert columns["last"]["price"].tolist() == [6, 4, 3]
+    assert columns["count"]["revenue"].tolist() == [2, 2, 0]
+    assert columns["sum"]["price"].tolist() == [9, 4, 0]
+
+
+def test_to_columns_arrays(columns):
+    arrays = rules.to_columns([
+        {"price": array("d", [1, 2, 6]), "revenue": array("d", [10, 11])},
+        {"price": array("d", [4]), "revenue": array("d", [0, 5])},
+        {"price": array("d", [-3, 3]), "revenue": array("d")},
+    ], FIELDS)
+
+    for aggregate in columns:
+        for field in FIELDS:
+            np.testing.assert_array_equal(arrays[aggregate][field], columns[aggregate][field])
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("first", [1, 4, -3]),
+    ("last", [6, 4, 3]),
+    ("mean", [3, 4, 0]),
+    ("count", [3, 1, 2]),
+    ("change", [5, 0, 6]),
+    ("growth", [2.5, math.nan, -2]),
+])
+def test_aggregate(columns, name, expected):
+    np.testing.assert_array_equal(rules.aggregate(columns, "price", name), expected)
+
+
+def test_growth_undefined(columns):
+    # growth from zero, or of a missing field
+    assert np.isnan(rules.aggregate(columns, "revenue", "growth")[1:]).all()
+
+
+@pytest.mark.parametrize("name", ["mean", "change", "growth"])
+def test_aggregate_overflow_silent(name):
+    columns = rules.to_columns([{"price": [1e-300, 1e300, 1.7e308]}, {"price": [-1.7e308, 1.7e308]}], FIELDS)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        rules.aggregate(columns, "price", name)
+
+
+def test_pieces_first_match_wins(columns):
+    spec = [rule(default=-1, pieces=[
+        {"max": 4, "max_inclusive": True, "score": 1},
+        {"min": 4, "score": 2},
+    ])]
+    assert rules.compile_spec(spec).scores(columns)["rule"].tolist() == [2, 1, 1]
+
+
+def test_bounds_exclusive(columns):
+    spec = [rule(default=-1, pieces=[{"min": 3, "min_inclusive": False, "max": 6, "score": 1}])]
+    assert rules.compile_spec(spec).scores(columns)["rule"].tolist() == [-1, 1, -1]
+
+
+def test_curves(columns):
+    spec = [
+        rule(name="decay", pieces=[{"curve": "decay", "points": 100, "scale": 10, "inner": 1, "outer": 2}]),
+        rule(name="linear", pieces=[{"curve": "linear", "points": 10, "scale": 4}]),
+    ]
+    scores = rules.compile_spec(spec).scores(columns)
+
+    assert scores["decay"].tolist() == [int(100 * (1 - 0.6) ** 2), int(100 * 0.6 ** 2), int(100 * 0.7 ** 2)]
+    assert scores["linear"].tolist() == [15, 10, 7]
+    assert scores["decay"].dtype == np.int64
+
+
+def test_missing(columns):
+    spec = [rule(aggregate="growth", missing=7, default=1)]
+    assert rules.compile_spec(spec).scores(columns)["rule"].tolist() == [1, 7, 1]
+
+
+def test_total_weighted(columns):
+    spec = [
+        rule(name="a", default=2, weight=3),
+        rule(name="b", aggregate="count", pieces=[{"curve": "linear", "points": 1, "scale": 1}]),
+    ]
+    assert rules.compile_spec(spec).total(columns).tolist() == [9, 7, 8]
+
+    spec[0]["weight"] = 0.5
+    total = rules.compile_spec(spec).total(columns)
+    assert total.dtype == np.float64
+    assert total.tolist() == [4, 2, 3]
+
+
+def test_compile_cached():
+    spec = [rule(pieces=[{"min": 0, "score": 1}])]
+    compiled = rules.compile_spec(spec, FIELDS)
+
+    assert rules.compile_spec([dict(spec[0])], FIELDS) is compiled
+    assert rules.compile_spec(spec) is not compiled
+    assert rules.compile_spec([rule(pieces=[{"min": 1, "score": 1}])], FIELDS) is not compiled
+
+
+@pytest.mark.parametrize("spec", [
+    [{"field": "price", "aggregate": "last"}],
+    [rule(field="volume")],
+    [rule(aggregate="median")],
+    [rule(pieces=[{"min": 0}])],
+    [rule(pieces=[{"score": 1, "curve": "linear", "points": 1, "scale": 1}])],
+    [rule(pieces=[{"curve": "cubic", "points": 1, "scale": 1}])],
+    [rule(pieces=[{"curve": "decay", "points": 1, "scale": 0}])],
+    [rule(), rule()],
+])
+def test_invalid_spec(spec):
+    with pytest.raises(ValueError):
+        rules.compile_spec(spec, FIELDS)
@@ -0,0 +1,38 @@
+import pytest
+
+from screener import blobstore, shared
+
+
+@pytest.fixture
+def state(tmp_path):
+    return shared.SharedState(blobstore.FileSystemStore(str(tmp_path)), "store/")
+
+
+def test_load_empty(state):
+    assert state.load() == ([], [], [])
+
+
+def test_append_compact(state):
+    state.append([{"key": "b", "at": 2}])
+    state.append([{"key": "a", "at": 1}, {"key": "c", "at": 3}])
+    state.append([])
+
+    rows, events, chunks = state.load()
+    assert rows == []
+    assert [event["key"] for event in events] == ["a", "b", "c"]
+    assert len(chunks) == 2
+
+    state.append([{"key": "d", "at": 4}])
+    state.compact([{"key": "abc"}], chunks)
+
+    rows, events, _ = state.load()
+    assert rows == [{"key": "abc"}]
+    assert events == [{"key": "d", "at": 4}]
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("STATE_URI", raising=False)
+    assert shared.from_environment("store") is None
+
+    monkeypatch.setenv("STATE_URI", str(tmp_path))
+    assert shared.from_environment("store").prefix == "store"
@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+from typeguard import TypeCheckError
+
+from local import coldstart
+from screener import startup
+
+
+def test_lazy_import():
+    module = startup.lazy_import("json")
+    assert module is sys.modules["json"]
+    assert module.dumps({}) == "{}"
+
+
+@pytest.mark.parametrize("value, enabled", [
+    (None, True),
+    ("true", True),
+    ("false", False),
+    ("False", False),
+    ("0", False),
+])
+def test_typechecking_enabled(monkeypatch, value, enabled):
+    if value is None:
+        monkeypatch.delenv("TYPECHECKS", raising=False)
+    else:
+        monkeypatch.setenv("TYPECHECKS", value)
+    assert startup.typechecking_enabled() == enabled
+
+
+def test_typechecked(monkeypatch):
+
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    monkeypatch.setenv("TYPECHECKS", "false")
+    assert startup.typechecked(add) is add
+
+    monkeypatch.setenv("TYPECHECKS", "true")
+    checked = startup.typechecked(add)
+    assert checked(1, 2) == 3
+    with pytest.raises(TypeCheckError):
+        checked("1", 2)
+
+
+@pytest.mark.parametrize("handler, deferred", [
+    ("stock_list", ["pandas", "numpy", "boto3"]),
+    ("stock_data", ["typeguard", "pyarrow"]),
+    ("stock_email", ["boto3"]),
+])
+def test_cold_start_defers_imports(handler, deferred):
+    result = coldstart.measure(handler)
+    assert result["seconds"] > 0
+    for name in deferred:
+        assert name not in result["packages"]
@@ -0,0 +1,253 @@
+import json
+import threading
+import time
+
+import pytest
+
+from local import standins, statemachine
+from screener import topk
+
+
+def task(function_name, **state):
+    return {
+        "Type": "Task",
+        "Resource": statemachine.LAMBDA_INVOKE,
+        "OutputPath": "$.Payload",
+        "Parameters": {"Payload.$": "$", "FunctionName": f"${{{function_name}Arn}}"},
+        **state,
+    }
+
+
+def test_evaluate_path():
+    data = {"a": {"b": [1, 2, 3, 4, 5, 6]}}
+    assert statemachine.evaluate_path("$", data) is data
+    assert statemachine.evaluate_path("$.a.b", data) == [1, 2, 3, 4, 5, 6]
+    assert statemachine.evaluate_path("$.a.b[0:5]", data) == [1, 2, 3, 4, 5]
+    assert statemachine.evaluate_path("$.a.b[-1]", data) == 6
+    assert statemachine.evaluate_path("$[0:2]", [1, 2, 3]) == [1, 2]
+
+    with pytest.raises(statemachine.StatesError):
+        statemachine.evaluate_path("$..a", data)
+
+
+def test_set_path():
+    assert statemachine.set_path(None, {"a": 1}, 2) == {"a": 1}
+    assert statemachine.set_path("$", {"a": 1}, 2) == 2
+    assert statemachine.set_path("$.b.c", {"a": 1}, 2) == {"a": 1, "b": {"c": 2}}
+
+
+def test_apply_parameters():
+    template = {"Payload.$": "$.x", "FunctionName": "f", "Nested": {"y.$": "$.y"}}
+    assert statemachine.apply_parameters(template, {"x": 1, "y": 2}) == {
+        "Payload": 1, "FunctionName": "f", "Nested": {"y": 2}
+    }
+
+
+def test_task_pass_and_result_path():
+    definition = {
+        "StartAt": "Double",
+        "States": {
+            "Double": task("Double", ResultPath="$.doubled", OutputPath="$", Next="Tag"),
+            "Tag": {"Type": "Pass", "Result": {"tagged": True}, "ResultPath": "$.tag", "Next": "Keep"},
+            "Keep": {"Type": "Pass", "Result": "discarded", "ResultPath": None, "End": True},
+        },
+    }
+    machine = statemachine.StateMachine(definition, {"Double": lambda event, context: event["x"] * 2})
+
+    assert machine.execute({"x": 2}) == {"x": 2, "doubled": {"Payload": 4, "StatusCode": 200}, "tag": {"tagged": True}}
+    assert [timing["state"] for timing in machine.timings] == ["Double", "Tag", "Keep", "Execution"]
+
+
+def test_retry_and_catch():
+    calls = []
+
+    def flaky(event, context):
+        calls.append(event)
+        if len(calls) < 3:
+            raise ConnectionError("try again")
+        raise KeyError("yahoo_symbol")
+
+    definition = {
+        "StartAt": "Flaky",
+        "States": {
+            "Flaky": task(
+                "Flaky",
+                Retry=[{"ErrorEquals": ["ConnectionError"], "IntervalSeconds": 1, "MaxAttempts": 5}],
+                Catch=[{"ErrorEquals": ["States.ALL"], "ResultPath": "$.error", "Next": "Failure"}],
+                Next="Failure",
+            ),
+            "Failure": {"Type": "Pass", "End": True},
+        },
+    }
+    machine = statemachine.StateMachine(definition, {"Flaky": flaky}, wait_scale=0)
+
+    output = machine.execute({"x": 1})
+    assert len(calls) == 3
+    assert output == {"x": 1, "error": {"Error": "KeyError", "Cause": "'yahoo_symbol'"}}
+
+
+def test_choice_and_pass_parameters():
+    definition = {
+        "StartAt": "Choice",
+        "States": {
+            "Choice": {
+                "Type": "Choice",
+                "Choices": [{"Variable": "$.shard", "IsPresent": True, "Next": "Select"}],
+                "Default": "Other",
+            },
+            "Select": {"Type": "Pass", "Parameters": {"id.$": "$.shard", "kind": "shard"}, "End": True},
+            "Other": {"Type": "Pass", "End": True},
+        },
+    }
+    machine = statemachine.StateMachine(definition, {}, wait_scale=0)
+
+    assert machine.execute({"shard": 3, "stocks": [1, 2]}) == {"id": 3, "kind": "shard"}
+    assert machine.execute({"stocks": [1, 2]}) == {"stocks": [1, 2]}
+
+    del definition["States"]["Choice"]["Default"]
+    with pytest.raises(statemachine.StatesError) as e:
+        machine.execute({})
+    assert e.value.error == "States.NoChoiceMatched"
+
+
+def test_retry_exhausted():
+    def failing(event, context):
+        raise ConnectionError("down")
+
+    definition = {
+        "StartAt": "Failing",
+        "States": {"Failing": task("Failing", Retry=[{"ErrorEquals": ["States.ALL"], "MaxAttempts": 2}], End=True)},
+    }
+    machine = statemachine.StateMachine(definition, {"Failing": failing}, wait_scale=0)
+
+    with pytest.raises(statemachine.StatesError) as e:
+        machine.execute({})
+    assert e.value.error == "ConnectionError"
+
+
+@pytest.mark.parametrize("max_concurrency, override, expected", [(1, None, 1), (0, None, 6), (1, 3, 3)])
+def test_map_concurrency(max_concurrency, override, expected):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(event, context):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return event * 10
+
+    definition = {
+        "StartAt": "Map",
+        "States": {
+            "Map": {
+                "Type": "Map",
+                "InputPath": "$[0:6]",
+                "MaxConcurrency": max_concurrency,
+                "ItemProcessor": {
+                    "StartAt": "Wait",
+                    "States": {
+                        "Wait": {"Type": "Wait", "Seconds": 1, "Next": "Slow"},
+                        "Slow": task("Slow", End=True),
+                    },
+                },
+                "End": True,
+            }
+        },
+    }
+    machine = statemachine.StateMachine(
+        definition, {"Slow": slow}, wait_scale=0, max_concurrency={"Map": override} if override else None
+    )
+
+    assert machine.execute(list(range(10))) == [0, 10, 20, 30, 40, 50]
+    assert peak[0] == expected
+
+    items = machine.item_summary()["Map"]
+    assert sorted(items) == list(range(6))
+    assert set(items[0]) == {"Wait", "Slow", "total"}
+    assert machine.summary()["Map/Slow"]["count"] == 6
+
+
+def test_stock_processor():
+    machine = statemachine.StateMachine.from_file(statemachine.DEFINITION, standins.handlers(), wait_scale=0)
+
+    with standins.stand_ins(rows=200, yahoo_failure_rate=0.5) as ses:
+        output = machine.execute({"sample": 10})
+
+    assert output["recipients"] == 1
+    assert len(ses.sent) == 1
+
+    body = ses.sent[0]["Message"]["Body"]["Text"]["Data"]
+    assert "Total score" in body
+    assert "stocks could not be scored" in body
+
+    summary = machine.summary()
+    assert summary["Process stock list/Scrape yahoo stock data"]["count"] == 10
+    assert summary["Process stock list/Success"]["count"] + summary["Process stock list/Failure"]["count"] == 10
+    assert "Process stock list" in machine.report()
+
+
+@pytest.mark.parametrize("offloaded", [False, True])
+def test_stock_processor_sharded(offloaded, tmp_path):
+    machine = statemachine.StateMachine.from_file(statemachine.DEFINITION, standins.handlers(), wait_scale=0)
+
+    with standins.stand_ins(rows=500, results_dir=str(tmp_path) if offloaded else None) as ses:
+        machine.execute({"shard": True, "shard_cost": 20})
+
+    body = ses.sent[0]["Message"]["Body"]["Text"]["Data"]
+    shards = machine.summary()["Process stock list/Scrape yahoo stock data"]["count"]
+
+    assert shards > 1
+    assert f"Top {topk.TOP_K} stocks by Total score" in body
+    assert body.count("Total score: ") == topk.TOP_K
+    assert any(tmp_path.iterdir()) == offloaded
+
+
+@pytest.mark.parametrize("offloaded", [False, True])
+def test_stock_processor_failed_shards(offloaded, tmp_path):
+    handlers, payloads = standins.handlers(), []
+
+    def failing(event, context):
+        raise TimeoutError("Task timed out")
+
+    def email(event, context):
+        payloads.append(event)
+        return email_handler(event, context)
+
+    email_handler = handlers["StockEmailFunction"]
+    handlers.update(StockDataFunction=failing, StockEmailFunction=email)
+    machine = statemachine.StateMachine.from_file(statemachine.DEFINITION, handlers, wait_scale=0)
+
+    with standins.stand_ins(rows=500, results_dir=str(tmp_path) if offloaded else None) as ses:
+        machine.execute({"shard": True, "shard_cost": 20})
+
+    # failed shards pass on only their id, count of stocks & error
+    [items] = payloads
+    assert len(items) > 1
+    assert [item["shard"] for item in items] == list(range(len(items)))
+    assert all(set(item) == {"shard", "count", "error"} for item in items)
+    assert items[0]["error"]["Error"] == "TimeoutError"
+
+    body = ses.sent[0]["Message"]["Body"]["Text"]["Data"]
+    assert f"{sum(item['count'] for item in items)} stocks could not be scored" in body
+
+
+def test_stock_processor_metrics(tmp_path):
+    machine = statemachine.StateMachine.from_file(statemachine.DEFINITION, standins.handlers(), wait_scale=0)
+    path = tmp_path / "metrics.ndjson"
+
+    with standins.stand_ins(rows=500, metrics_path=str(path)):
+        machine.execute({"shard": True, "shard_cost": 50})
+
+    documents = [json.loads(line) for line in path.read_text().splitlines()]
+    by_service = {}
+    for document in documents:
+        by_service.setdefault(document["service"], []).append(document)
+
+    assert set(by_service) == {"stock_list", "stock_data", "stock_email"}
+    assert "Validation" in by_service["stock_list"][0]
+    assert sum(sum(document.get("StocksScored", [])) for document in by_service["stock_data"]) > 0
+    assert any("TransformInput" in document and "Scoring" in document for document in by_service["stock_data"])
+    assert by_service["stock_email"][0]["EmailsSent"] == [1]
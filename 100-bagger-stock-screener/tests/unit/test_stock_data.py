@@ -1,11 +1,13 @@
-
+import copy
 import json
+import random
 from unittest.mock import patch
 
 import pytest
 import requests
 from freezegun import freeze_time
 from functions.stock_data import app
+from screener import archive, blobstore, cache, failures, history, ratelimit, symbols, timeseries
 from typeguard import TypeCheckError
 from unittest import result
 
@@ -44,6 +46,34 @@ def test_get_yahoo_json_data(mock_get):
         app.get_yahoo_json_data()
 
 
+@patch('requests.get')
+def test_get_yahoo_json_data_cached(mock_get, monkeypatch):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    mock_get.return_value.json.return_value = response
+    monkeypatch.setattr(app, 'RESPONSE_CACHE', cache.ResponseCache(cache.MemoryBackend()))
+
+    first = app.get_yahoo_json_data('AAPL', app.FIELDS)
+    second = app.get_yahoo_json_data('AAPL', app.FIELDS)
+
+    assert mock_get.call_count == 1
+    assert app.Score.transform_input(first) == app.Score.transform_input(second)
+
+
+@patch('requests.get')
+def test_get_yahoo_json_data_incremental(mock_get, monkeypatch, tmp_path):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    mock_get.return_value.json.return_value = response
+    store = timeseries.TimeseriesStore(str(tmp_path / "timeseries.db"))
+    monkeypatch.setattr(app, 'TIMESERIES_STORE', store)
+
+    first = app.get_yahoo_json_data('AAPL', app.FIELDS)
+    second = app.get_yahoo_json_data('AAPL', app.FIELDS)
+
+    periods = [call.kwargs['params']['period1'] for call in mock_get.call_args_list]
+    assert periods == [app.PERIOD_START, timeseries.date_to_timestamp("2022-09-02") + 1]
+    assert app.Score.transform_input(first) == app.Score.transform_input(second)
+
+
 @pytest.fixture
 def score_card():
     response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
@@ -158,6 +188,369 @@ def test_get_total_score():
     assert score_card.get_total_score() == 13
 
 
+@pytest.fixture
+def batch_data():
+    random.seed(100)
+    data = []
+    for _ in range(500):
+        record = {
+            field: [random.choice([0, random.uniform(-1E9, 1E9)]) for _ in range(random.randint(1, 5))]
+            for field in app.FIELDS
+        }
+        record['trailingMarketCap'] = [random.uniform(0, 6E10)]
+        record['trailingPeRatio'] = [random.uniform(-10, 60)]
+        record['trailingPbRatio'] = [random.uniform(-2, 12)]
+        data.append(record)
+    return data
+
+
+def test_batch_score_matches_score(batch_data):
+    batch = app.BatchScore(batch_data)
+
+    expected = []
+    for record in batch_data:
+        app.Score.data = record
+        expected.append([
+            app.Score.score_market_cap(),
+            app.Score.score_pe(),
+            app.Score.score_pb(),
+            app.Score.score_freecashflow(),
+            app.Score.score_revenue_profit_growth("profit"),
+            app.Score.score_revenue_profit_growth("revenue"),
+            app.Score.get_total_score(),
+        ])
+
+    result = list(zip(
+        batch.score_market_cap(),
+        batch.score_pe(),
+        batch.score_pb(),
+        batch.score_freecashflow(),
+        batch.score_revenue_profit_growth("profit"),
+        batch.score_revenue_profit_growth("revenue"),
+        batch.get_total_score(),
+    ))
+
+    assert [list(row) for row in result] == expected
+
+
+@pytest.mark.parametrize("value, result", [
+    ([0,0,0], 0),
+    ([1,2,3], 3),
+    ([1,1.2,1.5], 5),
+    ([7,6,5], 0),
+    ([1], 0),
+    ([9,12], 5),
+])
+def test_batch_score_revenue_profit_growth(value, result):
+    batch = app.BatchScore([{'annualTotalRevenue': value, 'annualNetIncome': value}])
+    assert batch.score_revenue_profit_growth('profit')[0] == result
+    assert batch.score_revenue_profit_growth('revenue')[0] == result
+
+
+def test_batch_score_from_json_responses():
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    batch = app.BatchScore.from_json_responses([response, response])
+    assert batch.valid.tolist() == [True, True]
+    assert batch.get_total_score().tolist() == [13, 13]
+
+
+def test_batch_score_invalid():
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    data = app.Score.transform_input(response)
+    missing = {k: v for k, v in data.items() if k != 'trailingPeRatio'}
+    batch = app.BatchScore([data, missing, {}])
+    assert batch.valid.tolist() == [True, False, False]
+    assert batch.get_total_score().tolist() == [13, 0, 0]
+
+
+@patch('requests.Session.get')
+def test_get_yahoo_json_data_session(mock_get):
+    mock_response = {'key': 'value'}
+    mock_get.return_value.json.return_value = mock_response
+
+    with app.create_session() as session:
+        assert app.get_yahoo_json_data('AAPL', ['annualMarketCap'], session=session) == mock_response
+
+    assert mock_get.call_args.kwargs['timeout'] == app.TIMEOUT
+
+
+@patch('requests.get')
+def test_download_yahoo_json_data_throttled(mock_get, monkeypatch):
+    throttled = requests.Response()
+    throttled.status_code = 429
+    ok = requests.Response()
+    ok.status_code = 200
+    ok._content = b'{"key": "value"}'
+    mock_get.side_effect = [throttled, ok]
+
+    limiter = ratelimit.RateLimiter(rate=100, sleep=lambda seconds: None)
+    monkeypatch.setattr(app, 'RATE_LIMITER', limiter)
+
+    assert app.download_yahoo_json_data('AAPL', ['annualMarketCap']) == {'key': 'value'}
+    assert limiter.metrics()["throttles"] == 1
+    assert limiter.rate < 100
+
+
+def test_batch_handler(monkeypatch, tmp_path):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+
+    def get_yahoo_json_data(symbol, fields, session):
+        if symbol == "FAIL":
+            raise requests.HTTPError("404 Client Error")
+        if symbol == "EMPTY":
+            return {'timeseries': {'result': []}}
+        return response
+
+    monkeypatch.setattr(app, 'get_yahoo_json_data', get_yahoo_json_data)
+    monkeypatch.setattr(app, 'HISTORY_PATH', str(tmp_path))
+
+    event = [
+        {"yahoo_symbol": "AAPL", "isin": "US0378331005"},
+        {"yahoo_symbol": "FAIL", "isin": "US5949181045"},
+        {"yahoo_symbol": "EMPTY", "isin": "IE00BCRY6557"},
+        {"yahoo_symbol": "MSFT", "isin": "US5949181045"},
+    ]
+    result = app.batch_handler(event)
+
+    assert [r["Ticker"] for r in result["results"]] == ["AAPL", "MSFT"]
+    assert result["results"][0]["Total score"] == 13
+    assert result["results"][0]["Market cap"] == 5E11
+    assert [e["Ticker"] for e in result["errors"]] == ["FAIL", "EMPTY"]
+    assert "HTTPError" in result["errors"][0]["Error"]
+
+    stored = history.read_history(str(tmp_path), columns=["ticker", "total_score", "annualNetIncome"])
+    assert stored.column("ticker").to_pylist() == ["AAPL", "MSFT"]
+    assert stored.column("annualNetIncome").to_pylist()[0] == [-8.2E7, 5.9E7, 5.9E8, 1.3E9]
+
+    # a single part of history per invocation
+    assert len(list(tmp_path.glob("run_date=*/part-*.parquet"))) == 1
+
+
+def test_batch_handler_market_cap_as_score(monkeypatch):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    for result in response['timeseries']['result']:
+        if result['meta']['type'][0] == 'trailingMarketCap':
+            result['trailingMarketCap'][0]['reportedValue']['raw'] = 2 ** 53 + 1
+
+    monkeypatch.setattr(app, 'get_yahoo_json_data', lambda symbol, fields, session=None: response)
+    monkeypatch.setattr(app, 'HISTORY_PATH', None)
+
+    [result] = app.batch_handler([{"yahoo_symbol": "AAPL", "isin": "US0378331005"}])["results"]
+    market_cap = app.score_stock({"yahoo_symbol": "AAPL", "isin": "US0378331005"})["Market cap"]
+
+    # the raw int, not rounded to a float
+    assert result["Market cap"] == market_cap == 2 ** 53 + 1
+    assert type(result["Market cap"]) is int
+
+
+@patch('requests.Session.get')
+def test_batch_handler_lean_parse(mock_get, monkeypatch, tmp_path):
+    with open('100-bagger-stock-screener/tests/assets/yahoo_response.json', 'rb') as f:
+        mock_get.return_value.content = f.read()
+    mock_get.return_value.status_code = 200
+    monkeypatch.setattr(app, 'LEAN_PARSE', True)
+    monkeypatch.setattr(app, 'HISTORY_PATH', str(tmp_path))
+
+    result = app.batch_handler([{"yahoo_symbol": "AAPL", "isin": "US0378331005"}])
+
+    mock_get.return_value.json.assert_not_called()
+    assert result["results"][0]["Total score"] == 13
+    assert result["results"][0]["Market cap"] == 5E11
+
+    stored = history.read_history(str(tmp_path), columns=["annualNetIncome"])
+    assert stored.column("annualNetIncome").to_pylist() == [[-8.2E7, 5.9E7, 5.9E8, 1.3E9]]
+
+
+@pytest.mark.parametrize("lean", [False, True])
+def test_batch_handler_null_points(lean, monkeypatch, tmp_path):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    null_point, null_points = copy.deepcopy(response), copy.deepcopy(response)
+    null_point['timeseries']['result'][0]['annualFreeCashFlow'].append(None)
+    for result in null_points['timeseries']['result']:
+        result[result['meta']['type'][0]] = [None]
+    contents = {"AAPL": response, "NULL": null_point, "NULLS": null_points}
+
+    def get(session, url, **kwargs):
+        fetched = requests.Response()
+        fetched.status_code, fetched._content = 200, json.dumps(contents[url.split("/")[-1]]).encode()
+        return fetched
+
+    cache = failures.FailureCache(str(tmp_path / "failures.db"))
+    monkeypatch.setattr(requests.Session, 'get', get)
+    monkeypatch.setattr(app, 'LEAN_PARSE', lean)
+    monkeypatch.setattr(app, 'HISTORY_PATH', None)
+    monkeypatch.setattr(app, 'FAILURE_CACHE', cache)
+
+    result = app.batch_handler([{"yahoo_symbol": symbol, "isin": symbol} for symbol in contents])
+
+    # null points fail the lean parse as they fail Score.transform_input
+    assert [r["Ticker"] for r in result["results"]] == ["AAPL"]
+    assert [(e["Ticker"], e["Error"].split("(")[0]) for e in result["errors"]] == [
+        ("NULL", "TypeError"), ("NULLS", "TypeError")
+    ]
+    assert cache.failing(now=0) == {("NULL", "NULL"): failures.MISSING_FIELDS, ("NULLS", "NULLS"): failures.EMPTY}
+
+
+@patch('requests.Session.get')
+def test_batch_handler_archives_responses(mock_get, monkeypatch, tmp_path):
+    with open('100-bagger-stock-screener/tests/assets/yahoo_response.json', 'rb') as f:
+        content = f.read()
+    mock_get.return_value.content = content
+    mock_get.return_value.json.return_value = json.loads(content)
+    mock_get.return_value.status_code = 200
+    store = archive.ResponseArchive(str(tmp_path))
+    monkeypatch.setattr(app, 'RESPONSE_ARCHIVE', store)
+
+    app.batch_handler([{"yahoo_symbol": "AAPL", "isin": "US0378331005"}, {"yahoo_symbol": "MSFT", "isin": "US5949181045"}])
+
+    assert store.read("AAPL") == content and store.read("MSFT") == content
+    assert store.totals()["responses"] == 2
+
+
+def test_archive_best_effort(monkeypatch, tmp_path):
+    store = archive.ResponseArchive(str(tmp_path))
+    monkeypatch.setattr(store, "append", lambda symbol, content: 1 / 0)
+    monkeypatch.setattr(app, 'RESPONSE_ARCHIVE', store)
+
+    # failing to archive doesn't fail the fetch
+    app.archive_response("AAPL", b"{}")
+
+
+@patch('requests.Session.get')
+def test_probes_not_archived(mock_get, monkeypatch, tmp_path):
+    with open('100-bagger-stock-screener/tests/assets/yahoo_response.json', 'rb') as f:
+        content = f.read()
+    mock_get.return_value.content = content
+    mock_get.return_value.json.return_value = json.loads(content)
+    mock_get.return_value.status_code = 200
+    store = archive.ResponseArchive(str(tmp_path))
+    monkeypatch.setattr(app, 'RESPONSE_ARCHIVE', store)
+
+    with requests.Session() as session:
+        assert app.symbol_exists("AAPL", session)
+    assert store.totals()["responses"] == 0
+
+
+def test_batch_handler_resolves_symbols(monkeypatch, tmp_path):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    not_found = requests.Response()
+    not_found.status_code = 404
+    fetched, probed = [], []
+
+    def get_yahoo_json_data(symbol, fields, session):
+        fetched.append(symbol)
+        if symbol == "BRKB":
+            raise requests.HTTPError("404 Client Error", response=not_found)
+        if symbol == "ERIC.ST":
+            return {'timeseries': {'result': [{'meta': {'type': ['trailingMarketCap']}, 'timestamp': []}]}}
+        return response
+
+    def symbol_exists(symbol, session):
+        probed.append(symbol)
+        return symbol in {"BRK-B", "ERIC-B.ST"}
+
+    monkeypatch.setattr(app, 'get_yahoo_json_data', get_yahoo_json_data)
+    monkeypatch.setattr(app, 'symbol_exists', symbol_exists)
+    monkeypatch.setattr(app, 'HISTORY_PATH', None)
+    monkeypatch.setattr(app, 'SYMBOL_RESOLVER', symbols.SymbolResolver(str(tmp_path / "symbols.db")))
+
+    event = [
+        {"yahoo_symbol": "AAPL", "isin": "US0378331005"},
+        {"yahoo_symbol": "BRKB", "isin": "US0846707026"},
+        {"yahoo_symbol": "ERIC.ST", "isin": "SE0000108656"},
+    ]
+    result = app.batch_handler(event)
+
+    assert [r["Ticker"] for r in result["results"]] == ["AAPL", "BRK-B", "ERIC-B.ST"]
+    assert result["errors"] == []
+    assert "AAPL" not in probed
+
+    # confirmed symbols are fetched directly by later runs, without probing
+    fetched.clear()
+    probed.clear()
+    app.batch_handler(event)
+    assert fetched == ["AAPL", "BRK-B", "ERIC-B.ST"]
+    assert probed == []
+
+
+def test_batch_handler_records_failures(monkeypatch, tmp_path):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    not_found = requests.Response()
+    not_found.status_code = 404
+
+    def get_yahoo_json_data(symbol, fields, session):
+        if symbol == "GONE":
+            raise requests.HTTPError("404 Client Error", response=not_found)
+        if symbol == "DOWN":
+            raise requests.ConnectionError("connection reset")
+        if symbol == "EMPTY":
+            return {'timeseries': {'result': []}}
+        if symbol == "PART":
+            return {'timeseries': {'result': response['timeseries']['result'][:1]}}
+        return response
+
+    cache = failures.FailureCache(str(tmp_path / "failures.db"))
+    cache.record([("US0378331005", "AAPL", failures.EMPTY)], now=0)
+    monkeypatch.setattr(app, 'get_yahoo_json_data', get_yahoo_json_data)
+    monkeypatch.setattr(app, 'HISTORY_PATH', None)
+    monkeypatch.setattr(app, 'FAILURE_CACHE', cache)
+
+    event = [
+        {"yahoo_symbol": "AAPL", "isin": "US0378331005"},
+        {"yahoo_symbol": "GONE", "isin": "1"},
+        {"yahoo_symbol": "DOWN", "isin": "2"},
+        {"yahoo_symbol": "EMPTY", "isin": "3"},
+        {"yahoo_symbol": "PART", "isin": "4"},
+    ]
+    app.batch_handler(event)
+
+    # succeeding stocks are forgotten, and transient errors not recorded
+    assert cache.failing(now=0) == {
+        ("1", "GONE"): failures.NOT_FOUND,
+        ("3", "EMPTY"): failures.EMPTY,
+        ("4", "PART"): failures.MISSING_FIELDS,
+    }
+
+
+def test_lambda_handler_batch(monkeypatch):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+
+    def get_yahoo_json_data(symbol, fields, session):
+        if symbol == "FAIL":
+            raise requests.HTTPError("404 Client Error")
+        return response
+
+    monkeypatch.setattr(app, 'get_yahoo_json_data', get_yahoo_json_data)
+    monkeypatch.setattr(app, 'HISTORY_PATH', None)
+
+    stocks = [
+        {"yahoo_symbol": "AAPL", "isin": "US0378331005"},
+        {"yahoo_symbol": "FAIL", "isin": "US5949181045"},
+    ]
+
+    # lists & shards from stock_list are batches of stocks, aggregated to the top scoring
+    for event in [stocks, {"cost": 1.0, "stocks": stocks}]:
+        result = app.lambda_handler(event, None)
+        assert [r["Ticker"] for r in result["top"]] == ["AAPL"]
+        assert (result["successes"], result["failures"]) == (1, 1)
+        assert result["histogram"] == {"10": 1}
+        assert "rate" in result["rate_limit"]
+
+
+def test_lambda_handler_manifest(monkeypatch, tmp_path):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    store = blobstore.FileSystemStore(str(tmp_path))
+
+    monkeypatch.setattr(app, 'get_yahoo_json_data', lambda symbol, fields, session: response)
+    monkeypatch.setattr(app, 'HISTORY_PATH', None)
+    monkeypatch.setattr(app, 'RESULTS_STORE', store)
+
+    stocks = [{"yahoo_symbol": f"S{i}", "isin": str(i)} for i in range(30)]
+    shard = {"cost": 15.0, "manifest": blobstore.write_records(store, "stock_list", stocks)}
 
- 
+    result = app.lambda_handler(shard, None)
 
+    assert result["successes"] == 30
+    assert len(result["top"]) == result["k"]
+    assert [r["Ticker"] for r in blobstore.read_records(result["results"])] == [s["yahoo_symbol"] for s in stocks]
+    assert result["errors"]["records"] == 0
@@ -1,3 +1,8 @@
+import collections
+import io
+import json
+import random
+
 import pytest
 import pandas as pd
 
@@ -5,6 +10,7 @@ from pytest import MonkeyPatch
 from unittest.mock import patch, MagicMock, Mock
 
 from functions.stock_list import app
+from screener import blobstore, failures, shared
 
 @pytest.mark.parametrize("value", [
     "US7835132033", 
@@ -180,3 +186,403 @@ def test_shuffle_and_filter_stock_list(Freetrade_records):
 
 
 
+
+
+@pytest.fixture
+def Freetrade_frame(FreetradeModel_valid_input):
+    rows = []
+    for isin in ["IE00BCRY6557", "US7835132034", "", "US783513203X", "US-835132033", "us0378331005", "5", "0"]:
+        for long_title in ["Company", "UCITS ETF", "Gold ETC"]:
+            for isa_eligible in [True, False]:
+                for mic, symbol in [("XLON", "EXAI"), ("XSTO", "LUMB"), ("XETR", "TTR1d"), ("XNAS", "BRK.B")]:
+                    row = dict(FreetradeModel_valid_input)
+                    row.update({
+                        "ISIN": isin, "Long_Title": long_title, "Subtitle": long_title[::-1],
+                        "ISA_eligible": isa_eligible, "MIC": mic, "Symbol": symbol,
+                    })
+                    rows.append(row)
+
+    # rows with unexpected types, validated individually
+    rows[1]["Title"] = None
+    rows[2]["ISIN"] = float("nan")
+    rows[3]["ISA_eligible"] = "not truthy"
+    rows[4]["Subtitle"] = "Ünïcode ETF"
+    rows[5]["Symbol"] = "ÅBC"
+    return pd.DataFrame(rows)
+
+
+def test_validate_stock_frame(Freetrade_frame):
+    result = app.validate_stock_frame(Freetrade_frame)
+
+    for record, row in zip(Freetrade_frame.to_dict(orient="records"), result.to_dict(orient="records")):
+        reason = app.exclusion_reason(record)
+        assert row["reason"] == reason
+
+        if reason is None:
+            model = app.FreetradeModel(**record)
+            assert row["yahoo_symbol"] == model.yahoo_symbol
+            assert row["isin"] == model.isin
+
+    assert result["reason"].isna().sum() == 10
+    assert set(result["reason"].dropna()) == {
+        "ETF stock excluded.",
+        "ETC stock excluded.",
+        "Requires ISA eligibility.",
+        "ISIN is missing.",
+        "ISIN checksum digit incorrect.",
+        "ISIN checksum failure.",
+        app.GENERIC_REASON,
+    }
+
+
+@pytest.mark.parametrize("use_memo", [False, True])
+def test_validate_stock_frame_missing_symbols(tmp_path, use_memo):
+    # as read from the sheet, where "NA" & blank symbols become NaN
+    sheet = (
+        "Title,Long_Title,Subtitle,Currency,ISA_eligible,ISIN,MIC,Symbol,Fractional_Enabled\n"
+        "Apple,Apple Inc,Apple,USD,TRUE,US0378331005,XNAS,AAPL,TRUE\n"
+        "National,National Co,National,USD,TRUE,US5949181045,XNYS,NA,TRUE\n"
+        "Blank,Blank plc,Blank,GBP,TRUE,IE00BCRY6557,XLON,,TRUE\n"
+        "Four,Four plc,Four,GBP,TRUE,IE00BLLZQ912,XLON,FOUR,TRUE\n"
+    )
+    frame = pd.read_csv(io.StringIO(sheet))
+    assert frame["Symbol"].isna().sum() == 2
+
+    memo = app.ValidationMemo(str(tmp_path / "memo.db")) if use_memo else None
+    for _ in range(2 if use_memo else 1):
+        result = app.validate_stock_frame(frame, memo)
+
+        for record, row in zip(frame.to_dict(orient="records"), result.to_dict(orient="records")):
+            stock, reason = app.validate_record(record)
+            assert (row["yahoo_symbol"], row["isin"], row["reason"]) == (
+                (stock["yahoo_symbol"], stock["isin"], None) if stock else (None, None, reason)
+            )
+
+
+def test_validate_stock_frame_filters_off(monkeypatch, Freetrade_frame):
+    monkeypatch.setattr('functions.stock_list.app.REMOVE_ETF', False)
+    monkeypatch.setattr('functions.stock_list.app.ISA_ELIGIBLE', False)
+
+    result = app.validate_stock_frame(Freetrade_frame)
+    expected = [app.exclusion_reason(record) for record in Freetrade_frame.to_dict(orient="records")]
+    assert result["reason"].tolist() == expected
+
+
+def test_shuffle_and_filter_stock_frame(Freetrade_records):
+    frame = pd.DataFrame(Freetrade_records)
+
+    result = app.shuffle_and_filter_stock_frame(frame, sample=1)
+    assert result == [{"yahoo_symbol": "EXAI.L", "isin": "IE00BCRY6557"}]
+
+    assert len(app.shuffle_and_filter_stock_frame(frame, sample=100)) == 5
+    assert len(app.shuffle_and_filter_stock_frame(frame)) == 5
+
+
+def test_diff_stock_frames():
+    old = pd.DataFrame({"ISIN": ["A", "B", "C"], "Title": ["a", "b", "c"], "Subtitle": ["x", None, None]})
+    new = pd.DataFrame({"ISIN": ["B", "C", "D"], "Title": ["b", "c2", "d"], "Subtitle": [None, None, "y"]})
+
+    changes = app.diff_stock_frames(old, new)
+    assert changes["added"]["ISIN"].tolist() == ["D"]
+    assert changes["removed"]["ISIN"].tolist() == ["A"]
+    assert changes["changed"]["ISIN"].tolist() == ["C"]
+    assert changes["changed"]["Title"].tolist() == ["c2"]
+
+
+def mock_response(status_code=200, content=b"", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+@patch("functions.stock_list.app.requests.get")
+def test_sheet_snapshot(get_mock: Mock, tmp_path):
+    snapshot = app.SheetSnapshot(str(tmp_path))
+
+    # first download is parsed & stored
+    get_mock.return_value = mock_response(content=b"ISIN,Title\nA,a\nB,b\n", headers={"ETag": "v1"})
+    df, changed = snapshot.download("url")
+    assert changed
+    assert df["ISIN"].tolist() == ["A", "B"]
+    assert get_mock.call_args.kwargs["headers"] == {}
+
+    # not modified
+    get_mock.return_value = mock_response(status_code=304)
+    df, changed = snapshot.download("url")
+    assert not changed
+    assert df["ISIN"].tolist() == ["A", "B"]
+    assert get_mock.call_args.kwargs["headers"] == {"If-None-Match": "v1"}
+
+    # same content, without conditional request support
+    get_mock.return_value = mock_response(content=b"ISIN,Title\nA,a\nB,b\n")
+    with patch("functions.stock_list.app.pd.read_csv") as read_csv_mock:
+        df, changed = snapshot.download("url")
+    assert not changed
+    read_csv_mock.assert_not_called()
+
+    # changed content
+    get_mock.return_value = mock_response(content=b"ISIN,Title\nB,b2\nC,c\n")
+    df, changed = snapshot.download("url")
+    assert changed
+
+    changes = snapshot.diff()
+    assert changes["added"]["ISIN"].tolist() == ["C"]
+    assert changes["removed"]["ISIN"].tolist() == ["A"]
+    assert changes["changed"]["ISIN"].tolist() == ["B"]
+
+
+@patch("functions.stock_list.app.requests.get")
+def test_lambda_handler_delta(get_mock: Mock, monkeypatch, tmp_path, FreetradeModel_valid_input):
+    monkeypatch.setattr('functions.stock_list.app.SNAPSHOT_DIR', str(tmp_path))
+    csv = pd.DataFrame([FreetradeModel_valid_input]).to_csv(index=False).encode()
+    get_mock.return_value = mock_response(content=csv)
+
+    assert app.lambda_handler({"delta": True}, None) == [{"yahoo_symbol": "EXAI.L", "isin": "IE00BCRY6557"}]
+    assert app.lambda_handler({"delta": True}, None) == []
+    assert len(app.lambda_handler({}, None)) == 1
+
+
+def test_reservoir_sample():
+    rng = random.Random(0)
+
+    assert sorted(app.reservoir_sample(range(10), rng=rng)) == list(range(10))
+    assert len(app.reservoir_sample(range(1000), 5, rng)) == 5
+    assert sorted(app.reservoir_sample(range(3), 5, rng)) == [0, 1, 2]
+
+    # every item is equally likely to be selected
+    counts = collections.Counter()
+    for _ in range(2000):
+        counts.update(app.reservoir_sample(range(10), 3, rng))
+    assert all(500 < counts[i] < 700 for i in range(10))
+
+
+def test_iter_valid_stocks(Freetrade_records):
+    stocks = app.iter_valid_stocks(iter(Freetrade_records))
+    assert next(stocks) == {"yahoo_symbol": "EXAI.L", "isin": "IE00BCRY6557"}
+    assert len(list(stocks)) == 4
+
+
+@patch("functions.stock_list.app.requests.get")
+def test_iter_stock_records(get_mock: Mock, FreetradeModel_valid_input):
+    csv = pd.DataFrame([FreetradeModel_valid_input] * 3).to_csv(index=False).encode()
+    get_mock.return_value.__enter__.return_value.raw = io.BytesIO(csv)
+
+    records = list(app.iter_stock_records("url"))
+    assert len(records) == 3
+    assert records[0]["ISIN"] == "IE00BCRY6557"
+    assert records[0]["ISA_eligible"] == "True"
+
+    result = app.reservoir_sample(app.iter_valid_stocks(records), 2)
+    assert result == [{"yahoo_symbol": "EXAI.L", "isin": "IE00BCRY6557"}] * 2
+
+
+@pytest.mark.parametrize("yahoo_symbol, exchange", [
+    ("AAPL", "US"), ("EXAI.L", "XLON"), ("VOLV-B.ST", "XSTO"), ("SAP.DE", "XETR"), ("BRK.B", "US"),
+])
+def test_exchange_of(yahoo_symbol, exchange):
+    assert app.exchange_of(yahoo_symbol) == exchange
+
+
+def test_plan_shards():
+    records = (
+        [{"yahoo_symbol": f"US{i}", "isin": str(i)} for i in range(25)] +
+        [{"yahoo_symbol": f"UK{i}.L", "isin": str(i)} for i in range(5)]
+    )
+    random.Random(0).shuffle(records)
+    shards = app.plan_shards(records, max_cost=5, costs={"US": 0.5})
+
+    # 16.25s of fetching (12.5s in the US, 3.75s in London) in 4 even shards, exchanges mixed, in order
+    assert len(shards) == 4
+    assert all(shard["cost"] <= 5 for shard in shards)
+    assert max(shard["cost"] for shard in shards) - min(shard["cost"] for shard in shards) <= 0.75
+    assert [stock for shard in shards for stock in shard["stocks"]] == records
+    assert sum(shard["cost"] for shard in shards) == 16.25
+
+    # a stock costing more than a shard still gets one
+    assert [len(shard["stocks"]) for shard in app.plan_shards(records[:2], max_cost=0.1)] == [1, 1]
+    assert app.plan_shards([]) == []
+
+
+def test_shard_cost_within_timeout():
+    records = [{"yahoo_symbol": f"US{i}", "isin": str(i)} for i in range(5000)]
+    largest = max(len(shard["stocks"]) for shard in app.plan_shards(records))
+
+    # a shard fetched at the rate the limiter starts at takes its share of the timeout
+    assert largest / app.ratelimit.RATE <= app.STOCK_DATA_TIMEOUT * app.SHARD_SAFETY_FACTOR
+
+
+@pytest.mark.parametrize("max_cost", [0, -5, float("nan"), None, "fast"])
+def test_plan_shards_invalid_cost(max_cost):
+    records = [{"yahoo_symbol": f"US{i}", "isin": str(i)} for i in range(25)]
+    assert app.plan_shards(records, max_cost=max_cost) == app.plan_shards(records, max_cost=app.SHARD_COST)
+
+
+def test_with_symbol():
+    records = [{"yahoo_symbol": symbol, "isin": str(i)} for i, symbol in enumerate(["AAPL", None, "", ".L", "FOUR.L"])]
+    assert [record["yahoo_symbol"] for record in app.with_symbol(records)] == ["AAPL", "FOUR.L"]
+
+
+@patch("functions.stock_list.app.get_stock_frame")
+def test_lambda_handler_shard_missing_symbol(get_stock_frame_mock: Mock, FreetradeModel_valid_input):
+    # a row with an "NA" symbol, read by pandas as NaN
+    rows = [dict(FreetradeModel_valid_input, MIC=mic, Symbol=symbol) for mic, symbol in [
+        ("XLON", "EXAI"), ("XNYS", "NA"), ("XLON", "NA"),
+    ]]
+    get_stock_frame_mock.return_value = pd.read_csv(io.StringIO(pd.DataFrame(rows).to_csv(index=False)))
+
+    shards = app.lambda_handler({"shard": True}, None)
+    assert [stock["yahoo_symbol"] for shard in shards for stock in shard["stocks"]] == ["EXAI.L"]
+    assert [stock["yahoo_symbol"] for stock in app.lambda_handler({}, None)] == ["EXAI.L"]
+
+
+@patch("functions.stock_list.app.get_stock_frame")
+def test_lambda_handler_shard(get_stock_frame_mock: Mock, Freetrade_frame):
+    get_stock_frame_mock.return_value = Freetrade_frame
+
+    shards = app.lambda_handler({"shard": True}, None)
+    stocks = app.lambda_handler({}, None)
+
+    def key(stock):
+        return stock["yahoo_symbol"], stock["isin"]
+
+    assert sorted(map(key, (stock for shard in shards for stock in shard["stocks"]))) == sorted(map(key, stocks))
+    assert len(shards) == 1 and shards[0]["cost"] == sum(
+        app.FETCH_COST.get(app.exchange_of(stock["yahoo_symbol"]), app.DEFAULT_FETCH_COST) for stock in stocks
+    )
+
+
+@patch("functions.stock_list.app.get_stock_frame")
+def test_lambda_handler_shard_offloaded(get_stock_frame_mock: Mock, monkeypatch, tmp_path, Freetrade_frame):
+    get_stock_frame_mock.return_value = Freetrade_frame
+    monkeypatch.setattr(app, "RESULTS_STORE", blobstore.FileSystemStore(str(tmp_path)))
+
+    shards = app.lambda_handler({"shard": True}, None)
+
+    assert all("stocks" not in shard for shard in shards)
+    stocks = [stock for shard in shards for stock in blobstore.read_records(shard["manifest"])]
+    assert len(stocks) == sum(shard["manifest"]["records"] for shard in shards) == len(app.lambda_handler({}, None))
+
+
+def test_validation_memo(tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = app.ValidationMemo(path)
+
+    assert memo.get("a") is None
+    memo.put("a", ("EXAI.L", "IE00BCRY6557", None))
+    memo.put("b", (None, None, "ISIN checksum failure."))
+    memo.save()
+    assert memo.get("a") == ("EXAI.L", "IE00BCRY6557", None)
+    assert memo.hit_ratio() == 0.5
+
+    # persisted
+    assert app.ValidationMemo(path).get("b") == (None, None, "ISIN checksum failure.")
+
+    # discarded when expired
+    assert app.ValidationMemo(path, max_age=-1).get("b") is None
+
+
+def test_validation_memo_version(monkeypatch, tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = app.ValidationMemo(path)
+    memo.put("a", (None, None, "ETF stock excluded."))
+    memo.save()
+
+    monkeypatch.setattr('functions.stock_list.app.REMOVE_ETF', False)
+    assert app.ValidationMemo(path).get("a") is None
+
+
+def test_validation_memo_shared(tmp_path):
+    state = shared.SharedState(blobstore.FileSystemStore(str(tmp_path / "state")), "validation_memo")
+    memo = app.ValidationMemo(str(tmp_path / "first.db"), state=state)
+    memo.put("a", ("EXAI.L", "IE00BCRY6557", None))
+    memo.save()
+
+    # restored in another container, without the local database of the first
+    memo = app.ValidationMemo(str(tmp_path / "second.db"), state=state)
+    assert memo.get("a") == ("EXAI.L", "IE00BCRY6557", None)
+    memo.put("b", (None, None, "ISIN checksum failure."))
+    memo.save()
+
+    assert sorted(row["key"] for row in state.load()[0]) == ["a", "b"]
+    assert app.ValidationMemo(str(tmp_path / "first.db"), state=state).get("b") == (None, None, "ISIN checksum failure.")
+
+
+def test_memo_from_environment(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "VALIDATION_MEMO_PATH", None)
+    monkeypatch.delenv("STATE_URI", raising=False)
+    assert app.memo_from_environment() is None
+
+    monkeypatch.setenv("STATE_URI", str(tmp_path))
+    assert isinstance(app.memo_from_environment().state, shared.SharedState)
+
+
+def test_record_key(FreetradeModel_valid_input):
+    record = dict(FreetradeModel_valid_input)
+    assert app.record_key(record) == app.record_key(dict(record))
+
+    # irrelevant fields are ignored, but values & types of those validated are not
+    assert app.record_key(dict(record, Other="x")) == app.record_key(record)
+    assert app.record_key(dict(record, ISIN="US0378331005")) != app.record_key(record)
+    assert app.record_key(dict(record, ISA_eligible="True")) != app.record_key(record)
+
+
+def test_validate_stock_frame_memo(Freetrade_frame, tmp_path):
+    memo = app.ValidationMemo(str(tmp_path / "memo.db"))
+    expected = app.validate_stock_frame(Freetrade_frame)
+
+    pd.testing.assert_frame_equal(app.validate_stock_frame(Freetrade_frame, memo), expected)
+    memo.save()
+    # only the rows with unexpected types are validated individually, so memoised
+    assert memo.hits == 0 and 0 < memo.misses < len(Freetrade_frame)
+
+    memo = app.ValidationMemo(memo.path)
+    with patch.object(app, "validate_record") as validate:
+        pd.testing.assert_frame_equal(app.validate_stock_frame(Freetrade_frame, memo), expected)
+    validate.assert_not_called()
+    assert memo.hit_ratio() == 1
+
+    # changed rows are validated again
+    changed = Freetrade_frame.copy()
+    changed.loc[1, "ISIN"] = "US783513203X"
+    assert app.validate_stock_frame(changed, memo).loc[1, "reason"] == "ISIN checksum digit incorrect."
+    assert memo.misses == 1
+
+
+def test_iter_valid_stocks_cached(Freetrade_records, tmp_path):
+    memo = app.ValidationMemo(str(tmp_path / "memo.db"))
+    expected = list(app.iter_valid_stocks(iter(Freetrade_records)))
+
+    assert list(app.iter_valid_stocks(iter(Freetrade_records), memo)) == expected
+    # the valid & invalid record are each validated once
+    assert (memo.hits, memo.misses) == (5, 2)
+
+    memo = app.ValidationMemo(memo.path)
+    with patch.object(app, "validate_record") as validate:
+        assert list(app.iter_valid_stocks(iter(Freetrade_records), memo)) == expected
+    validate.assert_not_called()
+
+
+@patch("functions.stock_list.app.get_stock_frame")
+def test_lambda_handler_skips_failing(get_stock_frame_mock: Mock, monkeypatch, tmp_path, Freetrade_frame):
+    get_stock_frame_mock.return_value = Freetrade_frame
+    stocks = app.lambda_handler({}, None)
+
+    cache = failures.FailureCache(str(tmp_path / "failures.db"))
+    cache.record([(stocks[0]["isin"], stocks[0]["yahoo_symbol"], failures.NOT_FOUND)])
+    monkeypatch.setattr(app, "FAILURE_CACHE", cache)
+    monkeypatch.setattr(app.METRICS, "path", str(tmp_path / "metrics.ndjson"))
+
+    def key(stock):
+        return stock["yahoo_symbol"], stock["isin"]
+
+    # failing stocks are skipped before sampling
+    assert sorted(map(key, app.lambda_handler({}, None))) == sorted(map(key, stocks[1:]))
+    assert len(app.lambda_handler({"sample": len(stocks) - 1}, None)) == len(stocks) - 1
+    with open(tmp_path / "metrics.ndjson") as f:
+        assert [json.loads(line)["StocksSkipped"] for line in f] == [[1], [1]]
+
+    # until they are due to be probed again
+    cache.record([], [key(stocks[0])[::-1]])
+    assert len(app.lambda_handler({}, None)) == len(stocks)
@@ -0,0 +1,108 @@
+import pytest
+
+from screener import blobstore, shared, symbols
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    return symbols.SymbolResolver(str(tmp_path / "symbols.db"))
+
+
+@pytest.mark.parametrize("symbol, base, suffix", [
+    ("EXAI.L", "EXAI", ".L"),
+    ("VOLV-B.ST", "VOLV-B", ".ST"),
+    ("AAPL", "AAPL", ""),
+    (".L", ".L", ""),
+])
+def test_split_suffix(symbol, base, suffix):
+    assert symbols.split_suffix(symbol) == (base, suffix)
+
+
+@pytest.mark.parametrize("symbol, expected", [
+    ("BRKB", ["BRK-B", "BRK.B", "BRK"]),
+    ("VOLV-B.ST", ["VOLV.B.ST", "VOLVB.ST", "VOLV.ST"]),
+    ("ERIC.ST", ["ERIC-A.ST", "ERIC-B.ST"]),
+    ("TTR1.DE", ["TTR1-A.DE", "TTR1-B.DE", "TTR1.F", "TTR1-A.F", "TTR1-B.F"]),
+])
+def test_variants(symbol, expected):
+    assert symbols.variants(symbol) == expected
+
+
+def test_variants_limited():
+    assert len(symbols.variants("BT-A.L", max_variants=3)) == 3
+    assert "BT-A.IL" in symbols.variants("BT-A.L")
+
+
+def test_resolve(resolver):
+    probed = []
+
+    def probe(symbol):
+        probed.append(symbol)
+        if symbol == "ERIC-A.ST":
+            raise OSError("connection reset")
+        return symbol in {"ERIC-B.ST", "BRK-B", "BRK.B"}
+
+    stocks = [("SE0000108656", "ERIC.ST", "ERIC.ST"), ("US0846707026", "BRKB", "BRKB"), ("X", "NONE", "NONE")]
+    assert resolver.resolve(stocks, probe) == ["ERIC-B.ST", "BRK-B", None]
+
+    # only variants are probed, each once
+    assert "ERIC.ST" not in probed and len(probed) == len(set(probed))
+    assert resolver.stats == {"probes": len(probed), "resolved": 2, "unresolved": 1}
+
+    assert resolver.symbol("SE0000108656", "ERIC.ST") == "ERIC-B.ST"
+    assert resolver.symbol("X", "NONE") == "NONE"
+
+
+def test_confirmed_persisted(tmp_path):
+    symbols.SymbolResolver(str(tmp_path / "symbols.db")).put("US0846707026", "BRKB", "BRK-B")
+
+    reopened = symbols.SymbolResolver(str(tmp_path / "symbols.db"))
+    assert reopened.symbol("US0846707026", "BRKB") == "BRK-B"
+    # a new guess is tried before the symbol confirmed for the old one
+    assert reopened.symbol("US0846707026", "BRK.B") == "BRK.B"
+
+
+def test_resolve_confirmed_failing(resolver):
+    resolver.put("US0846707026", "BRKB", "BRK-B")
+
+    # the guess is probed again when the confirmed symbol fails, and forgotten if nothing is found
+    assert resolver.resolve([("US0846707026", "BRKB", "BRK-B")], lambda symbol: symbol == "BRKB") == ["BRKB"]
+    assert resolver.resolve([("US0846707026", "BRKB", "BRKB")], lambda symbol: False) == [None]
+    assert resolver.get("US0846707026", "BRKB") is None
+
+
+def test_shared(tmp_path):
+    state = shared.SharedState(blobstore.FileSystemStore(str(tmp_path / "state")), "symbols")
+
+    # concurrent invocations of stock_data, each with a local database of its own
+    first = symbols.SymbolResolver(str(tmp_path / "first.db"), state=state)
+    second = symbols.SymbolResolver(str(tmp_path / "second.db"), state=state)
+    first.resolve([("US0846707026", "BRKB", "BRKB")], lambda symbol: symbol == "BRK-B")
+    second.resolve([("SE0000108656", "ERIC.ST", "ERIC.ST")], lambda symbol: symbol == "ERIC-B.ST")
+    assert second.symbol("US0846707026", "BRKB") == "BRKB"
+
+    second.sync()
+    assert second.symbol("US0846707026", "BRKB") == "BRK-B"
+
+    # compacted by stock_list, then forgotten by a later invocation
+    symbols.SymbolResolver(str(tmp_path / "list.db"), state=state).sync(compact=True)
+    assert len(state.load()[0]) == 2 and state.load()[2] == []
+    first.sync()
+    first.resolve([("US0846707026", "BRKB", "BRK-B")], lambda symbol: False)
+
+    reader = symbols.SymbolResolver(str(tmp_path / "reader.db"), state=state)
+    reader.sync()
+    assert reader.symbol("US0846707026", "BRKB") == "BRKB"
+    assert reader.symbol("SE0000108656", "ERIC.ST") == "ERIC-B.ST"
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("SYMBOL_MAP_PATH", raising=False)
+    monkeypatch.delenv("STATE_URI", raising=False)
+    assert symbols.from_environment() is None
+
+    monkeypatch.setenv("SYMBOL_MAP_PATH", str(tmp_path / "symbols.db"))
+    assert symbols.from_environment().state is None
+
+    monkeypatch.setenv("STATE_URI", str(tmp_path / "state"))
+    assert isinstance(symbols.from_environment().state, shared.SharedState)
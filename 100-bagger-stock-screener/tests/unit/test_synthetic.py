@@ -0,0 +1,36 @@
+import pytest
+
+from functions.stock_data import app as stock_data
+from functions.stock_list import app as stock_list
+from local import synthetic
+
+
+def test_isin_check_digit():
+    for isin in ["US7835132033", "NL0011585146", "IE00BLLZQ912", "IE00BCRY6557"]:
+        assert synthetic.isin_check_digit(isin[:-1]) == isin[-1]
+
+
+def test_synthetic_freetrade_sheet():
+    sheet = synthetic.synthetic_freetrade_sheet(2_000, seed=1)
+    assert len(sheet) == 2_000
+    assert sheet.equals(synthetic.synthetic_freetrade_sheet(2_000, seed=1))
+
+    reasons = stock_list.validate_stock_frame(sheet)["reason"]
+    assert set(reasons.dropna()) == {
+        "ETF stock excluded.",
+        "ETC stock excluded.",
+        "Requires ISA eligibility.",
+        "ISIN checksum failure.",
+    }
+    assert 0.6 < reasons.isna().mean() < 0.8
+
+
+@pytest.mark.parametrize("years", [1, 4, 40])
+def test_synthetic_yahoo_response(years):
+    response = synthetic.synthetic_yahoo_response("AAPL", years=years)
+    data = stock_data.Score.transform_input(response)
+
+    assert set(data) == set(stock_data.FIELDS)
+    assert len(data["annualNetIncome"]) == years
+    assert len(data["trailingMarketCap"]) == 1
+    assert response == synthetic.synthetic_yahoo_response("AAPL", years=years)
@@ -0,0 +1,137 @@
+import copy
+import json
+
+import pytest
+
+from functions.stock_data import app as stock_data
+from local import synthetic
+from screener import timeseries
+
+
+def load_params_from_json(json_path):
+    with open(json_path) as f:
+        return json.load(f)
+
+
+def yahoo_response(field, points):
+    return {
+        "timeseries": {
+            "result": [{
+                "meta": {"symbol": ["XXXX"], "type": [field]},
+                "timestamp": [timeseries.date_to_timestamp(date) for date, _ in points],
+                field: [{"asOfDate": date, "reportedValue": {"raw": value}} for date, value in points],
+            }]
+        }
+    }
+
+
+def values(response, field):
+    for result in response["timeseries"]["result"]:
+        if result["meta"]["type"][0] == field:
+            return [point["reportedValue"]["raw"] for point in result[field]]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return timeseries.TimeseriesStore(str(tmp_path / "timeseries.db"))
+
+
+def test_date_to_timestamp():
+    assert timeseries.date_to_timestamp("2022-01-01") == 1640995200
+
+
+def test_latest(store):
+    assert store.latest("XXXX", ["annualNetIncome"]) is None
+
+    store.merge("XXXX", yahoo_response("annualNetIncome", [("2020-12-31", 1), ("2021-12-31", 2)]))
+    store.merge("XXXX", yahoo_response("trailingMarketCap", [("2021-06-30", 5)]))
+
+    assert store.latest("XXXX", ["annualNetIncome"]) == timeseries.date_to_timestamp("2021-12-31")
+    assert store.latest("XXXX", ["annualNetIncome", "trailingMarketCap"]) == (
+        timeseries.date_to_timestamp("2021-06-30")
+    )
+    assert store.latest("XXXX", ["annualNetIncome", "annualTotalRevenue"]) is None
+    assert store.latest("YYYY", ["annualNetIncome"]) is None
+
+
+def test_merge(store):
+    store.merge("XXXX", yahoo_response("annualNetIncome", [("2020-12-31", 1), ("2021-12-31", 2)]))
+    store.merge("XXXX", yahoo_response("annualNetIncome", [("2021-12-31", 3), ("2022-12-31", 4)]))
+    assert values(store.response("XXXX", ["annualNetIncome"]), "annualNetIncome") == [1, 3, 4]
+
+    # only the latest point of point-in-time fields is current, with earlier points kept as history
+    store.merge("XXXX", yahoo_response("trailingMarketCap", [("2021-06-30", 5)]))
+    store.merge("XXXX", yahoo_response("trailingMarketCap", [("2022-06-30", 6)]))
+    store.merge("XXXX", yahoo_response("trailingMarketCap", []))
+    assert values(store.response("XXXX", ["trailingMarketCap"]), "trailingMarketCap") == [6]
+    assert [value for *_, value in store.points(["trailingMarketCap"])] == [5, 6]
+
+
+def test_update(store):
+    response = load_params_from_json('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+    fields = [result["meta"]["type"][0] for result in response["timeseries"]["result"]]
+    requested = []
+
+    def download(since):
+        requested.append(since)
+        return response if since is None else yahoo_response("annualNetIncome", [("2023-12-31", 2E9)])
+
+    first = store.update("XXXX", fields, download)
+    for field in fields:
+        assert values(first, field) == values(response, field)
+
+    # the oldest annual point drops out of the window a fresh fetch would return
+    second = store.update("XXXX", fields, download)
+    assert values(second, "annualNetIncome") == [5.9E7, 5.9E8, 1.3E9, 2E9]
+    assert requested == [None, timeseries.date_to_timestamp("2022-09-02") + 1]
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("TIMESERIES_STORE_PATH", raising=False)
+    assert timeseries.from_environment() is None
+
+    monkeypatch.setenv("TIMESERIES_STORE_PATH", str(tmp_path / "timeseries.db"))
+    assert isinstance(timeseries.from_environment(), timeseries.TimeseriesStore)
+
+
+def test_symbols(store):
+    assert store.symbols() == []
+
+    store.merge("YYYY", yahoo_response("annualNetIncome", [("2020-12-31", 1)]))
+    store.merge("XXXX", yahoo_response("annualNetIncome", [("2020-12-31", 1), ("2021-12-31", 2)]))
+    assert store.symbols() == ["XXXX", "YYYY"]
+
+
+def test_points(store):
+    store.merge("YYYY", yahoo_response("annualNetIncome", [("2021-12-31", 3), ("2020-12-31", 1)]))
+    store.merge("XXXX", yahoo_response("annualTotalRevenue", [("2020-12-31", 2)]))
+
+    assert list(store.points(["annualNetIncome"])) == [
+        ("YYYY", "annualNetIncome", timeseries.date_to_timestamp("2020-12-31"), 1),
+        ("YYYY", "annualNetIncome", timeseries.date_to_timestamp("2021-12-31"), 3),
+    ]
+    assert len(list(store.points(["annualNetIncome", "annualTotalRevenue"]))) == 3
+
+
+def test_merged_scores_as_fresh(store):
+    # 8 years of points, of which each yearly run fetches the last 4 annual & the latest trailing point
+    history = synthetic.synthetic_yahoo_response("XXXX", years=8, trailing_points=8)
+
+    def fetch(year):
+        response = copy.deepcopy(history)
+        for result in response["timeseries"]["result"]:
+            field = result["meta"]["type"][0]
+            window = slice(year, year + 1) if field.startswith("trailing") else slice(max(0, year - 3), year + 1)
+            result[field], result["timestamp"] = result[field][window], result["timestamp"][window]
+        return response
+
+    for year in range(8):
+        fresh = fetch(year)
+        store.merge("XXXX", fresh)
+        merged = store.response("XXXX", stock_data.FIELDS)
+
+        assert stock_data.Score.transform_input(merged) == stock_data.Score.transform_input(fresh)
+        assert stock_data.Score(merged).get_total_score() == stock_data.Score(fresh).get_total_score()
+
+    assert len(values(merged, "annualNetIncome")) == timeseries.ANNUAL_POINTS
+    assert len([point for point in store.points(["annualNetIncome"])]) == 8
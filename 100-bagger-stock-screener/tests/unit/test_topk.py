@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from screener import topk
+
+
+def records(scores, prefix="S"):
+    return [{"Ticker": f"{prefix}{i}", "Total score": score} for i, score in enumerate(scores)]
+
+
+def test_top():
+    aggregate = topk.TopK(k=3).update(records([5, 50, 20, 80, 20, 1]), [{"Error": "HTTPError"}])
+
+    assert [r["Total score"] for r in aggregate.top()] == [80, 50, 20]
+    assert aggregate.top()[2]["Ticker"] == "S2"  # ties keep the first seen
+    assert (aggregate.successes, aggregate.failures) == (6, 1)
+    assert aggregate.histogram == {0: 2, 20: 2, 50: 1, 80: 1}
+    assert aggregate.reasons == {"HTTPError": 1}
+
+
+def test_fewer_than_k():
+    aggregate = topk.TopK(k=10).update(records([1, 2]))
+    assert [r["Total score"] for r in aggregate.top()] == [2, 1]
+    assert topk.TopK().top() == []
+
+
+@pytest.mark.parametrize("shards", [1, 3, 10])
+def test_merge_matches_single_pass(shards):
+    rng = random.Random(shards)
+    all_records = records([rng.randint(0, 140) for _ in range(500)])
+
+    expected = topk.TopK(k=20).update(all_records)
+
+    merged = topk.TopK(k=20)
+    for i in range(shards):
+        shard = topk.TopK(k=20).update(all_records[i::shards])
+        merged.merge(topk.TopK.from_dict(shard.to_dict()))
+
+    assert [r["Total score"] for r in merged.top()] == [r["Total score"] for r in expected.top()]
+    assert merged.successes == 500
+    assert merged.histogram == expected.histogram
+
+
+def test_to_dict_round_trip():
+    aggregate = topk.TopK(k=2).update(records([3, 12, 7]), [{}, {}])
+    data = aggregate.to_dict()
+
+    assert data == {
+        "k": 2,
+        "top": [{"Ticker": "S1", "Total score": 12}, {"Ticker": "S2", "Total score": 7}],
+        "successes": 3,
+        "failures": 2,
+        "histogram": {"0": 2, "10": 1},
+        "reasons": {"unknown": 2},
+    }
+    assert topk.TopK.from_dict(data).to_dict() == data
+
+
+@pytest.mark.parametrize("error, reason", [
+    ({"Ticker": "X", "ISIN": "X", "Error": "HTTPError('404 Client Error')"}, "HTTPError"),
+    ({"Ticker": "X", "ISIN": "X", "Error": "Missing fields"}, "Missing fields"),
+    ({"shard": 0, "count": 2, "error": {"Error": "States.Timeout", "Cause": ""}}, "States.Timeout"),
+    ({}, topk.UNKNOWN_REASON),
+    (None, topk.UNKNOWN_REASON),
+])
+def test_error_reason(error, reason):
+    assert topk.error_reason(error) == reason
+
+
+def test_errors_bounded(monkeypatch):
+    monkeypatch.setattr(topk, "MAX_REASONS", 2)
+    errors = [{"Error": f"E{i % 4}()"} for i in range(8)]
+
+    aggregate = topk.TopK().update(errors=errors)
+    assert aggregate.reasons == {"E0": 2, "E1": 2, topk.OTHER_REASON: 4}
+
+    merged = topk.TopK().update(errors=[{"Error": "E9()"}]).merge(topk.TopK.from_dict(aggregate.to_dict()))
+    assert merged.reasons == {"E9": 1, "E0": 2, topk.OTHER_REASON: 6}
+    assert merged.failures == 9
@@ -0,0 +1,112 @@
+import json
+
+import numpy as np
+import pytest
+
+from functions.stock_data import app as stock_data
+from screener import timeseries, yahoo
+
+
+def load_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def content():
+    return load_bytes('100-bagger-stock-screener/tests/assets/yahoo_response.json')
+
+
+def values(response):
+    return {
+        result['meta']['type'][0]: [point['reportedValue']['raw'] for point in result[result['meta']['type'][0]]]
+        for result in response['timeseries']['result']
+    }
+
+
+def test_scan(content):
+    parsed = yahoo.scan(content)
+
+    assert {field: list(series) for field, series in parsed.data().items()} == values(json.loads(content))
+    assert parsed.values.typecode == "d" and parsed.timestamps.dtype == np.int64
+
+    timestamps, series = parsed.field("annualFreeCashFlow")
+    assert timestamps[0] == timeseries.date_to_timestamp("2019-12-31")
+    assert series.tolist() == [10E8, 3E9, 4.5E9, 7.5E9]
+    assert [len(a) for a in parsed.field("unknown")] == [0, 0]
+
+
+def test_scan_compact_matches_from_json(content):
+    response = json.loads(content)
+    compact = json.dumps(response, separators=(",", ":")).encode()
+
+    scanned, decoded = yahoo.scan(compact), yahoo.Timeseries.from_json(response)
+    assert scanned.fields == decoded.fields
+    assert scanned.offsets == decoded.offsets
+    assert scanned.dates == decoded.dates
+    assert scanned.values == decoded.values
+
+
+def result(field, points, meta_first=True):
+    items = [("meta", {"symbol": ["XXXX"], "type": [field]}), (field, points)]
+    return dict(items if meta_first else items[::-1])
+
+
+def point(date, value):
+    return {"asOfDate": date, "periodType": "12M", "reportedValue": {"raw": value, "fmt": str(value)}}
+
+
+NULL_POINTS = [
+    [result("annualA", [None, point("2021-12-31", -1.5e-3)]), result("annualB", [])],
+    [result("annualA", [point("2021-12-31", 1)]), result("annualB", [point("2021-12-31", 2), None])],
+    [result("annualA", [point("2021-12-31", 1)]), result("annualB", None)],
+    [result("annualA", [None, None])],
+]
+
+
+@pytest.mark.parametrize("results", [
+    # fields before meta, points without a value, null points & fields missing are decoded instead
+    [result("annualA", [point("2021-12-31", 1)]), result("annualB", [point("2021-12-31", 2)], meta_first=False)],
+    [result("annualA", [point("2021-12-31", 1), {"asOfDate": "2022-12-31"}])],
+    *NULL_POINTS,
+    [result("annualA", [point("2021-12-31", 1)]), {"meta": {"symbol": ["XXXX"], "type": ["annualB"]}}],
+])
+@pytest.mark.parametrize("compact", [False, True])
+def test_scan_as_transform_input(results, compact):
+    response = {"timeseries": {"result": results, "error": None}}
+    content = json.dumps(response, separators=(",", ":") if compact else None).encode()
+
+    try:
+        expected = stock_data.Score.transform_input(response)
+    except (KeyError, TypeError) as e:
+        # what the standard path fails on, the lean one fails on alike
+        with pytest.raises(type(e)):
+            yahoo.scan(content).data()
+        return
+
+    parsed = yahoo.scan(content).data()
+    assert {field: list(series) for field, series in parsed.items()} == expected
+
+
+@pytest.mark.parametrize("results, points", list(zip(NULL_POINTS, [1, 2, 1, 0])))
+def test_scan_null_points_not_counted(results, points):
+    parsed = yahoo.scan(json.dumps({"timeseries": {"result": results, "error": None}}).encode())
+
+    # null points fail data(), but aren't counted as points (so a response of only nulls is empty)
+    assert len(parsed) == points
+    assert isinstance(parsed.invalid, TypeError)
+
+
+def test_scan_no_results():
+    parsed = yahoo.scan(b'{"timeseries":{"result":null,"error":{"code":"Not Found"}}}')
+    assert len(parsed) == 0 and parsed.data() == {}
+
+
+def test_scan_without_decoding(monkeypatch, content):
+    monkeypatch.setattr(yahoo.json, "loads", None)
+    assert len(yahoo.scan(content)) == 15
+
+
+def test_scan_date_outside_points():
+    response = {"timeseries": {"result": [result("annualA", [point("2021-12-31", 1)])], "asOfDate": "2022-01-01"}}
+    assert list(yahoo.scan(json.dumps(response).encode()).data()["annualA"]) == [1]